@@ -0,0 +1 @@
+"""Offline stand-in for the Demucs package (only `python3 -m demucs` is provided)."""
@@ -0,0 +1,75 @@
+"""Offline stand-in for `python3 -m demucs` (see fakeaudio.py for the knobs)."""
+import os
+import sys
+import time
+
+from fakeaudio import env_float, read_duration, write_audio, record, sleep_with_progress
+
+
+def parse_args(argv):
+    options = {'out': 'separated', 'name': 'htdemucs', 'ext': 'wav', 'two_stems': None,
+               'filename': '{track}/{stem}.{ext}', 'tracks': []}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ('-o', '--out'):
+            options['out'] = argv[i + 1]
+            i += 2
+        elif arg in ('-n', '--name'):
+            options['name'] = argv[i + 1]
+            i += 2
+        elif arg == '--two-stems':
+            options['two_stems'] = argv[i + 1]
+            i += 2
+        elif arg == '--filename':
+            options['filename'] = argv[i + 1]
+            i += 2
+        elif arg in ('-j', '--jobs', '--shifts', '--overlap', '--segment', '-d', '--device', '--mp3-bitrate'):
+            i += 2
+        elif arg in ('--mp3', '--flac'):
+            options['ext'] = arg[2:]
+            i += 1
+        elif arg.startswith('-'):
+            i += 1
+        else:
+            options['tracks'].append(arg)
+            i += 1
+    return options
+
+
+def main():
+    options = parse_args(sys.argv[1:])
+    start = time.time()
+
+    # Imports and model load
+    time.sleep(env_float('BENCH_DEMUCS_STARTUP', 1.0))
+    model = bytearray(int(env_float('BENCH_DEMUCS_MB', 200) * 1024 * 1024))
+    for offset in range(0, len(model), 4096):
+        model[offset] = 1
+    loaded = time.time()
+    record('demucs', 'model_load', start, loaded)
+
+    stems = [options['two_stems'], f"no_{options['two_stems']}"] if options['two_stems'] else ['drums', 'bass', 'other', 'vocals']
+    for track_path in options['tracks']:
+        track_start = time.time()
+        duration = read_duration(track_path)
+        if not os.path.exists(track_path):
+            print(f'Could not load file {track_path}', file=sys.stderr)
+            return 1
+        track = os.path.splitext(os.path.basename(track_path))[0]
+        print(f'Separating track {track_path}', flush=True)
+        sleep_with_progress(duration * env_float('BENCH_DEMUCS_RTF', 0.01), 10, lambda f: print(
+            f'{f * 100:3.0f}%|{"#" * int(f * 20):<20}| {f * duration:.1f}/{duration:.1f} [00:00<00:00, 1.00seconds/s]',
+            file=sys.stderr, flush=True))
+        for stem in stems:
+            name = options['filename'].format(track=track, trackext=os.path.splitext(track_path)[1][1:],
+                                              stem=stem, ext=options['ext'])
+            write_audio(os.path.join(options['out'], options['name'], name), duration)
+        record('demucs', 'separate', track_start, time.time(), duration=duration)
+
+    record('demucs', 'process', start, time.time(), tracks=len(options['tracks']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
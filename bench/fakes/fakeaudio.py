@@ -0,0 +1,79 @@
+"""
+Shared helpers for the offline stand-ins of yt-dlp, Demucs, ffmpeg and ffprobe.
+
+Synthetic audio files start with a one-line header carrying their duration,
+followed by filler bytes sized like a 320 kbps MP3, so file sizes, copies and
+hashes behave realistically without a real codec.
+
+Behaviour is configured through environment variables (set by run_bench.py):
+    BENCH_EVENTS_FILE       JSON lines file every tool appends its timings to
+    BENCH_VIDEO_SECONDS     Duration of every synthetic video (default: 180)
+    BENCH_PLAYLIST_SIZE     Entries returned for a playlist URL (default: 10)
+    BENCH_DOWNLOAD_SECONDS  Latency of a download (default: 0.5)
+    BENCH_TRANSCODE_RTF     Transcode seconds per second of audio (default: 0.001)
+    BENCH_DEMUCS_RTF        Separation seconds per second of audio (default: 0.01)
+    BENCH_DEMUCS_STARTUP    Demucs startup (imports + model load) seconds (default: 1.0)
+    BENCH_DEMUCS_MB         Memory a Demucs process holds while separating (default: 200)
+    BENCH_CHAPTERS          Chapters of every synthetic video (default: 4)
+    BENCH_COMMENTS          Comments before the tracklist comment (default: 1)
+    BENCH_COMMENT_SECONDS   Latency of fetching one comment (default: 0.0001)
+"""
+import os
+import json
+import time
+import fcntl
+
+HEADER_PREFIX = b'FAKEAUDIO '
+BYTES_PER_SECOND = 320 * 1000 // 8
+# Decoded PCM rate used when a stand-in has to emit samples
+PCM_BYTES_PER_SECOND = 44100 * 2 * 2
+
+
+def env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def write_audio(path: str, duration: float):
+    """Write a synthetic audio file of the given duration."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    header = HEADER_PREFIX + json.dumps({'duration': duration}).encode() + b'\n'
+    remaining = int(duration * BYTES_PER_SECOND)
+    block = (os.path.basename(path).encode() or b'x') * 4096
+    with open(path, 'wb') as f:
+        f.write(header)
+        while remaining > 0:
+            chunk = block[:min(remaining, len(block))]
+            f.write(chunk)
+            remaining -= len(chunk)
+
+
+def read_duration(path: str) -> float:
+    """Duration of a synthetic audio file (0 if it isn't one)."""
+    try:
+        with open(path, 'rb') as f:
+            line = f.readline()
+    except OSError:
+        return 0.0
+    if not line.startswith(HEADER_PREFIX):
+        return 0.0
+    return float(json.loads(line[len(HEADER_PREFIX):])['duration'])
+
+
+def record(tool: str, stage: str, start: float, end: float, **fields):
+    """Append a timing event for the benchmark driver."""
+    events_file = os.environ.get('BENCH_EVENTS_FILE')
+    if not events_file:
+        return
+    event = {'tool': tool, 'stage': stage, 'start': start, 'end': end, 'pid': os.getpid(), **fields}
+    with open(events_file, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(json.dumps(event) + '\n')
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def sleep_with_progress(seconds: float, steps: int, report):
+    """Sleep for `seconds`, calling report(fraction) `steps` times along the way."""
+    steps = max(1, steps)
+    for i in range(1, steps + 1):
+        time.sleep(seconds / steps)
+        report(i / steps)
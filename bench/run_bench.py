@@ -0,0 +1,251 @@
+"""
+Offline benchmark for the yt-spleet batch pipeline.
+
+Runs `src/main.py` against local stand-ins for yt-dlp, Demucs, ffmpeg/ffprobe
+(bench/fakes) and the oEmbed endpoint, across batch sizes and worker counts,
+and records throughput, per-stage latency percentiles and peak RSS as JSON so
+results can be compared between commits.
+
+Usage:
+    python bench/run_bench.py --batch-sizes 1 8 32 --separate-workers 1 2
+    python bench/run_bench.py --compare bench/results/OLD.json bench/results/NEW.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import platform
+import subprocess
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FAKES_DIR = os.path.join(BENCH_DIR, 'fakes')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+
+class OEmbedHandler(BaseHTTPRequestHandler):
+    """Local stand-in for https://www.youtube.com/oembed."""
+
+    # Keep-alive, like the real endpoint
+    protocol_version = 'HTTP/1.1'
+    latency = 0.05
+    requests = 0
+    connections = 0
+
+    def setup(self):
+        OEmbedHandler.connections += 1
+        super().setup()
+
+    def do_GET(self):
+        OEmbedHandler.requests += 1
+        time.sleep(self.latency)
+        video_url = parse_qs(urlparse(self.path).query).get('url', [''])[0]
+        video_id = parse_qs(urlparse(video_url).query).get('v', ['unknown'])[0]
+        body = json.dumps({'title': f'Bench Video {video_id}'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_oembed_server(latency: float) -> ThreadingHTTPServer:
+    OEmbedHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), OEmbedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize_stages(events_file: str) -> dict:
+    """Latency percentiles per (tool, stage) from the stand-ins' event log."""
+    durations: dict[str, list[float]] = {}
+    if os.path.exists(events_file):
+        with open(events_file) as f:
+            for line in f:
+                event = json.loads(line)
+                durations.setdefault(f"{event['tool']}:{event['stage']}", []).append(event['end'] - event['start'])
+    return {
+        stage: {
+            'count': len(values),
+            'mean': sum(values) / len(values),
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'p99': percentile(values, 99),
+            'max': max(values),
+        }
+        for stage, values in sorted(durations.items())
+    }
+
+
+def run_once(batch_size: int, download_workers: int, separate_workers: int, args, oembed_url: str) -> dict:
+    work_dir = tempfile.mkdtemp(prefix='yts-bench-')
+    try:
+        output_folder = os.path.join(work_dir, 'output')
+        events_file = os.path.join(work_dir, 'events.jsonl')
+        urls = [f'https://www.youtube.com/watch?v=bench{i:05d}' for i in range(batch_size)]
+
+        env = dict(os.environ)
+        env.update({
+            'PATH': FAKES_DIR + os.pathsep + env.get('PATH', ''),
+            'PYTHONPATH': os.pathsep.join([FAKES_DIR, REPO_DIR]),
+            'YTSPLEET_OEMBED_URL': oembed_url,
+            'YTSPLEET_CACHE_FOLDER': os.path.join(work_dir, 'cache'),
+            'BENCH_EVENTS_FILE': events_file,
+            'BENCH_VIDEO_SECONDS': str(args.video_seconds),
+            'BENCH_DOWNLOAD_SECONDS': str(args.download_seconds),
+            'BENCH_DEMUCS_RTF': str(args.demucs_rtf),
+            'BENCH_DEMUCS_STARTUP': str(args.demucs_startup),
+            'BENCH_DEMUCS_MB': str(args.demucs_mb),
+        })
+        cmd = [
+            sys.executable, os.path.join(REPO_DIR, 'src', 'main.py'),
+            '--urls', *urls,
+            '-o', output_folder,
+            '--download-workers', str(download_workers),
+            '--separate-workers', str(separate_workers),
+            *args.main_args,
+        ]
+
+        OEmbedHandler.requests = OEmbedHandler.connections = 0
+        start = time.time()
+        with open(os.path.join(work_dir, 'main.log'), 'w') as log_file:
+            process = subprocess.Popen(cmd, env=env, cwd=REPO_DIR, stdout=log_file, stderr=subprocess.STDOUT)
+            # wait4 reports the peak RSS of the largest process in the run's tree
+            _, status, rusage = os.wait4(process.pid, 0)
+        wall = time.time() - start
+        exit_code = os.waitstatus_to_exitcode(status)
+        if exit_code != 0 and args.verbose:
+            with open(os.path.join(work_dir, 'main.log')) as f:
+                print(f.read())
+
+        return {
+            'batch_size': batch_size,
+            'download_workers': download_workers,
+            'separate_workers': separate_workers,
+            'exit_code': exit_code,
+            'wall_seconds': wall,
+            'videos_per_hour': batch_size / wall * 3600,
+            'peak_rss_mb': rusage.ru_maxrss / 1024,
+            'oembed_requests': OEmbedHandler.requests,
+            'oembed_connections': OEmbedHandler.connections,
+            'stages': summarize_stages(events_file),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_key(run: dict) -> tuple:
+    return run['batch_size'], run['download_workers'], run['separate_workers']
+
+
+def print_runs(runs: list[dict], header: bool = True):
+    if header:
+        print(f"{'batch':>6} {'dl':>3} {'sep':>3} {'wall s':>8} {'videos/h':>10} {'rss MB':>8}  slowest stage p90")
+    for run in runs:
+        slowest = max(run['stages'].items(), key=lambda item: item[1]['p90'], default=('-', {'p90': 0}))
+        print(f"{run['batch_size']:>6} {run['download_workers']:>3} {run['separate_workers']:>3} "
+              f"{run['wall_seconds']:>8.2f} {run['videos_per_hour']:>10.0f} {run['peak_rss_mb']:>8.1f}  "
+              f"{slowest[0]} {slowest[1]['p90']:.3f}s" + ('' if run['exit_code'] == 0 else f"  (exit {run['exit_code']})"))
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_runs = {run_key(run): run for run in old['runs']}
+    print(f"{old['commit']} -> {new['commit']}")
+    print(f"{'batch':>6} {'dl':>3} {'sep':>3} {'old v/h':>10} {'new v/h':>10} {'change':>8} {'old MB':>8} {'new MB':>8}")
+    for run in new['runs']:
+        previous: Optional[dict] = old_runs.get(run_key(run))
+        if previous is None:
+            continue
+        change = (run['videos_per_hour'] / previous['videos_per_hour'] - 1) * 100
+        print(f"{run['batch_size']:>6} {run['download_workers']:>3} {run['separate_workers']:>3} "
+              f"{previous['videos_per_hour']:>10.0f} {run['videos_per_hour']:>10.0f} {change:>+7.1f}% "
+              f"{previous['peak_rss_mb']:>8.1f} {run['peak_rss_mb']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--download-workers', type=int, nargs='+', default=[4])
+    parser.add_argument('--separate-workers', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--video-seconds', type=float, default=180, help='Duration of every synthetic video')
+    parser.add_argument('--download-seconds', type=float, default=0.5, help='Latency of each fake download')
+    parser.add_argument('--oembed-seconds', type=float, default=0.05, help='Latency of each fake title lookup')
+    parser.add_argument('--demucs-rtf', type=float, default=0.01, help='Fake separation seconds per second of audio')
+    parser.add_argument('--demucs-startup', type=float, default=1.0, help='Fake Demucs startup/model load seconds')
+    parser.add_argument('--demucs-mb', type=float, default=200, help='Memory held by each fake Demucs process')
+    parser.add_argument('--out', help='Results file (default: bench/results/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two results files and exit')
+    parser.add_argument('--verbose', action='store_true', help='Print the log of failed runs')
+    parser.add_argument('main_args', nargs=argparse.REMAINDER,
+                        help='Extra arguments for src/main.py, after "--" (default: --ytdl-backend subprocess --demucs-backend subprocess --no-stem-cache)')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    args.main_args = [arg for arg in args.main_args if arg != '--'] or ['--ytdl-backend', 'subprocess', '--demucs-backend', 'subprocess', '--no-stem-cache']
+
+    server = start_oembed_server(args.oembed_seconds)
+    oembed_url = f'http://127.0.0.1:{server.server_address[1]}/oembed'
+
+    runs = []
+    print_runs([])
+    for batch_size, download_workers, separate_workers in itertools.product(
+            args.batch_sizes, args.download_workers, args.separate_workers):
+        run = run_once(batch_size, download_workers, separate_workers, args, oembed_url)
+        runs.append(run)
+        print_runs([run], header=False)
+    server.shutdown()
+
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'timestamp': time.time(),
+        'host': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'params': {key: value for key, value in vars(args).items() if key not in ('out', 'compare', 'verbose')},
+        'runs': runs,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print()
+    print_runs(runs)
+    print(f"\nResults written to {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+CPU thread budget for concurrent Demucs separations.
+
+Left alone, every Demucs process sizes its torch/OpenMP/MKL thread pools to
+all cores, so N concurrent separations run N x cores threads and spend their
+time contending for the CPU. The plan here splits the available cores across
+the separation workers: each worker gets a fixed number of threads (and
+optionally its own CPU set), and the split is chosen for the most tracks per
+hour.
+"""
+import os
+import queue
+import threading
+import contextlib
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from .utils import log
+
+
+# Environment variables that size the thread pools of torch and its BLAS/OpenMP backends
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+# The split is chosen with a model of a Demucs run, not a measurement of this
+# host: both constants are estimates and can be set with
+# --demucs-parallel-fraction and --demucs-worker-contention.
+# Share of a Demucs run that speeds up with more threads (Amdahl's law); the
+# rest (decoding, encoding, Python overhead) runs on one core
+DEMUCS_PARALLEL_FRACTION = 0.8
+# Slowdown of every worker per additional concurrent worker: the workers share
+# memory bandwidth and caches, and each holds its own copy of the model. With
+# 0.2 the best split is about 4 threads per worker (8 cores: 2 x 4, 16: 4 x 4,
+# 64: 8 x 8) rather than one single-threaded worker per core.
+DEMUCS_WORKER_CONTENTION = 0.2
+# Peak memory of one htdemucs separation of a typical track
+DEMUCS_WORKER_MEMORY_MB = 3000
+
+
+def budget_log(*msgs: str):
+    log("CPU BUDGET", *msgs)
+
+
+def available_cpus() -> list[int]:
+    """CPUs this process may run on (respects taskset/cgroup CPU sets where supported)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def available_memory_mb() -> Optional[float]:
+    """MemAvailable from /proc/meminfo, or None where it can't be read."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def relative_throughput(workers: int, threads: int, parallel_fraction: float = DEMUCS_PARALLEL_FRACTION,
+                        contention: float = DEMUCS_WORKER_CONTENTION) -> float:
+    """
+    Tracks per unit of time of `workers` separations with `threads` threads
+    each, relative to one single-threaded run: Amdahl's law per worker, slowed
+    down by the contention between concurrent workers.
+    """
+    return workers / (((1 - parallel_fraction) + parallel_fraction / threads) * (1 + contention * (workers - 1)))
+
+
+@dataclass
+class ThreadPlan:
+    """How the cores are split across separation workers."""
+    workers: int
+    threads: int
+    # One CPU set per worker when workers are pinned, else None
+    cpu_sets: Optional[list[list[int]]] = None
+
+    def env(self) -> dict[str, str]:
+        """Environment for a separation subprocess."""
+        return {**os.environ, **{name: str(self.threads) for name in THREAD_ENV_VARS}}
+
+    def describe(self) -> str:
+        pinned = f", pinned to {', '.join(_format_cpus(cpus) for cpus in self.cpu_sets)}" if self.cpu_sets else ""
+        return f"{self.workers} separation worker(s) x {self.threads} thread(s){pinned}"
+
+
+def _format_cpus(cpus: list[int]) -> str:
+    return f"{cpus[0]}-{cpus[-1]}" if len(cpus) > 1 and cpus[-1] - cpus[0] == len(cpus) - 1 else ','.join(map(str, cpus))
+
+
+def plan_threads(workers: Optional[int] = None, threads: Optional[int] = None, pin: bool = False,
+                 cpus: Optional[list[int]] = None, worker_memory_mb: float = DEMUCS_WORKER_MEMORY_MB,
+                 parallel_fraction: float = DEMUCS_PARALLEL_FRACTION,
+                 contention: float = DEMUCS_WORKER_CONTENTION) -> ThreadPlan:
+    """
+    Split the cores across separation workers.
+
+    With neither workers nor threads given, every split of the cores into
+    workers x threads that uses all of them is scored with
+    relative_throughput() and the best one wins; more workers than fit in the
+    available memory are not considered.
+
+    Args:
+        workers: Number of concurrent separations (None: choose)
+        threads: Threads per separation (None: the cores divided by the workers)
+        pin: Give every worker its own CPU set
+        cpus: CPUs to split (default: available_cpus())
+        worker_memory_mb: Memory one separation needs, to bound the workers
+        parallel_fraction: Model constant, see DEMUCS_PARALLEL_FRACTION
+        contention: Model constant, see DEMUCS_WORKER_CONTENTION
+
+    Returns:
+        The plan
+    """
+    cpus = cpus or available_cpus()
+    cores = len(cpus)
+
+    if workers is None and threads is not None:
+        workers = max(1, cores // threads)
+    if workers is None:
+        max_workers = cores
+        memory_mb = available_memory_mb()
+        if memory_mb is not None and worker_memory_mb:
+            max_workers = min(max_workers, int(memory_mb // worker_memory_mb))
+        max_workers = max(1, max_workers)
+        # Only splits that use every core: the model may score an uneven one
+        # higher (32 cores: 5 x 6), but the idle cores are certain and the
+        # gain is only an estimate. Ties go to fewer workers: lower latency
+        # per track and less memory
+        splits = [count for count in range(1, max_workers + 1) if cores % count == 0]
+        workers = max(splits, key=lambda count: (relative_throughput(count, cores // count, parallel_fraction, contention), -count))
+    workers = max(1, workers)
+    if threads is None:
+        threads = max(1, cores // workers)
+
+    cpu_sets = None
+    if pin and workers * threads <= cores:
+        cpu_sets = [cpus[index * threads:(index + 1) * threads] for index in range(workers)]
+    elif pin:
+        budget_log(f"Not pinning: {workers} x {threads} threads don't fit in {cores} CPU(s)")
+    return ThreadPlan(workers, threads, cpu_sets)
+
+
+class CpuSlots:
+    """
+    Hands the per-worker CPU sets of a plan to the threads running separations.
+
+    A separation holds a slot for its duration, so no two concurrent
+    separations share a CPU set.
+    """
+
+    def __init__(self, plan: ThreadPlan):
+        self.plan = plan
+        self._free: queue.Queue = queue.Queue()
+        for index in range(plan.workers):
+            self._free.put(index)
+
+    @contextlib.contextmanager
+    def slot(self) -> Iterator[Optional[list[int]]]:
+        """Hold a slot; yields its CPU set (None when not pinning)."""
+        index = self._free.get()
+        _local.cpus = self.plan.cpu_sets[index] if self.plan.cpu_sets else None
+        try:
+            yield _local.cpus
+        finally:
+            _local.cpus = None
+            self._free.put(index)
+
+
+_plan: Optional[ThreadPlan] = None
+_local = threading.local()
+
+
+def configure_thread_plan(plan: Optional[ThreadPlan]):
+    """Set the plan that separation subprocesses are started with."""
+    global _plan
+    _plan = plan
+
+
+def subprocess_env() -> Optional[dict[str, str]]:
+    """Environment for a separation subprocess (None: inherit unchanged)."""
+    return _plan.env() if _plan is not None else None
+
+
+def subprocess_cpus() -> Optional[list[int]]:
+    """CPU set of the slot the calling thread holds, if workers are pinned."""
+    return getattr(_local, 'cpus', None)
+
+
+def apply_in_worker(threads: int, cpu_sets: Optional[queue.Queue] = None):
+    """
+    Size the thread pools of the current (worker) process and pin it.
+
+    Call before importing torch, so OpenMP/MKL pick the environment up too.
+
+    Args:
+        threads: Threads for torch, OpenMP and MKL
+        cpu_sets: Queue the process takes its CPU set from, when pinning
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    if cpu_sets is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, cpu_sets.get_nowait())
+        except queue.Empty:
+            pass
+
+    import torch
+    torch.set_num_threads(threads)
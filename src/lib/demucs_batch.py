@@ -0,0 +1,164 @@
+"""
+Batching of short tracks into shared Demucs subprocesses.
+
+`python3 -m demucs` loads the model on every start, which for a short song
+costs about as much as the separation itself. Separations submitted here are
+gathered into batches, bounded by track count, total duration and how long
+the first track may wait, and every batch is run as one Demucs invocation.
+"""
+import os
+import time
+import queue
+import threading
+import contextlib
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+from .demucs_processor import DEMUCS_OUTPUT_CODEC, demucs_log, run_demucs, run_demucs_batch
+from .cpu_budget import CpuSlots
+from .memory_budget import estimate_separation_mb, memory_budget
+
+
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_BATCH_MAX_MINUTES = 30
+DEFAULT_BATCH_MAX_WAIT_SECONDS = 2.0
+
+# Ends the collector thread
+_STOP = object()
+
+
+@dataclass
+class _Request:
+    mp3_path: str
+    codec: str
+    duration: Optional[float]
+    # Filesystem of the track's folder
+    device: Optional[int] = None
+    future: Future = field(default_factory=Future)
+
+
+def _device(path: str) -> Optional[int]:
+    try:
+        return os.stat(os.path.dirname(path)).st_dev
+    except OSError:
+        return None
+
+
+class DemucsBatcher:
+    """
+    Runs the separations submitted from any number of threads in batches, on
+    `runners` concurrent Demucs subprocesses.
+    """
+
+    def __init__(self, runners: int, max_tracks: int = DEFAULT_BATCH_SIZE,
+                 max_minutes: float = DEFAULT_BATCH_MAX_MINUTES,
+                 max_wait_seconds: float = DEFAULT_BATCH_MAX_WAIT_SECONDS,
+                 cpu_slots: Optional[CpuSlots] = None):
+        self.max_tracks = max(1, max_tracks)
+        self.max_seconds = max_minutes * 60
+        self.max_wait_seconds = max_wait_seconds
+        self._cpu_slots = cpu_slots
+        self._requests: queue.Queue = queue.Queue()
+        # A batch is only collected once a runner is free to take it, so tracks
+        # that arrive while every runner is busy join the next batch
+        self._free_runners = threading.Semaphore(max(1, runners))
+        self._collector = threading.Thread(target=self._collect, name='demucs-batch', daemon=True)
+        self._collector.start()
+
+    def run(self, mp3_path: str, *, codec: str = DEMUCS_OUTPUT_CODEC, duration: Optional[float] = None) -> Tuple[str, str]:
+        """
+        Separate a track as part of a batch, with the same contract as run_demucs.
+
+        Args:
+            mp3_path: Path to the audio file to process
+            codec: Output codec of the stems
+            duration: Length of the track in seconds, if known
+
+        Returns:
+            Tuple of (output_directory, stderr)
+        """
+        mp3_path = os.path.abspath(mp3_path)
+        request = _Request(mp3_path, codec, duration, _device(mp3_path))
+        self._requests.put(request)
+        return request.future.result()
+
+    def close(self):
+        self._requests.put(_STOP)
+        self._collector.join()
+
+    def _can_join(self, first: _Request, names: set[str], total: float, request: _Request) -> bool:
+        # Demucs names its output files after the file names, and the stems of
+        # a batch are renamed into place from one scratch directory
+        return (request.codec == first.codec and request.device == first.device
+                and os.path.basename(request.mp3_path) not in names
+                and total + (request.duration or 0) <= self.max_seconds)
+
+    def _collect(self):
+        # Requests that couldn't join the batch they arrived during. Every
+        # batch is filled from these first, so they can share a run with
+        # each other rather than only start the next batch.
+        pending: list[_Request] = []
+        stopping = False
+        while True:
+            self._free_runners.acquire()
+            if not pending:
+                request = _STOP if stopping else self._requests.get()
+                if request is _STOP:
+                    return
+                pending.append(request)
+            first = pending.pop(0)
+            batch = [first]
+            total = first.duration or 0
+            names = {os.path.basename(first.mp3_path)}
+
+            def add(request: _Request) -> bool:
+                nonlocal total
+                if len(batch) >= self.max_tracks or not self._can_join(first, names, total, request):
+                    return False
+                batch.append(request)
+                names.add(os.path.basename(request.mp3_path))
+                total += request.duration or 0
+                return True
+
+            pending = [request for request in pending if not add(request)]
+            wait_until = time.monotonic() + self.max_wait_seconds
+            # After close() only what is pending is left to run
+            while not stopping and len(batch) < self.max_tracks and total < self.max_seconds:
+                try:
+                    request = self._requests.get(timeout=max(0, wait_until - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request is _STOP:
+                    stopping = True
+                elif not add(request):
+                    pending.append(request)
+            threading.Thread(target=self._run_batch, args=(batch,), name='demucs-batch-run', daemon=True).start()
+
+    def _run_batch(self, batch: list[_Request]):
+        try:
+            budget = memory_budget()
+            # Demucs separates the tracks of a batch one after the other
+            admission = budget.reserve(max(estimate_separation_mb(request.duration) for request in batch)) if budget is not None else contextlib.nullcontext()
+            slot = self._cpu_slots.slot() if self._cpu_slots is not None else contextlib.nullcontext()
+            with slot, admission:
+                if len(batch) == 1:
+                    separated, stderr = [], ''
+                else:
+                    separated, stderr = run_demucs_batch([request.mp3_path for request in batch], codec=batch[0].codec)
+                for request in batch:
+                    if request.mp3_path in separated:
+                        request.future.set_result((os.path.dirname(request.mp3_path), stderr))
+                        continue
+                    if len(batch) > 1:
+                        demucs_log(f"No stems for {request.mp3_path} from the batch, separating it on its own")
+                    try:
+                        request.future.set_result(run_demucs(request.mp3_path, codec=request.codec))
+                    except Exception as e:
+                        request.future.set_exception(e)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        finally:
+            self._free_runners.release()
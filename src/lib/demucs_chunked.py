@@ -0,0 +1,282 @@
+"""
+Bounded-memory Demucs separation for long inputs (multi-hour DJ sets).
+
+Handing a 3 hour mix to Demucs in one piece makes peak memory grow with the
+length of the track. Here the input is decoded progressively and separated in
+overlapping windows; consecutive windows are cross-faded together in
+memory-mapped float32 ring buffers of one window plus the overlap, and every
+region that no later window touches is streamed to the stem encoders straight
+away. Peak memory and scratch space depend on the window size, not on the
+input length.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Optional, Tuple
+
+from .demucs_processor import DEMUCS_MODEL, DEMUCS_OUTPUT_CODEC, demucs_log, encoder_args, stem_output_paths
+from .utils import probe_audio_duration
+from . import events
+
+
+DEFAULT_WINDOW_SECONDS = 60
+DEFAULT_OVERLAP_SECONDS = 5
+# Inputs longer than this are separated in windows
+DEFAULT_LONG_INPUT_MINUTES = 30
+
+
+def _open_decoder(audio_path: str, samplerate: int, channels: int) -> subprocess.Popen:
+    cmd = [
+        'ffmpeg',
+        '-v', 'error',
+        '-i', audio_path,
+        '-map', '0:a:0',
+        '-f', 'f32le',
+        '-ac', str(channels),
+        '-ar', str(samplerate),
+        '-',
+    ]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def _open_encoder(target_path: str, samplerate: int, channels: int) -> subprocess.Popen:
+    cmd = [
+        'ffmpeg',
+        '-y',
+        '-v', 'error',
+        '-f', 'f32le',
+        '-ar', str(samplerate),
+        '-ac', str(channels),
+        '-i', '-',
+        *encoder_args(target_path),
+        target_path,
+    ]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def _read_frames(stream, frames: int, channels: int):
+    """Read up to `frames` interleaved float32 frames, fewer only at end of stream."""
+    import numpy as np
+
+    wanted = frames * channels * 4
+    data = bytearray()
+    while len(data) < wanted:
+        block = stream.read(wanted - len(data))
+        if not block:
+            break
+        data.extend(block)
+    usable = len(data) - len(data) % (channels * 4)
+    return np.frombuffer(bytes(data[:usable]), dtype=np.float32).reshape(-1, channels)
+
+
+class CrossFader:
+    """
+    Joins the separated stems of consecutive overlapping windows, cross-fading
+    the start of every window linearly into the end of the one before.
+
+    The stems are kept in ring buffers (one per stem, at least a window long);
+    frames no later window touches are handed back for encoding as soon as a
+    window is added, so the buffers never hold more than one window.
+    """
+
+    def __init__(self, buffers: dict, overlap: int):
+        import numpy as np
+
+        self.buffers = buffers
+        self.size = len(next(iter(buffers.values())))
+        self.overlap = overlap
+        self.ramp = np.linspace(0.0, 1.0, overlap, dtype=np.float32)[:, None]
+        self.start = 0       # Position of the next window in the output
+        self.finalized = 0   # Everything before this has been handed back
+        self.end = 0         # Everything before this has been added
+
+    def _spans(self, begin: int, end: int) -> list[tuple[slice, slice]]:
+        """(ring buffer slice, slice of begin:end) pieces of the output frames begin:end."""
+        spans = []
+        position = begin
+        while position < end:
+            index = position % self.size
+            count = min(end - position, self.size - index)
+            spans.append((slice(index, index + count), slice(position - begin, position - begin + count)))
+            position += count
+        return spans
+
+    def _take(self, end: int) -> dict:
+        """Hand back the frames up to end."""
+        import numpy as np
+
+        spans = self._spans(self.finalized, end)
+        ready = {stem: np.concatenate([buffer[ring] for ring, _ in spans]) if spans else buffer[:0].copy()
+                 for stem, buffer in self.buffers.items()}
+        self.finalized = end
+        return ready
+
+    def add(self, separated: dict) -> dict:
+        """
+        Add the next window's stems, (frames, channels) arrays.
+
+        Returns:
+            Per stem the frames that are final, in order
+        """
+        frames = len(next(iter(separated.values())))
+        end = self.start + frames
+        if end - self.finalized > self.size:
+            raise ValueError(f"Window of {frames} frames does not fit in buffers of {self.size} frames")
+        blend = min(self.overlap, frames) if self.start > 0 else 0
+        for stem, buffer in self.buffers.items():
+            out = separated[stem]
+            for ring, part in self._spans(self.start, self.start + blend):
+                buffer[ring] = buffer[ring] * (1 - self.ramp[part]) + out[part] * self.ramp[part]
+            for ring, part in self._spans(self.start + blend, end):
+                buffer[ring] = out[blend:][part]
+        self.end = end
+        # The next window only touches the last `overlap` frames
+        self.start = max(self.finalized, end - self.overlap)
+        return self._take(self.start)
+
+    def finish(self) -> dict:
+        """Hand back the rest of the frames."""
+        return self._take(self.end)
+
+
+def separate_chunked(model, audio_path: str, targets: dict[str, str],
+                     window_seconds: float = DEFAULT_WINDOW_SECONDS,
+                     overlap_seconds: float = DEFAULT_OVERLAP_SECONDS):
+    """
+    Separate audio_path into vocals/no_vocals window by window.
+
+    Args:
+        model: Loaded Demucs model
+        audio_path: Path to the input audio
+        targets: Mapping of stem name ('vocals', 'no_vocals') to output path (the extension selects the codec)
+        window_seconds: Length of each separation window
+        overlap_seconds: Overlap between consecutive windows, cross-faded linearly
+    """
+    import numpy as np
+    import torch
+    from demucs.apply import apply_model
+
+    samplerate = model.samplerate
+    channels = model.audio_channels
+    window = int(window_seconds * samplerate)
+    overlap = int(overlap_seconds * samplerate)
+    if not 0 < overlap < window:
+        raise ValueError(f"Overlap ({overlap_seconds}s) must be shorter than the window ({window_seconds}s)")
+
+    duration = probe_audio_duration(audio_path)
+    if duration is None:
+        raise Exception(f"Could not determine duration of {audio_path}")
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    vocals_index = model.sources.index('vocals')
+
+    target_dir = os.path.dirname(os.path.abspath(next(iter(targets.values()))))
+    work_dir = tempfile.mkdtemp(prefix='.yts-chunks-', dir=target_dir)
+    partial_paths = {}
+    for stem, target in targets.items():
+        root, ext = os.path.splitext(target)
+        partial_paths[stem] = f"{root}.part{ext}"
+
+    buffers = {stem: np.memmap(os.path.join(work_dir, f'{stem}.f32'), dtype=np.float32, mode='w+', shape=(window + overlap, channels))
+               for stem in targets}
+    fader = CrossFader(buffers, overlap)
+    decoder = _open_decoder(audio_path, samplerate, channels)
+    encoders = {stem: _open_encoder(partial_paths[stem], samplerate, channels) for stem in targets}
+
+    def encode(ready: dict):
+        for stem, encoder in encoders.items():
+            encoder.stdin.write(np.clip(ready[stem], -1.0, 1.0).tobytes())
+
+    try:
+        carry = np.zeros((0, channels), dtype=np.float32)
+
+        while True:
+            fresh = _read_frames(decoder.stdout, window - len(carry), channels)
+            if len(fresh) == 0:
+                break
+            chunk = np.concatenate([carry, fresh])
+
+            wav = torch.from_numpy(np.ascontiguousarray(chunk.T))
+            ref = wav.mean(0)
+            mean, std = ref.mean(), ref.std() + 1e-8
+            with torch.no_grad():
+                sources = apply_model(model, ((wav - mean) / std)[None], device=device,
+                                      shifts=1, split=True, overlap=0.25, progress=False)[0]
+            sources = (sources * std + mean).cpu()
+            vocals = sources[vocals_index]
+            separated = {
+                'vocals': vocals,
+                'no_vocals': sources.sum(0) - vocals,
+            }
+            encode(fader.add({stem: separated[stem].numpy().T for stem in targets}))
+
+            if len(chunk) < window:
+                break
+            demucs_log(f"Separated {fader.end / samplerate / 60:.1f} of {duration / 60:.1f} min")
+            carry = chunk[-overlap:]
+
+        encode(fader.finish())
+        for encoder in encoders.values():
+            encoder.stdin.close()
+
+        _, decoder_stderr = decoder.communicate()
+        if decoder.returncode != 0:
+            raise Exception(f"Error decoding {audio_path}: {decoder_stderr.decode(errors='replace')}")
+        for stem, encoder in encoders.items():
+            if encoder.wait() != 0:
+                raise Exception(f"Error encoding {stem} stem: {encoder.stderr.read().decode(errors='replace')}")
+
+        for stem, target in targets.items():
+            os.replace(partial_paths[stem], target)
+        demucs_log(f"Separated {fader.end / samplerate / 60:.1f} min in windows of {window_seconds}s")
+    finally:
+        for process in [decoder, *encoders.values()]:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        for path in partial_paths.values():
+            if os.path.exists(path):
+                os.remove(path)
+        del fader, buffers
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def is_long_input(audio_path: str, long_input_minutes: Optional[float], duration: Optional[float] = None) -> bool:
+    """
+    Check whether an input should go through the windowed path.
+
+    Args:
+        audio_path: Path to the input audio
+        long_input_minutes: Threshold in minutes (None or 0 disables windowing)
+        duration: Length of the input in seconds, if already probed
+    """
+    if not long_input_minutes:
+        return False
+    if duration is None:
+        duration = probe_audio_duration(audio_path)
+    return duration is not None and duration > long_input_minutes * 60
+
+
+def run_demucs_chunked(mp3_path: str, model=None, codec: str = DEMUCS_OUTPUT_CODEC) -> Tuple[str, str]:
+    """
+    Separate a long input with bounded memory, loading the model in this process.
+
+    Args:
+        mp3_path: Path to the audio file to process
+        model: Optional already-loaded Demucs model
+        codec: Output codec of the stems
+
+    Returns:
+        Tuple of (output_directory, stderr)
+    """
+    if model is None:
+        from demucs.pretrained import get_model
+        model = get_model(DEMUCS_MODEL)
+        model.eval()
+
+    demucs_log(f"Processing {mp3_path} with Demucs in windows")
+    with events.stage('demucs', backend='in-process', chunked=True) as stage_fields:
+        separate_chunked(model, mp3_path, stem_output_paths(mp3_path, codec))
+        stage_fields.update(events.file_fields(mp3_path))
+    return os.path.dirname(mp3_path), ''
@@ -0,0 +1,198 @@
+"""
+In-process Demucs engine.
+
+`python3 -m demucs` pays for interpreter startup, the torch import and the
+model weight load on every track. The engine keeps the model resident in a
+pool of long-lived worker processes and feeds them tracks through the pool's
+work queue instead.
+"""
+import os
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from .demucs_processor import DEMUCS_MODEL, DEMUCS_OUTPUT_CODEC, demucs_codec, demucs_log, encode_stem, run_demucs, stem_output_paths
+from .demucs_chunked import run_demucs_chunked, separate_chunked
+from .cpu_budget import ThreadPlan, apply_in_worker
+from . import events
+
+
+# Model loaded once per worker process by _init_worker
+_worker_model = None
+# Failures of the engine rather than of the track: a worker process died, or
+# couldn't load the model (the initializer failed). Either breaks the pool.
+ENGINE_FAILURES = (BrokenProcessPool,)
+
+
+def demucs_engine_available() -> bool:
+    """Check whether Demucs and torch can be imported in this interpreter."""
+    try:
+        import torch  # noqa: F401
+        import demucs.apply  # noqa: F401
+        import demucs.audio  # noqa: F401
+        import demucs.pretrained  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _init_worker(model_name: str, threads: Optional[int] = None, cpu_sets=None):
+    global _worker_model
+    if threads is not None:
+        apply_in_worker(threads, cpu_sets)
+    from demucs.pretrained import get_model
+
+    demucs_log(f"Loading {model_name} in worker {os.getpid()}")
+    _worker_model = get_model(model_name)
+    _worker_model.eval()
+
+
+def _separate_in_worker(mp3_path: str, codec: str = DEMUCS_OUTPUT_CODEC) -> str:
+    """
+    Separate a track with the resident model, mirroring `demucs --two-stems vocals --mp3`
+    (or --flac, or WAV encoded afterwards for codecs Demucs can't write).
+
+    Returns:
+        Directory containing the stems
+    """
+    import torch
+    from demucs.apply import apply_model
+    from demucs.audio import AudioFile, save_audio
+
+    model = _worker_model
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+    wav = AudioFile(mp3_path).read(streams=0, samplerate=model.samplerate, channels=model.audio_channels)
+    ref = wav.mean(0)
+    wav = (wav - ref.mean()) / ref.std()
+    with torch.no_grad():
+        sources = apply_model(model, wav[None], device=device, shifts=1, split=True, overlap=0.25, progress=False)[0]
+    sources = sources * ref.std() + ref.mean()
+
+    vocals = sources[model.sources.index('vocals')]
+    stems = {
+        'vocals': vocals,
+        'no_vocals': sources.sum(0) - vocals,
+    }
+    for stem, target_file in stem_output_paths(mp3_path, codec).items():
+        root, ext = os.path.splitext(target_file)
+        part_file = f"{root}.part{ext}"
+        wav_file = f"{root}.part.wav"
+        try:
+            if demucs_codec(codec) == codec:
+                save_audio(stems[stem], part_file, samplerate=model.samplerate,
+                           bitrate=320, clip='rescale', bits_per_sample=16, as_float=False)
+            else:
+                save_audio(stems[stem], wav_file, samplerate=model.samplerate,
+                           clip='rescale', bits_per_sample=16, as_float=False)
+                encode_stem(wav_file, part_file)
+            # The stem appears at its final path complete, or not at all
+            os.replace(part_file, target_file)
+        finally:
+            for path in (part_file, wav_file):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    return os.path.dirname(mp3_path)
+
+
+def _separate_chunked_in_worker(mp3_path: str, codec: str = DEMUCS_OUTPUT_CODEC) -> str:
+    """Separate a long track window by window with the resident model."""
+    separate_chunked(_worker_model, mp3_path, stem_output_paths(mp3_path, codec))
+    return os.path.dirname(mp3_path)
+
+
+class DemucsEngine:
+    """
+    Pool of worker processes that each keep a Demucs model loaded.
+
+    When the engine fails (ENGINE_FAILURES), tracks are separated the way
+    they are without the engine; errors separating a track are raised.
+    """
+
+    def __init__(self, workers: int, model_name: str = DEMUCS_MODEL, plan: Optional[ThreadPlan] = None):
+        demucs_log(f"Starting Demucs engine with {workers} worker(s)")
+        # spawn: the parent runs pipeline threads, which don't mix with fork
+        context = multiprocessing.get_context('spawn')
+        threads, cpu_sets = None, None
+        if plan is not None:
+            threads = plan.threads
+            if plan.cpu_sets:
+                # Every worker process takes one CPU set when it starts
+                cpu_sets = context.Queue()
+                for cpus in plan.cpu_sets:
+                    cpu_sets.put(cpus)
+        self._executor = ProcessPoolExecutor(
+            max_workers=max(1, workers),
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(model_name, threads, cpu_sets),
+        )
+
+    def submit(self, mp3_path: str, codec: str = DEMUCS_OUTPUT_CODEC) -> Future:
+        """Queue a track for separation."""
+        return self._executor.submit(_separate_in_worker, os.path.abspath(mp3_path), codec)
+
+    def run(self, mp3_path: str, *, codec: str = DEMUCS_OUTPUT_CODEC) -> Tuple[str, str]:
+        """
+        Separate a track, with the same contract as run_demucs.
+
+        Args:
+            mp3_path: Path to the audio file to process
+            codec: Output codec of the stems
+
+        Returns:
+            Tuple of (output_directory, stderr)
+        """
+        demucs_log(f"Processing {mp3_path} with Demucs engine")
+        try:
+            with events.stage('demucs', backend='engine') as stage_fields:
+                output_dir = self.submit(mp3_path, codec).result()
+                stage_fields.update(events.file_fields(mp3_path))
+            return output_dir, ''
+        except ENGINE_FAILURES as e:
+            demucs_log(f"Demucs engine failed ({e}), falling back to subprocess")
+            return run_demucs(mp3_path, codec=codec)
+
+    def run_chunked(self, mp3_path: str, codec: str = DEMUCS_OUTPUT_CODEC) -> Tuple[str, str]:
+        """
+        Separate a long track with bounded memory (see demucs_chunked).
+
+        Returns:
+            Tuple of (output_directory, stderr)
+        """
+        demucs_log(f"Processing {mp3_path} with Demucs engine in windows")
+        try:
+            with events.stage('demucs', backend='engine', chunked=True) as stage_fields:
+                future = self._executor.submit(_separate_chunked_in_worker, os.path.abspath(mp3_path), codec)
+                output_dir = future.result()
+                stage_fields.update(events.file_fields(mp3_path))
+            return output_dir, ''
+        except ENGINE_FAILURES as e:
+            demucs_log(f"Demucs engine failed ({e}), separating in this process")
+            return run_demucs_chunked(mp3_path, codec=codec)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def create_demucs_engine(backend: str, workers: int, plan: Optional[ThreadPlan] = None) -> Optional[DemucsEngine]:
+    """
+    Create the Demucs engine for the requested backend.
+
+    Args:
+        backend: 'engine', 'subprocess' or 'auto' (engine if Demucs is importable)
+        workers: Number of engine worker processes
+        plan: Optional thread plan the worker processes are sized and pinned by
+
+    Returns:
+        A DemucsEngine, or None to use the subprocess path
+    """
+    if backend == 'subprocess':
+        return None
+    if not demucs_engine_available():
+        if backend == 'engine':
+            demucs_log("Warning: Demucs/torch not importable, using subprocess backend")
+        return None
+    return DemucsEngine(workers, plan=plan)
@@ -6,107 +6,211 @@ import shutil
 import time
 import subprocess
 import re
+import tempfile
 from typing import Tuple, Optional
 
-from .envutils import YTSPLEET_DEFAULT_OUTPUT_FOLDER
 from .utils import log, run_subprocess_with_realtime_output
+from .cpu_budget import subprocess_cpus, subprocess_env
+from . import events
+
+
+# Demucs model used for separation (best quality for vocals)
+DEMUCS_MODEL = 'htdemucs'
+# Two-stem mode: vocals vs. everything else
+DEMUCS_STEM_MODE = 'vocals'
+# Default codec of the final stems
+DEMUCS_OUTPUT_CODEC = 'mp3'
+OUTPUT_CODECS = ('mp3', 'flac', 'opus', 'wav')
+# Demucs CLI flags per codec it can write itself; other codecs are separated
+# to WAV and encoded once with ffmpeg
+DEMUCS_CODEC_FLAGS = {
+    'mp3': ['--mp3'],
+    'flac': ['--flac'],
+    'wav': [],
+}
+# ffmpeg encoder arguments per output codec
+OUTPUT_CODEC_ARGS = {
+    'mp3': ['-b:a', '320k'],
+    'flac': [],
+    'opus': ['-c:a', 'libopus', '-b:a', '192k'],
+    'wav': [],
+}
 
 
 def demucs_log(*msgs: str):
     log("S2 (DEMUCS)", *msgs)
 
 
-def run_demucs(mp3_path: str, output_folder: Optional[str] = None) -> Tuple[str, str]:
+def stem_output_paths(mp3_path: str, codec: str = DEMUCS_OUTPUT_CODEC) -> dict[str, str]:
     """
-    Run Demucs on the given MP3 file to separate vocals from accompaniment.
-    
+    Get the final stem paths for a track, next to the source audio.
+
     Args:
-        mp3_path: Path to the MP3 file to process
-        output_folder: Optional custom output folder path (overrides default)
-        
+        mp3_path: Path to the audio file being separated (any format)
+        codec: Output codec of the stems (one of OUTPUT_CODECS)
+
     Returns:
-        Tuple of (output_directory, stderr)
+        Mapping of Demucs stem name to output path
     """
-    demucs_log(f"Processing {mp3_path} with Demucs")
-    
-    # Get the track name (filename without extension)
     track_name = os.path.splitext(os.path.basename(mp3_path))[0]
     track_dir = os.path.dirname(mp3_path)
-    
-    # Use custom output folder if provided, otherwise use default
-    base_output_folder = output_folder if output_folder else YTSPLEET_DEFAULT_OUTPUT_FOLDER
-    
-    # Create output directory if it doesn't exist
-    os.makedirs(base_output_folder, exist_ok=True)
-    
+    return {
+        'vocals': os.path.join(track_dir, f'yts-vox_{track_name}.{codec}'),
+        'no_vocals': os.path.join(track_dir, f'yts-acc_{track_name}.{codec}'),
+    }
+
+
+def demucs_codec(codec: str) -> str:
+    """Codec Demucs itself writes when the final stems should be in codec."""
+    return codec if codec in DEMUCS_CODEC_FLAGS else 'wav'
+
+
+def encoder_args(target_path: str) -> list[str]:
+    """ffmpeg encoder arguments for a stem file, chosen by its extension."""
+    return OUTPUT_CODEC_ARGS.get(os.path.splitext(target_path)[1][1:], [])
+
+
+def encode_stem(source_path: str, target_path: str):
+    """
+    Encode a stem Demucs wrote (WAV) into the output codec of target_path.
+
+    Args:
+        source_path: Stem as written by Demucs
+        target_path: Final stem path; its extension selects the codec
+    """
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-i', source_path, *encoder_args(target_path), target_path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Error encoding {target_path}: {result.stderr}")
+
+
+def demucs_command(mp3_paths: list[str], work_dir: str, codec: str = DEMUCS_OUTPUT_CODEC) -> list[str]:
+    """
+    `python3 -m demucs` command line separating the given tracks.
+
+    Every stem is written as work_dir/DEMUCS_MODEL/TRACK_NAME.STEM.EXT (see demucs_output_path).
+    """
     # Run Demucs with the htdemucs model (best quality for vocals)
-    demucs_cmd = [
+    return [
         'python3', '-m', 'demucs', 
-        '--out', base_output_folder,
-        '--mp3', # Output as MP3 files
-        '--two-stems', 'vocals', # Split into vocals and accompaniment only
-        mp3_path
+        '--out', work_dir,
+        '-n', DEMUCS_MODEL,
+        '--filename', '{track}.{stem}.{ext}',  # Flat, so nothing has to be searched for afterwards
+        *DEMUCS_CODEC_FLAGS[demucs_codec(codec)], # Output codec (WAV if Demucs can't write it)
+        '--two-stems', DEMUCS_STEM_MODE, # Split into vocals and accompaniment only
+        *mp3_paths
     ]
+
+
+def demucs_output_path(work_dir: str, mp3_path: str, stem: str, codec: str = DEMUCS_OUTPUT_CODEC) -> str:
+    """Where a demucs_command() run writes a stem of a track."""
+    track_name = os.path.splitext(os.path.basename(mp3_path))[0]
+    return os.path.join(work_dir, DEMUCS_MODEL, f'{track_name}.{stem}.{demucs_codec(codec)}')
+
+
+def run_demucs(mp3_path: str, *, codec: str = DEMUCS_OUTPUT_CODEC) -> Tuple[str, str]:
+    """
+    Run Demucs on the given audio file to separate vocals from accompaniment.
     
-    # Run the Demucs command with real-time output
-    demucs_log(f"Running Demucs on {track_name}")
-    return_code, stdout, stderr = run_subprocess_with_realtime_output(
-        demucs_cmd,
-        demucs_log,
-        "DEMUCS"
-    )
+    The stems are written next to the audio file (see stem_output_paths).
+    codec is keyword-only: the output folder that used to be the second
+    argument no longer exists, and passing one must not be taken for a codec.
+    
+    Args:
+        mp3_path: Path to the audio file to process (MP3 or any format ffmpeg reads)
+        codec: Output codec of the stems (one of OUTPUT_CODECS)
+        
+    Returns:
+        Tuple of (output_directory, stderr)
+    """
+    demucs_log(f"Processing {mp3_path} with Demucs")
+    separated, return_code, stderr = _run_demucs_subprocess([mp3_path], codec)
     
     # Check if the process was successful
     if return_code != 0:
         raise Exception(f"Error encountered running Demucs. Return code: {return_code}. Stderr follows: {stderr}")
+    if not separated:
+        raise Exception(f"Demucs did not write the stems of {mp3_path}. Stderr follows: {stderr}")
     
-    # Demucs creates files in a structure like:
-    # base_output_folder/htdemucs/TRACK_NAME/vocals.mp3
-    # base_output_folder/htdemucs/TRACK_NAME/no_vocals.mp3
+    # Return the output directory
+    return os.path.dirname(mp3_path), stderr
+
+
+def run_demucs_batch(mp3_paths: list[str], *, codec: str = DEMUCS_OUTPUT_CODEC) -> Tuple[list[str], str]:
+    """
+    Separate several tracks with a single Demucs invocation, so the model is
+    loaded once for all of them. Each track's stems end up next to it, as with
+    run_demucs. The tracks must have distinct file names.
     
-    # Find the output files
-    demucs_output_dir = os.path.join(base_output_folder, 'htdemucs', track_name)
+    Args:
+        mp3_paths: Paths to the audio files to process
+        codec: Output codec of the stems
+        
+    Returns:
+        Tuple of (tracks whose stems were written, stderr)
+    """
+    demucs_log(f"Processing {len(mp3_paths)} tracks with one Demucs run")
+    separated, return_code, stderr = _run_demucs_subprocess(mp3_paths, codec)
+    if return_code != 0:
+        # Tracks before the failing one may still have been separated
+        demucs_log(f"Demucs exited with {return_code} for a batch of {len(mp3_paths)} tracks")
+    return separated, stderr
+
+
+def _run_demucs_subprocess(mp3_paths: list[str], codec: str) -> Tuple[list[str], int, str]:
+    """
+    Run Demucs on the tracks in a scratch directory next to the first one and
+    rename every stem into its final place.
     
-    if not os.path.exists(demucs_output_dir):
-        demucs_log(f"Warning: Expected output directory {demucs_output_dir} not found")
-        # Try to find the actual output directory
-        for root, dirs, files in os.walk(base_output_folder):
-            if os.path.basename(root) == track_name:
-                demucs_output_dir = root
-                demucs_log(f"Found alternative output directory: {demucs_output_dir}")
-                break
+    The scratch directory is on the same filesystem as the tracks (batches
+    only group tracks of one filesystem), so each stem appears at its final
+    path in one atomic rename, and nothing depends on how much else is in the
+    output folder.
     
-    # Move all files from the Demucs output directory to the original directory with proper naming
-    if os.path.exists(demucs_output_dir):
-        demucs_log(f"Moving output files from {demucs_output_dir} to {track_dir}")
-        
-        # Define the mapping of Demucs output files to our desired naming format
-        file_mapping = {
-            'vocals.mp3': f'yts-vox_{track_name}.mp3',
-            'no_vocals.mp3': f'yts-acc_{track_name}.mp3'
-        }
-        
-        # Move and rename the files
-        for source_name, target_name in file_mapping.items():
-            source_file = os.path.join(demucs_output_dir, source_name)
-            target_file = os.path.join(track_dir, target_name)
-            
-            if os.path.isfile(source_file):
-                demucs_log(f"Moving {source_name} to {target_name}")
-                shutil.move(source_file, target_file)
-                demucs_log(f"Moved {source_name} to {target_name}")
-            else:
-                demucs_log(f"Warning: Expected file {source_file} not found")
+    Returns:
+        Tuple of (tracks whose stems were written, return_code, stderr)
+    """
+    work_dir = tempfile.mkdtemp(prefix='.yts-demucs-', dir=os.path.dirname(os.path.abspath(mp3_paths[0])))
+    try:
+        with events.stage('demucs', backend='subprocess', batch=len(mp3_paths)) as stage_fields:
+            return_code, stdout, stderr = run_subprocess_with_realtime_output(
+                demucs_command(mp3_paths, work_dir, codec),
+                demucs_log,
+                "DEMUCS",
+                env=subprocess_env(),
+                cpus=subprocess_cpus()
+            )
+            stage_fields.update(events.file_fields(*mp3_paths))
         
-        # Clean up the empty directory if possible
-        try:
-            if len(os.listdir(demucs_output_dir)) == 0:
-                os.rmdir(demucs_output_dir)
-                demucs_log(f"Removed empty directory {demucs_output_dir}")
-        except Exception as e:
-            demucs_log(f"Note: Could not remove directory {demucs_output_dir}: {e}")
-    else:
-        demucs_log(f"Warning: Could not find Demucs output directory")
+        place_started = time.time()
+        separated = [mp3_path for mp3_path in mp3_paths if _place_stems(mp3_path, work_dir, codec)]
+        events.record_stage('place_stems', place_started, time.time(),
+                            bytes=events.file_fields(*[path for mp3_path in separated for path in stem_output_paths(mp3_path, codec).values()])['bytes'])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return separated, return_code, stderr
+
+
+def _place_stems(mp3_path: str, work_dir: str, codec: str) -> bool:
+    """
+    Rename (or encode, then rename) the stems Demucs wrote for a track to
+    their final yts-vox_/yts-acc_ paths.
     
-    # Return the output directory
-    return track_dir, stderr 
\ No newline at end of file
+    Returns:
+        Whether all stems of the track were written
+    """
+    targets = stem_output_paths(mp3_path, codec)
+    sources = {stem: demucs_output_path(work_dir, mp3_path, stem, codec) for stem in targets}
+    missing = [path for path in sources.values() if not os.path.isfile(path)]
+    if missing:
+        demucs_log(f"Warning: Demucs did not write {', '.join(missing)}")
+        return False
+    for stem, target_file in targets.items():
+        source_file = sources[stem]
+        if demucs_codec(codec) != codec:
+            encoded_file = os.path.join(work_dir, os.path.basename(target_file))
+            demucs_log(f"Encoding {os.path.basename(source_file)} to {os.path.basename(target_file)}")
+            encode_stem(source_file, encoded_file)
+            source_file = encoded_file
+        os.replace(source_file, target_file)
+    return True
@@ -0,0 +1,174 @@
+"""
+Global index of downloaded audio.
+
+Maps a video id to the audio files already downloaded for it, whatever output
+folder, title or time range they were downloaded under, so a video is only
+fetched from the network once. A full download (or a longer section) also
+serves time-range requests: the section is cut from it locally.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .envutils import YTSPLEET_CACHE_FOLDER
+from .utils import log
+
+
+DEFAULT_DOWNLOAD_INDEX_PATH = os.path.join(YTSPLEET_CACHE_FOLDER, 'downloads.sqlite3')
+
+
+def index_log(*msgs: str):
+    log("DOWNLOAD INDEX", *msgs)
+
+
+@dataclass
+class Asset:
+    """A downloaded audio file of a video."""
+    path: str
+    video_id: str
+    # Seconds into the video; None for a full download
+    start_seconds: Optional[int]
+    end_seconds: Optional[int]
+    checksum: str
+
+    @property
+    def is_full(self) -> bool:
+        return self.start_seconds is None
+
+    @property
+    def span(self) -> float:
+        return float('inf') if self.is_full else self.end_seconds - self.start_seconds
+
+    def covers(self, time_range: Tuple[int, int]) -> bool:
+        """Check whether a section (start_seconds, end_seconds) can be cut from this file."""
+        return self.is_full or (self.start_seconds <= time_range[0] and time_range[1] <= self.end_seconds)
+
+
+def file_checksum(path: str) -> str:
+    """Hex sha256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadIndex:
+    """Video id -> downloaded audio files, safe to use from the pipeline's worker threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS assets (
+                path TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                start_seconds INTEGER,
+                end_seconds INTEGER,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                checksum TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS assets_video ON assets (video_id)')
+
+    def register(self, video_id: str, path: str, time_range: Optional[Tuple[int, int]] = None) -> Asset:
+        """
+        Record a downloaded (or locally cut) file.
+
+        Args:
+            video_id: YouTube video ID
+            path: The audio file
+            time_range: (start_seconds, end_seconds) for a section, None for the full video
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        start, end = time_range if time_range else (None, None)
+        checksum = file_checksum(path)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO assets (path, video_id, start_seconds, end_seconds, size, mtime, checksum, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (path, video_id, start, end, stat.st_size, stat.st_mtime, checksum, time.time())
+            )
+        return Asset(path, video_id, start, end, checksum)
+
+    def find(self, video_id: str, extensions: tuple[str, ...], time_range: Optional[Tuple[int, int]] = None) -> Optional[Asset]:
+        """
+        Find an existing file that can serve a request.
+
+        Args:
+            video_id: YouTube video ID
+            extensions: Acceptable file extensions (e.g. ('.mp3',))
+            time_range: Requested (start_seconds, end_seconds), None for the full video
+
+        Returns:
+            A file with exactly the requested range, else (for a section
+            request) the shortest file containing it, to cut it from, else None
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT path, video_id, start_seconds, end_seconds, size, mtime, checksum FROM assets '
+                'WHERE video_id = ? ORDER BY created_at DESC',
+                (video_id,)
+            ).fetchall()
+
+        requested = time_range if time_range else (None, None)
+        exact, covering = None, None
+        for path, _, start, end, size, mtime, checksum in rows:
+            if os.path.splitext(path)[1] not in extensions:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is None or stat.st_size != size or stat.st_mtime != mtime:
+                index_log(f"Dropping {path}: deleted or modified since it was indexed")
+                self.forget(path)
+                continue
+            asset = Asset(path, video_id, start, end, checksum)
+            if (start, end) == tuple(requested):
+                exact = exact or asset
+            elif time_range and asset.covers(time_range):
+                if covering is None or asset.span < covering.span:
+                    covering = asset
+        return exact or covering
+
+    def forget(self, path: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM assets WHERE path = ?', (os.path.abspath(path),))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_index: Optional[DownloadIndex] = None
+
+
+def configure_download_index(path: Optional[str] = DEFAULT_DOWNLOAD_INDEX_PATH):
+    """
+    Set up the global download index.
+
+    Args:
+        path: SQLite index file, or None to only index the downloads of this run
+    """
+    global _index
+    if _index is not None:
+        _index.close()
+    _index = DownloadIndex(path or ':memory:')
+
+
+def download_index() -> Optional[DownloadIndex]:
+    """The configured index, or None if configure_download_index() was not called."""
+    return _index
@@ -1,2 +1,9 @@
+import os
 
 YTSPLEET_DEFAULT_OUTPUT_FOLDER = 'yt-spleet-output'
+
+# Shared caches that outlive a single output folder
+YTSPLEET_CACHE_FOLDER = os.environ.get('YTSPLEET_CACHE_FOLDER', os.path.join(os.path.expanduser('~'), '.cache', 'yt-spleet'))
+
+# oEmbed endpoint used for title lookups (overridable for local stand-ins)
+YTSPLEET_OEMBED_URL = os.environ.get('YTSPLEET_OEMBED_URL', 'https://www.youtube.com/oembed')
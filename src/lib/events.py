@@ -0,0 +1,145 @@
+"""
+Structured per-stage event log.
+
+Every stage of every URL (title lookup, yt-dlp download, transcode, Demucs,
+file moves, ...) is reported as JSON lines with start/end timestamps,
+duration, byte counts, audio duration and the worker that ran it. At the end
+of a batch, print_stage_summary() shows which stage limits throughput.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import contextlib
+import contextvars
+from typing import Optional, TextIO
+
+from .utils import log
+from .envutils import YTSPLEET_DEFAULT_OUTPUT_FOLDER
+
+
+EVENTS_FILENAME = '.yt-spleet-events.jsonl'
+
+_current_url: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('events_url', default=None)
+
+_lock = threading.Lock()
+_sink: Optional[TextIO] = None
+_batch_id = uuid.uuid4().hex[:12]
+# (stage, duration, bytes) of every finished stage, for the summary
+_stage_records: list[tuple[str, float, int]] = []
+
+
+def events_path(output_folder: Optional[str] = None) -> str:
+    """Default location of the events file for an output folder."""
+    base_output_folder = output_folder if output_folder else YTSPLEET_DEFAULT_OUTPUT_FOLDER
+    return os.path.join(base_output_folder, EVENTS_FILENAME)
+
+
+def configure_events(path: Optional[str]):
+    """
+    Start writing events as JSON lines to path (appending).
+
+    Args:
+        path: Events file, or None to only keep the in-memory summary
+    """
+    global _sink
+    with _lock:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            _sink = open(path, 'a', buffering=1)
+
+
+def worker_id() -> str:
+    return f"{os.getpid()}/{threading.current_thread().name}"
+
+
+def emit(event: str, **fields):
+    """Write a single event, tagged with the current URL, worker and batch."""
+    record = {
+        'event': event,
+        'ts': time.time(),
+        'batch': _batch_id,
+        'url': _current_url.get(),
+        'worker': worker_id(),
+        **fields,
+    }
+    with _lock:
+        if _sink is not None:
+            _sink.write(json.dumps(record, default=str) + '\n')
+
+
+@contextlib.contextmanager
+def job(url: str):
+    """Attribute the events emitted inside the block to url."""
+    token = _current_url.set(url)
+    try:
+        yield
+    finally:
+        _current_url.reset(token)
+
+
+def record_stage(name: str, start: float, end: float, **fields):
+    """Report a stage whose boundaries were measured elsewhere."""
+    emit('stage', stage=name, start=start, end=end, duration=end - start, status='ok', **fields)
+    with _lock:
+        _stage_records.append((name, end - start, int(fields.get('bytes') or 0)))
+
+
+@contextlib.contextmanager
+def stage(name: str, **fields):
+    """
+    Time a stage, emitting stage_start and stage (end) events.
+
+    The yielded dict can be filled with extra fields known only at the end of
+    the stage, e.g. bytes or audio_duration.
+    """
+    start = time.time()
+    emit('stage_start', stage=name, start=start, **fields)
+    extra: dict = {}
+    try:
+        yield extra
+    except BaseException as e:
+        end = time.time()
+        emit('stage', stage=name, start=start, end=end, duration=end - start, status='error', error=str(e), **fields, **extra)
+        raise
+    record_stage(name, start, time.time(), **fields, **extra)
+
+
+def file_fields(*paths: str) -> dict:
+    """bytes (total size) and audio_duration (of the first file) for stage events."""
+    from .utils import probe_audio_duration
+
+    existing = [path for path in paths if path and os.path.isfile(path)]
+    fields = {'bytes': sum(os.path.getsize(path) for path in existing)}
+    if existing:
+        fields['audio_duration'] = probe_audio_duration(existing[0])
+    return fields
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def print_stage_summary():
+    """Print per-stage count, total and latency percentiles for this batch."""
+    with _lock:
+        records = list(_stage_records)
+    if not records:
+        return
+
+    by_stage: dict[str, list[tuple[float, int]]] = {}
+    for name, duration, size in records:
+        by_stage.setdefault(name, []).append((duration, size))
+
+    log("SUMMARY", f"Batch {_batch_id}")
+    print(f"{'stage':<16} {'count':>6} {'total s':>9} {'mean s':>8} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'MB':>9}")
+    for name, values in sorted(by_stage.items(), key=lambda item: -sum(d for d, _ in item[1])):
+        durations = [duration for duration, _ in values]
+        print(f"{name:<16} {len(values):>6} {sum(durations):>9.1f} {sum(durations) / len(values):>8.2f} "
+              f"{_percentile(durations, 50):>8.2f} {_percentile(durations, 95):>8.2f} {max(durations):>8.2f} "
+              f"{sum(size for _, size in values) / 1024 / 1024:>9.1f}")
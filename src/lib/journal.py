@@ -0,0 +1,163 @@
+"""
+Persistent batch journal backed by SQLite.
+
+Records the stage every URL of a batch has reached (expand, metadata,
+download, separate, done), together with the last error and the number of
+attempts, so an interrupted run can be resumed and batch progress can be
+queried without scanning the output folder.
+
+For --sync it also keeps a snapshot of the video ids of every synced
+playlist, so the next sync only has to process what changed.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from .envutils import YTSPLEET_DEFAULT_OUTPUT_FOLDER
+
+
+JOURNAL_FILENAME = '.yt-spleet-journal.sqlite3'
+
+STAGES = ('expand', 'metadata', 'download', 'separate', 'done', 'retired')
+
+
+def journal_path(output_folder: Optional[str] = None) -> str:
+    """Location of the journal for an output folder."""
+    base_output_folder = output_folder if output_folder else YTSPLEET_DEFAULT_OUTPUT_FOLDER
+    return os.path.join(base_output_folder, JOURNAL_FILENAME)
+
+
+class Journal:
+    """Per-URL job state, safe to use from the pipeline's worker threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL lets --status read while a batch is writing
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                url TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                output_path TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_stage ON jobs (stage)')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS playlist_entries (
+                playlist_url TEXT NOT NULL,
+                url TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                removed_at REAL,
+                PRIMARY KEY (playlist_url, url)
+            )
+        ''')
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def add(self, urls: list[str]):
+        """Record newly expanded URLs (already known URLs keep their state)."""
+        now = time.time()
+        with self._lock:
+            start = self._conn.execute('SELECT COALESCE(MAX(position), -1) + 1 FROM jobs').fetchone()[0]
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO jobs (url, position, stage, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                [(url, start + i, 'expand', now, now) for i, url in enumerate(urls)]
+            )
+            self._conn.execute('COMMIT')
+
+    def start(self, url: str):
+        """Begin a new attempt at a URL."""
+        self._execute('UPDATE jobs SET stage = ?, error = NULL, attempts = attempts + 1, updated_at = ? WHERE url = ?',
+                      ('metadata', time.time(), url))
+
+    def mark(self, url: str, stage: str, output_path: Optional[str] = None):
+        """Record that a URL has reached a stage."""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown journal stage: {stage}")
+        self._execute('UPDATE jobs SET stage = ?, output_path = COALESCE(?, output_path), updated_at = ? WHERE url = ?',
+                      (stage, output_path, time.time(), url))
+
+    def fail(self, url: str, error: str):
+        """Record an error at the URL's current stage."""
+        self._execute('UPDATE jobs SET error = ?, updated_at = ? WHERE url = ?', (error, time.time(), url))
+
+    def unfinished(self) -> list[str]:
+        """URLs that are not done (or retired), in the order they were added."""
+        return [row[0] for row in self._execute("SELECT url FROM jobs WHERE stage NOT IN ('done', 'retired') ORDER BY position")]
+
+    def done_urls(self) -> set[str]:
+        return {row[0] for row in self._execute("SELECT url FROM jobs WHERE stage = 'done'")}
+
+    def summary(self) -> dict[str, int]:
+        """Number of URLs per stage, plus 'failed' for URLs whose last attempt errored."""
+        counts = {stage: 0 for stage in STAGES}
+        for stage, count in self._execute('SELECT stage, COUNT(*) FROM jobs GROUP BY stage'):
+            counts[stage] = count
+        counts['failed'] = self._execute('SELECT COUNT(*) FROM jobs WHERE error IS NOT NULL')[0][0]
+        return counts
+
+    def failures(self) -> list[tuple[str, str, str, int]]:
+        """(url, stage, error, attempts) of URLs whose last attempt errored."""
+        return self._execute('SELECT url, stage, error, attempts FROM jobs WHERE error IS NOT NULL ORDER BY position')
+
+    def sync_playlist(self, playlist_url: str, urls: list[str]) -> list[str]:
+        """
+        Replace the snapshot of a playlist with a complete listing.
+
+        Args:
+            playlist_url: Playlist URL as given on the command line
+            urls: Video URLs the playlist lists now, in order
+
+        Returns:
+            URLs that were in the previous snapshot but are no longer listed
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('''
+                INSERT INTO playlist_entries (playlist_url, url, position, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (playlist_url, url) DO UPDATE SET
+                    position = excluded.position, last_seen = excluded.last_seen, removed_at = NULL
+            ''', [(playlist_url, url, position, now, now) for position, url in enumerate(urls)])
+            removed = [row[0] for row in self._conn.execute(
+                'SELECT url FROM playlist_entries WHERE playlist_url = ? AND last_seen < ? AND removed_at IS NULL ORDER BY position',
+                (playlist_url, now)
+            )]
+            self._conn.execute(
+                'UPDATE playlist_entries SET removed_at = ? WHERE playlist_url = ? AND last_seen < ? AND removed_at IS NULL',
+                (now, playlist_url, now)
+            )
+            self._conn.execute('COMMIT')
+        return removed
+
+    def still_listed(self, url: str) -> bool:
+        """Whether any synced playlist still lists url."""
+        return bool(self._execute('SELECT 1 FROM playlist_entries WHERE url = ? AND removed_at IS NULL LIMIT 1', (url,)))
+
+    def playlists(self) -> list[tuple[str, int, int, float]]:
+        """(playlist_url, listed, removed, last_sync) of every synced playlist."""
+        return self._execute('''
+            SELECT playlist_url, SUM(removed_at IS NULL), SUM(removed_at IS NOT NULL), MAX(last_seen)
+            FROM playlist_entries GROUP BY playlist_url ORDER BY playlist_url
+        ''')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
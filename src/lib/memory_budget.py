@@ -0,0 +1,107 @@
+"""
+Memory-aware admission of separations.
+
+Demucs holds the whole decoded track and all of its separated sources in
+memory, so its peak memory grows with the length of the input. Every
+separation reserves its estimated peak from a shared budget before it starts
+and waits while the budget is used up. An input whose estimate exceeds the
+whole budget goes through the windowed (bounded-memory) path instead, and runs
+on its own if even that doesn't fit.
+"""
+import threading
+import contextlib
+from typing import Iterator, Optional
+
+from .cpu_budget import available_memory_mb
+from .demucs_chunked import DEFAULT_WINDOW_SECONDS, DEFAULT_OVERLAP_SECONDS
+from .utils import log
+
+
+# Model weights, torch runtime and encoders of one separation
+DEMUCS_BASE_MEMORY_MB = 1000
+# Decoded input, the separated sources and their intermediate copies, per minute of audio
+DEMUCS_MEMORY_MB_PER_MINUTE = 250
+# Share of the memory available at start-up used by default
+DEFAULT_MEMORY_BUDGET_FRACTION = 0.8
+
+
+def memory_log(*msgs: str):
+    log("MEMORY", *msgs)
+
+
+def estimate_separation_mb(duration_seconds: Optional[float], chunked: bool = False) -> float:
+    """
+    Estimated peak memory of separating an input.
+
+    Args:
+        duration_seconds: Length of the input (None if unknown: a typical track is assumed)
+        chunked: Whether it goes through the windowed path, whose peak depends on the window only
+    """
+    if chunked:
+        duration_seconds = DEFAULT_WINDOW_SECONDS + DEFAULT_OVERLAP_SECONDS
+    elif duration_seconds is None:
+        duration_seconds = 5 * 60
+    return DEMUCS_BASE_MEMORY_MB + DEMUCS_MEMORY_MB_PER_MINUTE * duration_seconds / 60
+
+
+def default_memory_budget_mb() -> Optional[float]:
+    """DEFAULT_MEMORY_BUDGET_FRACTION of the available memory, or None where it can't be read."""
+    memory_mb = available_memory_mb()
+    return memory_mb * DEFAULT_MEMORY_BUDGET_FRACTION if memory_mb is not None else None
+
+
+class MemoryBudget:
+    """Megabytes shared by the separations running at the same time."""
+
+    def __init__(self, budget_mb: float):
+        self.budget_mb = budget_mb
+        self.reserved_mb = 0.0
+        self._running = 0
+        self._condition = threading.Condition()
+
+    def fits(self, mb: float) -> bool:
+        """Whether a separation of this size fits in the budget at all."""
+        return mb <= self.budget_mb
+
+    @contextlib.contextmanager
+    def reserve(self, mb: float) -> Iterator[None]:
+        """
+        Hold mb of the budget, waiting until it is free. A reservation larger
+        than the whole budget waits until nothing else runs, then runs alone.
+        """
+        with self._condition:
+            waited = False
+            while self._running and self.reserved_mb + mb > self.budget_mb:
+                if not waited:
+                    memory_log(f"Waiting for {mb:.0f} MB ({self.reserved_mb:.0f} of {self.budget_mb:.0f} MB in use)")
+                    waited = True
+                self._condition.wait()
+            self.reserved_mb += mb
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.reserved_mb -= mb
+                self._running -= 1
+                self._condition.notify_all()
+
+
+_budget: Optional[MemoryBudget] = None
+
+
+def configure_memory_budget(budget_mb: Optional[float]):
+    """
+    Set up the budget separations are admitted by.
+
+    Args:
+        budget_mb: Budget in MB, or None/0 to admit every separation straight away
+    """
+    global _budget
+    _budget = MemoryBudget(budget_mb) if budget_mb else None
+    if _budget is not None:
+        memory_log(f"Separation memory budget: {budget_mb:.0f} MB")
+
+
+def memory_budget() -> Optional[MemoryBudget]:
+    return _budget
@@ -0,0 +1,244 @@
+"""
+Video metadata (title) lookups with an on-disk cache.
+
+Titles come from the oEmbed endpoint. A batch looks its titles up in the
+background as its video ids arrive, concurrently and over keep-alive
+connections (one per lookup thread), and stores them in a SQLite cache keyed
+by video id with a TTL, so repeat runs and playlist re-syncs make no metadata
+requests at all.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+import http.client
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from .envutils import YTSPLEET_CACHE_FOLDER, YTSPLEET_OEMBED_URL
+from .utils import log
+
+
+DEFAULT_METADATA_CACHE_PATH = os.path.join(YTSPLEET_CACHE_FOLDER, 'metadata.sqlite3')
+DEFAULT_METADATA_TTL_DAYS = 30.0
+DEFAULT_LOOKUP_WORKERS = 8
+OEMBED_TIMEOUT_SECONDS = 15
+
+
+def metadata_log(*msgs: str):
+    log("METADATA", *msgs)
+
+
+class MetadataCache:
+    """Video id -> title, safe to use from the pipeline's worker threads."""
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        ''')
+
+    def get_many(self, video_ids: list[str]) -> dict[str, str]:
+        """Titles of the given videos that are cached and not expired."""
+        titles = {}
+        oldest = time.time() - self.ttl_seconds
+        with self._lock:
+            # Stay below SQLite's bound parameter limit
+            for start in range(0, len(video_ids), 500):
+                chunk = video_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT video_id, title FROM videos WHERE fetched_at >= ? AND video_id IN ({','.join('?' * len(chunk))})",
+                    (oldest, *chunk)
+                ).fetchall()
+                titles.update(rows)
+        return titles
+
+    def get(self, video_id: str) -> Optional[str]:
+        return self.get_many([video_id]).get(video_id)
+
+    def put_many(self, titles: dict[str, str]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO videos (video_id, title, fetched_at) VALUES (?, ?, ?)',
+                [(video_id, title, now) for video_id, title in titles.items()]
+            )
+            self._conn.execute('COMMIT')
+
+    def put(self, video_id: str, title: str):
+        self.put_many({video_id: title})
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class OEmbedClient:
+    """oEmbed title lookups over one keep-alive HTTP connection per thread."""
+
+    def __init__(self, endpoint: str = YTSPLEET_OEMBED_URL):
+        parsed = urllib.parse.urlsplit(endpoint)
+        self._https = parsed.scheme == 'https'
+        self._host = parsed.netloc
+        self._path = parsed.path or '/'
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            connection_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            conn = self._local.conn = connection_class(self._host, timeout=OEMBED_TIMEOUT_SECONDS)
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def fetch_title(self, video_id: str) -> str:
+        """
+        Fetch the (raw) title of a video.
+
+        Raises:
+            Exception: If the lookup fails or returns no title
+        """
+        query = urllib.parse.urlencode({'url': f'https://www.youtube.com/watch?v={video_id}', 'format': 'json'})
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request('GET', f'{self._path}?{query}')
+                response = conn.getresponse()
+                # Read the body completely so the connection can be reused
+                body = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self._reset()
+                # The server may have closed an idle keep-alive connection
+                if attempt == 1:
+                    raise
+        if response.status != 200:
+            raise Exception(f"oEmbed returned HTTP {response.status} for {video_id}")
+        title = json.loads(body.decode()).get('title')
+        if not title:
+            raise ValueError(f"Could not get title for video ID: {video_id}")
+        return title
+
+
+_cache: Optional[MetadataCache] = None
+_client = OEmbedClient()
+_prefetcher: Optional['TitlePrefetcher'] = None
+
+
+def configure_metadata_cache(path: Optional[str] = DEFAULT_METADATA_CACHE_PATH, ttl_days: float = DEFAULT_METADATA_TTL_DAYS):
+    """
+    Set up the title cache.
+
+    Args:
+        path: SQLite cache file, or None to keep titles in memory for this run only
+        ttl_days: Age after which cached titles are looked up again
+    """
+    global _cache
+    if _cache is not None:
+        _cache.close()
+    _cache = MetadataCache(path or ':memory:', ttl_days * 24 * 3600)
+
+
+def metadata_cache() -> MetadataCache:
+    if _cache is None:
+        configure_metadata_cache(None)
+    return _cache
+
+
+def lookup_title(video_id: str) -> Optional[str]:
+    """
+    Raw title of a video, from the cache or the oEmbed endpoint.
+
+    Returns:
+        The title, or None if it could not be looked up
+    """
+    if _prefetcher is not None and _prefetcher.wait(video_id):
+        # Already looked up in the background (None if that failed)
+        return _prefetcher.result(video_id)
+    title = metadata_cache().get(video_id)
+    if title is not None:
+        return title
+    return _fetch_and_store(video_id)
+
+
+def _fetch_and_store(video_id: str) -> Optional[str]:
+    try:
+        title = _client.fetch_title(video_id)
+    except Exception as e:
+        metadata_log(f"Error getting title for {video_id}: {e}")
+        return None
+    metadata_cache().put(video_id, title)
+    return title
+
+
+class TitlePrefetcher:
+    """Looks titles up in the background as the video ids of a batch arrive."""
+
+    def __init__(self, workers: int = DEFAULT_LOOKUP_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='metadata')
+        self._lock = threading.Lock()
+        self._pending: dict[str, Future] = {}
+        self.cached = 0
+        self.requested = 0
+
+    def submit(self, video_id: str):
+        """Start looking a title up, unless it is cached or already on its way."""
+        with self._lock:
+            if video_id in self._pending:
+                return
+            if metadata_cache().get(video_id) is not None:
+                self.cached += 1
+                return
+            self.requested += 1
+            self._pending[video_id] = self._executor.submit(_fetch_and_store, video_id)
+
+    def wait(self, video_id: str) -> bool:
+        """Wait for a lookup started by submit(); False if there is none."""
+        with self._lock:
+            future = self._pending.get(video_id)
+        if future is None:
+            return False
+        future.result()
+        return True
+
+    def result(self, video_id: str) -> Optional[str]:
+        """Title found by a finished lookup (None if it failed)."""
+        with self._lock:
+            return self._pending[video_id].result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        metadata_log(f"{self.cached} title(s) were cached, looked up {self.requested}")
+
+
+def start_title_prefetch(workers: int = DEFAULT_LOOKUP_WORKERS) -> TitlePrefetcher:
+    """Start a prefetcher that get_video_title() waits on for titles it is fetching."""
+    global _prefetcher
+    _prefetcher = TitlePrefetcher(workers)
+    return _prefetcher
+
+
+def stop_title_prefetch():
+    global _prefetcher
+    if _prefetcher is not None:
+        _prefetcher.close()
+        _prefetcher = None
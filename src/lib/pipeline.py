@@ -0,0 +1,148 @@
+"""
+Two-stage download -> separation pipeline.
+
+Downloads (network bound) and separations (CPU bound) run in separate,
+independently sized worker pools connected by a bounded queue. When the
+separation stage falls behind, the queue fills up and download workers block
+instead of piling up finished downloads.
+"""
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional
+
+from .utils import log
+
+
+def pipeline_log(*msgs: str):
+    log("PIPELINE", *msgs)
+
+
+# Marks the end of a work queue
+_DONE = object()
+
+
+def default_download_workers() -> int:
+    """Downloads mostly wait on the network, so a handful in flight is enough."""
+    return 4
+
+
+@dataclass
+class PipelineResult:
+    """Outcome of a single item that went through the pipeline."""
+    item: Any
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
+def run_pipeline(
+    items: Iterable[Any],
+    download_fn: Callable[[Any], Any],
+    separate_fn: Callable[[Any, Any], Any],
+    download_workers: int,
+    separate_workers: int,
+    queue_size: Optional[int] = None,
+) -> List[PipelineResult]:
+    """
+    Run every item through download_fn, then through separate_fn.
+
+    download_fn(item) returns the value handed to the separation stage, or
+    None if the item is finished after downloading (e.g. --dl-only).
+    separate_fn(item, downloaded) performs the separation.
+
+    Args:
+        items: Work items, consumed lazily
+        download_fn: Download stage callable
+        separate_fn: Separation stage callable
+        download_workers: Number of concurrent downloads
+        separate_workers: Number of concurrent separations
+        queue_size: Maximum number of downloaded items waiting for separation
+            (default: 2 per separation worker)
+
+    Returns:
+        One PipelineResult per item, in input order
+
+    Raises:
+        The exception the items iterator raised, once the items it had
+        yielded before have been processed
+    """
+    download_workers = max(1, download_workers)
+    separate_workers = max(1, separate_workers)
+    if queue_size is None:
+        queue_size = 2 * separate_workers
+
+    pending_downloads: queue.Queue = queue.Queue(maxsize=download_workers)
+    pending_separations: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+
+    results: dict[int, PipelineResult] = {}
+    results_lock = threading.Lock()
+
+    def record(index: int, result: PipelineResult):
+        with results_lock:
+            results[index] = result
+
+    # Raised by the items iterator (e.g. a failing playlist expansion)
+    feed_errors: list[BaseException] = []
+
+    def feed():
+        try:
+            for index, item in enumerate(items):
+                pending_downloads.put((index, item))
+        except BaseException as e:
+            pipeline_log(f"Reading the work items failed, finishing the ones read so far: {e}")
+            feed_errors.append(e)
+        finally:
+            for _ in range(download_workers):
+                pending_downloads.put(_DONE)
+
+    def download_worker():
+        while True:
+            work = pending_downloads.get()
+            if work is _DONE:
+                return
+            index, item = work
+            try:
+                downloaded = download_fn(item)
+            except Exception as e:
+                record(index, PipelineResult(item, error=e))
+                continue
+            if downloaded is None:
+                record(index, PipelineResult(item))
+            else:
+                # Blocks while the separation stage is saturated
+                pending_separations.put((index, item, downloaded))
+
+    def separate_worker():
+        while True:
+            work = pending_separations.get()
+            if work is _DONE:
+                return
+            index, item, downloaded = work
+            try:
+                record(index, PipelineResult(item, result=separate_fn(item, downloaded)))
+            except Exception as e:
+                record(index, PipelineResult(item, error=e))
+
+    pipeline_log(f"Starting with {download_workers} download worker(s), "
+                 f"{separate_workers} separation worker(s), queue size {queue_size}")
+
+    feeder = threading.Thread(target=feed, name="pipeline-feed", daemon=True)
+    downloaders = [threading.Thread(target=download_worker, name=f"download-{i}", daemon=True)
+                   for i in range(download_workers)]
+    separators = [threading.Thread(target=separate_worker, name=f"separate-{i}", daemon=True)
+                  for i in range(separate_workers)]
+
+    for thread in [feeder, *downloaders, *separators]:
+        thread.start()
+
+    feeder.join()
+    for thread in downloaders:
+        thread.join()
+    for _ in separators:
+        pending_separations.put(_DONE)
+    for thread in separators:
+        thread.join()
+
+    if feed_errors:
+        raise feed_errors[0]
+    return [results[index] for index in sorted(results)]
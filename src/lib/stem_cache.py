@@ -0,0 +1,216 @@
+"""
+Content-addressed cache of separated stems.
+
+Entries are keyed by a hash of the decoded input audio plus the separation
+parameters, so identical audio is only separated once no matter which output
+folder (or file name) it shows up under. The cache is size-limited and evicts
+the least recently used entries first.
+"""
+import os
+import shutil
+import hashlib
+import subprocess
+import threading
+import time
+import uuid
+from typing import Optional
+
+from .envutils import YTSPLEET_CACHE_FOLDER
+from .utils import log, link_or_copy
+
+
+# Bump when the cache layout or key derivation changes
+STEM_CACHE_VERSION = 1
+
+DEFAULT_STEM_CACHE_FOLDER = os.path.join(YTSPLEET_CACHE_FOLDER, 'stems')
+DEFAULT_STEM_CACHE_SIZE_GB = 10.0
+
+
+def cache_log(*msgs: str):
+    log("STEM CACHE", *msgs)
+
+
+def hash_decoded_audio(audio_path: str) -> str:
+    """
+    Hash the decoded PCM of an audio file.
+
+    Hashing the decoded samples rather than the file bytes means re-muxed
+    copies of the same audio (different tags, container) share a key.
+
+    Args:
+        audio_path: Path to the audio file
+
+    Returns:
+        Hex sha256 digest of the decoded audio
+    """
+    cmd = [
+        'ffmpeg',
+        '-v', 'error',
+        '-i', audio_path,
+        '-map', '0:a:0',
+        '-f', 's16le',
+        '-ac', '2',
+        '-ar', '44100',
+        '-',
+    ]
+    digest = hashlib.sha256()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    for chunk in iter(lambda: process.stdout.read(1 << 20), b''):
+        digest.update(chunk)
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        raise Exception(f"Failed to decode {audio_path} for hashing: {stderr.decode(errors='replace')}")
+    return digest.hexdigest()
+
+
+def stem_cache_key(audio_path: str, model: str, stem_mode: str, codec: str) -> str:
+    """
+    Build the cache key for separating audio_path with the given parameters.
+
+    Args:
+        audio_path: Path to the input audio file
+        model: Demucs model name
+        stem_mode: Stem mode (e.g. 'vocals' for two-stem vocals/no_vocals)
+        codec: Output codec of the stems
+
+    Returns:
+        Hex cache key
+    """
+    audio_hash = hash_decoded_audio(audio_path)
+    params = f"v{STEM_CACHE_VERSION}|{audio_hash}|{model}|{stem_mode}|{codec}"
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+class StemCache:
+    """Size-limited, LRU-evicted store of stem files keyed by stem_cache_key."""
+
+    def __init__(self, root: str = DEFAULT_STEM_CACHE_FOLDER, max_bytes: int = int(DEFAULT_STEM_CACHE_SIZE_GB * 1024 ** 3)):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def lookup(self, key: str, targets: dict[str, str]) -> bool:
+        """
+        Materialize a cached entry at the target paths.
+
+        Args:
+            key: Cache key
+            targets: Mapping of stem name to destination path
+
+        Returns:
+            True on a cache hit (all targets written), False otherwise
+        """
+        entry_dir = self._entry_dir(key)
+        # Entries are stored as <stem><ext>, with the extension of the target
+        sources = {stem: os.path.join(entry_dir, f'{stem}{os.path.splitext(path)[1]}') for stem, path in targets.items()}
+        if not all(os.path.isfile(path) for path in sources.values()):
+            return False
+
+        try:
+            for stem, target in targets.items():
+                link_or_copy(sources[stem], target)
+
+            # Mark as recently used
+            now = time.time()
+            os.utime(entry_dir, (now, now))
+        except OSError as e:
+            # Evicted by another worker in the meantime
+            cache_log(f"Warning: could not reuse {key[:12]}: {e}")
+            return False
+        cache_log(f"Hit {key[:12]}: reused {len(targets)} stem(s)")
+        return True
+
+    def store(self, key: str, sources: dict[str, str]):
+        """
+        Add freshly separated stems to the cache.
+
+        Args:
+            key: Cache key
+            sources: Mapping of stem name to the separated file
+        """
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return
+
+        # Populate a private directory and rename it into place, so readers
+        # never see a partial entry
+        staging_dir = os.path.join(self.root, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(staging_dir)
+        try:
+            for stem, source in sources.items():
+                ext = os.path.splitext(source)[1]
+                link_or_copy(source, os.path.join(staging_dir, f'{stem}{ext}'))
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            os.rename(staging_dir, entry_dir)
+            cache_log(f"Stored {key[:12]}")
+        except OSError as e:
+            cache_log(f"Warning: could not store {key[:12]}: {e}")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return
+
+        # The stems are separated already, a failing eviction must not fail the job
+        try:
+            self.evict()
+        except Exception as e:
+            cache_log(f"Warning: eviction failed: {e}")
+
+    @staticmethod
+    def _entry_usage(entry_dir: str) -> Optional[tuple[float, int]]:
+        """(mtime, bytes) of an entry, or None if it is gone."""
+        try:
+            size = 0
+            for name in os.listdir(entry_dir):
+                try:
+                    size += os.stat(os.path.join(entry_dir, name)).st_size
+                except FileNotFoundError:
+                    continue
+            return os.path.getmtime(entry_dir), size
+        except FileNotFoundError:
+            # Evicted concurrently
+            return None
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        with self._evict_lock:
+            entries = []
+            total = 0
+            for shard in os.listdir(self.root):
+                shard_dir = os.path.join(self.root, shard)
+                if shard.startswith('.') or not os.path.isdir(shard_dir):
+                    continue
+                try:
+                    keys = os.listdir(shard_dir)
+                except FileNotFoundError:
+                    continue
+                for key in keys:
+                    entry_dir = os.path.join(shard_dir, key)
+                    usage = self._entry_usage(entry_dir)
+                    if usage is None:
+                        continue
+                    entries.append((usage[0], usage[1], entry_dir))
+                    total += usage[1]
+
+            entries.sort()
+            for _, size, entry_dir in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                cache_log(f"Evicted {os.path.basename(entry_dir)[:12]}")
+
+
+def create_stem_cache(cache_dir: Optional[str], size_gb: float) -> Optional[StemCache]:
+    """
+    Create the stem cache, or None if it is disabled.
+
+    Args:
+        cache_dir: Cache directory (None disables the cache)
+        size_gb: Size limit in GB
+    """
+    if not cache_dir:
+        return None
+    return StemCache(cache_dir, int(size_gb * 1024 ** 3))
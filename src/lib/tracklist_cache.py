@@ -0,0 +1,118 @@
+"""
+On-disk cache of LLM-parsed tracklists.
+
+A tracklist the LLM parsed is stored under a hash of the comment text, the
+model and the prompt version, so parsing the same comment again (e.g.
+re-running --guess-chapters on a URL) costs a SQLite lookup instead of an API
+call. The least recently used entries are evicted beyond a size limit.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from dataclasses import asdict
+from typing import TYPE_CHECKING, Optional
+
+from .envutils import YTSPLEET_CACHE_FOLDER
+from .utils import log
+
+if TYPE_CHECKING:
+    from .tracklist_parser import Tracklist
+
+
+DEFAULT_TRACKLIST_CACHE_PATH = os.path.join(YTSPLEET_CACHE_FOLDER, 'tracklists.sqlite3')
+DEFAULT_TRACKLIST_CACHE_ENTRIES = 10000
+
+
+def tracklist_cache_log(*msgs: str):
+    log("TRACKLIST CACHE", *msgs)
+
+
+def tracklist_cache_key(comment_text: str, model: str, prompt_version: int) -> str:
+    """Cache key of a comment parsed by model with a version of the prompt."""
+    digest = hashlib.sha256()
+    for part in (str(prompt_version), model, comment_text):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class TracklistCache:
+    """Cache key -> parsed tracks, safe to use from the pipeline's worker threads."""
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_TRACKLIST_CACHE_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # Losing the last entries on a power cut only costs a repeated API call
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS tracklists (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                tracks TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS tracklists_last_used ON tracklists (last_used)')
+
+    def get(self, key: str) -> Optional['Tracklist']:
+        """The cached tracklist, or None."""
+        from .tracklist_parser import Track, Tracklist
+
+        with self._lock:
+            row = self._conn.execute('SELECT tracks FROM tracklists WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE tracklists SET last_used = ? WHERE key = ?', (time.time(), key))
+        return Tracklist(tracks=[Track(**track) for track in json.loads(row[0])], parser='llm')
+
+    def put(self, key: str, model: str, tracklist: 'Tracklist'):
+        tracks = json.dumps([asdict(track) for track in tracklist.tracks])
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO tracklists (key, model, tracks, created_at, last_used) VALUES (?, ?, ?, ?, ?)',
+                (key, model, tracks, now, now)
+            )
+            evicted = self._conn.execute(
+                'DELETE FROM tracklists WHERE key IN (SELECT key FROM tracklists ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            ).rowcount
+        if evicted:
+            tracklist_cache_log(f"Evicted {evicted} least recently used tracklist(s)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[TracklistCache] = None
+
+
+def configure_tracklist_cache(path: Optional[str] = DEFAULT_TRACKLIST_CACHE_PATH, max_entries: int = DEFAULT_TRACKLIST_CACHE_ENTRIES):
+    """
+    Set up the tracklist cache.
+
+    Args:
+        path: SQLite cache file, or None to keep parsed tracklists in memory for this run only
+        max_entries: Number of tracklists kept before the least recently used are evicted
+    """
+    global _cache
+    if _cache is not None:
+        _cache.close()
+    _cache = TracklistCache(path or ':memory:', max_entries)
+
+
+def tracklist_cache() -> TracklistCache:
+    if _cache is None:
+        configure_tracklist_cache(None)
+    return _cache
@@ -1,14 +1,29 @@
 """
-Tracklist parser using LLM to extract track information from YouTube comments.
+Tracklist parser extracting track information from YouTube comments.
+
+Tracklists are looked for in the video's chapters and description first,
+then in its top comments, fetched in growing rounds until one is found.
+Plain tracklists ("MM:SS Artist - Title" lines and their variations) are
+parsed locally; comments the local parser is not confident about go to an LLM.
 """
 import os
 import re
 import json
-import subprocess
 import tempfile
-from typing import Optional
+import threading
+from typing import Callable, Optional
 from dataclasses import dataclass
 
+from .ytdl import run_ytdl_json
+from .tracklist_cache import tracklist_cache, tracklist_cache_key
+from . import events
+
+
+# Local parses at least this confident are used without asking the LLM
+DEFAULT_MIN_CONFIDENCE = 0.8
+# Bump when the LLM prompt changes, so tracklists cached for the old prompt aren't reused
+LLM_PROMPT_VERSION = 1
+
 
 @dataclass
 class Track:
@@ -24,6 +39,35 @@ class Track:
 class Tracklist:
     """Parsed tracklist from a comment."""
     tracks: list[Track]
+    # 'heuristic' or 'llm' for tracklists parsed from text, 'chapters' for the video's chapters
+    parser: Optional[str] = None
+    # Confidence of the local parse (also kept when the LLM was used instead)
+    confidence: Optional[float] = None
+
+
+def tracklist_from_chapters(chapters: list[dict]) -> Tracklist:
+    """
+    Build a Tracklist from yt-dlp chapter entries.
+    
+    Args:
+        chapters: Chapter dicts with 'title' and 'start_time' (seconds)
+        
+    Returns:
+        Tracklist with one track per chapter
+    """
+    tracks = []
+    for i, chapter in enumerate(chapters, start=1):
+        start_seconds = int(chapter.get('start_time') or 0)
+        hours, remainder = divmod(start_seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        tracks.append(Track(
+            number=i,
+            title=chapter.get('title') or f"Chapter {i}",
+            artist=None,
+            start_time=f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}",
+            start_seconds=start_seconds
+        ))
+    return Tracklist(tracks=tracks)
 
 
 def extract_comment_id_from_url(url: str) -> Optional[str]:
@@ -42,71 +86,137 @@ def extract_comment_id_from_url(url: str) -> Optional[str]:
     return None
 
 
-def fetch_youtube_comment_via_ytdlp(url: str, comment_id: Optional[str] = None) -> str:
+# Top comments fetched first while looking for a tracklist (the pinned comment
+# comes first). yt-dlp can't continue a comment listing, so a miss fetches the
+# rest up to --max-comments in one go rather than in several growing rounds
+# that each fetch the earlier comments again. No lookup fetches more than
+# --max-comments comments.
+FIRST_COMMENT_ROUND = 20
+DEFAULT_MAX_COMMENTS = 500
+# Tracklist-like lines a text needs to be taken for a tracklist
+MIN_TRACKLIST_LINES = 3
+
+
+def looks_like_tracklist(text: str) -> bool:
+    """Whether text has at least MIN_TRACKLIST_LINES timestamped lines."""
+    return sum(1 for line in text.splitlines() if _match_track_line(line)) >= MIN_TRACKLIST_LINES
+
+
+def fetch_video_info(url: str) -> dict:
+    """Fetch a video's info (chapters, description) without its comments."""
+    cmd = [
+        'yt-dlp',
+        '--skip-download',
+        '--dump-json',
+        '--no-playlist',
+        url
+    ]
+    return run_ytdl_json(cmd, "YTDL (info)")[0]
+
+
+def fetch_video_comments(url: str, max_comments: int, replies: bool = False) -> dict:
     """
-    Fetch YouTube comment(s) using yt-dlp.
+    Fetch a video's info with at most max_comments of its top comments.
     
     Args:
         url: YouTube video URL
-        comment_id: Optional specific comment ID to find (from lc= parameter)
+        max_comments: Top-level comments to fetch
+        replies: Also fetch (up to max_comments) replies
         
     Returns:
-        The comment text content
+        The video's info dict, with 'comments'
     """
-    print(f"Fetching comments via yt-dlp...")
-    
-    # Use yt-dlp to get video info with comments
     cmd = [
         'yt-dlp',
         '--write-comments',
         '--skip-download',
         '--dump-json',
+        '--no-playlist',
+        '--extractor-args', f"youtube:comment_sort=top;max_comments={max_comments},all,{max_comments if replies else 0}",
         url
     ]
+    return run_ytdl_json(cmd, "YTDL (comments)")[0]
+
+
+def _find_comment(comments: list[dict], comment_id: str) -> Optional[str]:
+    for comment in comments:
+        if comment.get('id') == comment_id:
+            return comment.get('text', '')
+    # The comment might be formatted differently, try partial match
+    for comment in comments:
+        cid = comment.get('id', '')
+        if cid and (comment_id in cid or cid in comment_id):
+            return comment.get('text', '')
+    return None
+
+
+def fetch_tracklist_source(url: str, comment_id: Optional[str] = None,
+                           max_comments: int = DEFAULT_MAX_COMMENTS) -> tuple[str, object]:
+    """
+    Find a video's tracklist, fetching as few comments as possible.
     
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
-        
-        comments = data.get('comments', [])
-        if not comments:
-            raise ValueError("No comments found on this video")
+    The linked comment (lc= parameter) is used if given; otherwise the
+    chapters, then the description, then the first tracklist-like top
+    comment. Chapters and description are looked at in the video's info
+    before any comments are fetched. The first FIRST_COMMENT_ROUND comments
+    are fetched next and the rest up to max_comments only if they don't have
+    what is looked for; comments already looked at are not looked at again.
+    
+    Args:
+        url: YouTube video URL
+        comment_id: Optional specific comment ID to find (from lc= parameter)
+        max_comments: Most top-level comments to fetch
         
-        print(f"Found {len(comments)} comments")
+    Returns:
+        ('chapters', chapter dicts), or ('comment' or 'description', text)
+    """
+    rounds = [FIRST_COMMENT_ROUND, max_comments] if FIRST_COMMENT_ROUND < max_comments else [max_comments]
+    # A reply's ID is "<parent ID>.<reply ID>"
+    replies = bool(comment_id and '.' in comment_id)
+    comments = []
+    searched = 0
+    
+    try:
+        if not comment_id:
+            info = fetch_video_info(url)
+            if info.get('chapters'):
+                print(f"Using the video's {len(info['chapters'])} chapters")
+                return 'chapters', info['chapters']
+            if looks_like_tracklist(info.get('description') or ''):
+                print("Found tracklist in the description")
+                return 'description', info['description']
         
-        # If we have a specific comment ID, find it
-        if comment_id:
-            for comment in comments:
-                if comment.get('id') == comment_id:
-                    return comment.get('text', '')
+        for count in rounds:
+            print(f"Fetching up to {count} comments via yt-dlp...")
+            comments = fetch_video_comments(url, count, replies).get('comments') or []
+            print(f"Found {len(comments)} comments")
             
-            # Comment ID not found - maybe it's a reply, check all
-            print(f"Comment ID {comment_id} not found in top-level comments, checking all...")
-            # The comment might be formatted differently, try partial match
-            for comment in comments:
-                cid = comment.get('id', '')
-                if comment_id in cid or cid in comment_id:
-                    return comment.get('text', '')
+            # The top comments of the previous round come first again
+            new_comments = comments[searched:]
+            searched = len(comments)
+            if comment_id:
+                text = _find_comment(new_comments, comment_id)
+                if text is not None:
+                    return 'comment', text
+            else:
+                for comment in new_comments:
+                    text = comment.get('text', '')
+                    if looks_like_tracklist(text):
+                        print(f"Found tracklist-like comment")
+                        return 'comment', text
             
-            raise ValueError(f"Comment {comment_id} not found in video comments")
-        
-        # No specific ID - return the first comment (usually pinned/top)
-        # Or we could return all comments and let the LLM figure it out
-        # For tracklists, they're often pinned or in the first few comments
-        
-        # Look for a comment that looks like a tracklist (has timestamps)
-        for comment in comments[:20]:  # Check first 20 comments
-            text = comment.get('text', '')
-            # Look for timestamp patterns like "0:00" or "1:23:45"
-            if re.search(r'\d+:\d{2}', text):
-                print(f"Found tracklist-like comment")
-                return text
-        
-        # Fallback to first comment
-        return comments[0].get('text', '')
-        
-    except subprocess.CalledProcessError as e:
-        raise Exception(f"Failed to fetch comments: {e.stderr}")
+            # Fewer than asked for: there are no more comments to look at
+            if len(comments) < count:
+                break
+    except Exception as e:
+        raise Exception(f"Failed to fetch comments: {e}")
+    
+    if comment_id:
+        raise ValueError(f"Comment {comment_id} not found in the top {len(comments)} comments")
+    if not comments:
+        raise ValueError("No comments found on this video")
+    # Fallback to first comment (usually pinned/top)
+    return 'comment', comments[0].get('text', '')
 
 
 def parse_timestamp_to_seconds(timestamp: str) -> int:
@@ -141,21 +251,123 @@ def parse_timestamp_to_seconds(timestamp: str) -> int:
         return -1
 
 
-def parse_tracklist_with_llm(comment_text: str, model: str = "gpt-5-mini") -> Tracklist:
+TIMESTAMP_PATTERN = r'(?:\d{1,2}:)?\d{1,2}:\d{2}'
+# "1. ", "01) ", "#1 ", "[01] " in front of a line or a title
+_NUMBERING = re.compile(r'^\s*(?:#\d{1,3}|\d{1,3}[.)]|\[\d{1,3}\])\s*')
+# Timestamp first: "0:00 Artist - Title", "[1:02:03] Title", "0:00 - 3:45 | Title"
+_LEADING_TIMESTAMP = re.compile(
+    rf'^[\[(]?(?P<ts>{TIMESTAMP_PATTERN})[\])]?'
+    rf'(?:\s*[-–~]\s*[\[(]?{TIMESTAMP_PATTERN}[\])]?)?'  # End of a range
+    r'\s*(?:[-–—|:.]+\s*)?(?P<rest>.*)$'
+)
+# Timestamp last: "Artist - Title 0:00", "Title (1:02:03)"
+_TRAILING_TIMESTAMP = re.compile(rf'^(?P<rest>.*?\S)\s*[-–—|@]?\s*[\[(]?(?P<ts>{TIMESTAMP_PATTERN})[\])]?$')
+_ARTIST_SEPARATOR = re.compile(r'\s+[-–—~|]\s+')
+
+
+def _split_artist_title(text: str) -> tuple[Optional[str], str]:
+    text = _NUMBERING.sub('', text).strip(' \t-–—|:')
+    parts = _ARTIST_SEPARATOR.split(text, maxsplit=1)
+    if len(parts) == 2 and parts[0] and parts[1]:
+        return parts[0].strip(), parts[1].strip()
+    return None, text
+
+
+def _match_track_line(line: str) -> Optional[tuple[str, str]]:
+    """(timestamp, rest of the line) of a tracklist line, or None."""
+    line = _NUMBERING.sub('', line.strip())
+    match = _LEADING_TIMESTAMP.match(line) or _TRAILING_TIMESTAMP.match(line)
+    if match is None:
+        return None
+    return match.group('ts'), match.group('rest').strip()
+
+
+def parse_tracklist_heuristic(comment_text: str) -> Tracklist:
+    """
+    Parse a tracklist locally, without an LLM.
+    
+    Handles H:MM:SS and MM:SS timestamps at the start or end of a line
+    (optionally bracketed or as a range), track numbering, "Artist - Title"
+    separators, "ID" entries and timestamp-only lines (titled by the next
+    line if it has no timestamp).
+    
+    Args:
+        comment_text: Raw comment text containing the tracklist
+        
+    Returns:
+        Tracklist with parser 'heuristic' and a confidence between 0 and 1:
+        how much the comment looks like nothing but a tracklist in order
+    """
+    lines = [line.strip() for line in comment_text.splitlines()]
+    entries = []        # (line index, timestamp, rest)
+    for index, line in enumerate(lines):
+        matched = _match_track_line(line) if line else None
+        if matched is not None:
+            entries.append((index, *matched))
+    
+    tracks = []
+    title_lines = set()
+    untitled = 0
+    for number, (index, timestamp, rest) in enumerate(entries, start=1):
+        if not rest and index + 1 < len(lines) and lines[index + 1] and _match_track_line(lines[index + 1]) is None:
+            # Timestamp on a line of its own, title on the next
+            rest = lines[index + 1]
+            title_lines.add(index + 1)
+        artist, title = _split_artist_title(rest)
+        untitled += not title
+        tracks.append(Track(
+            number=number,
+            title=title or f"Track {number}",
+            artist=artist,
+            start_time=timestamp,
+            start_seconds=parse_timestamp_to_seconds(timestamp)
+        ))
+    
+    confidence = 0.0
+    if len(tracks) >= 2:
+        starts = [track.start_seconds for track in tracks]
+        in_order = sum(later > earlier for earlier, later in zip(starts, starts[1:])) / (len(starts) - 1)
+        # Text lines in between the tracks: prose, or tracks without a timestamp
+        first, last = entries[0][0], entries[-1][0]
+        track_lines = {index for index, _, _ in entries}
+        stray = sum(1 for index in range(first, last + 1)
+                    if lines[index] and index not in track_lines and index not in title_lines)
+        coverage = len(tracks) / (len(tracks) + stray)
+        confidence = in_order ** 2 * coverage * (1 - 0.5 * untitled / len(tracks))
+        if len(tracks) < 3:
+            confidence *= 0.75
+    
+    return Tracklist(tracks=tracks, parser='heuristic', confidence=confidence)
+
+
+def parse_tracklist_with_llm(comment_text: str, model: str = "gpt-5-mini", completion_fn: Optional[Callable] = None) -> Tracklist:
     """
     Use LiteLLM to parse a tracklist from comment text.
     
+    Results are cached by comment text, model and LLM_PROMPT_VERSION (see
+    tracklist_cache), so the same comment is only sent to the LLM once.
+    
     Args:
         comment_text: Raw comment text containing the tracklist
         model: LLM model to use (default: gpt-5-mini)
+        completion_fn: Stand-in for litellm's completion() (same arguments and
+            response shape), e.g. a local model or a fake for testing
         
     Returns:
         Parsed Tracklist object
     """
-    try:
-        from litellm import completion
-    except ImportError:
-        raise ImportError("litellm is required for --guess-chapters. Install with: pip install litellm")
+    cache_key = tracklist_cache_key(comment_text, model, LLM_PROMPT_VERSION)
+    cached = tracklist_cache().get(cache_key)
+    if cached is not None:
+        print(f"Tracklist found in cache, skipping {model}")
+        return cached
+    
+    completion = completion_fn
+    if completion is None:
+        try:
+            from litellm import completion
+        except ImportError:
+            raise ImportError("litellm is required for --guess-chapters. Install with: pip install litellm")
     
     # Note: We only ask for start_time, we compute start_seconds ourselves
     # because LLMs are bad at math!
@@ -211,31 +423,106 @@ Rules:
             start_seconds=start_seconds
         ))
     
-    return Tracklist(tracks=tracks)
+    tracklist = Tracklist(tracks=tracks, parser='llm')
+    tracklist_cache().put(cache_key, model, tracklist)
+    return tracklist
+
+
+_stats_lock = threading.Lock()
+_parser_counts = {'heuristic': 0, 'llm': 0}
+
+
+def tracklist_parser_stats() -> dict[str, int]:
+    """Number of tracklists parsed locally ('heuristic') and by the LLM ('llm') so far."""
+    with _stats_lock:
+        return dict(_parser_counts)
+
+
+def print_tracklist_parser_stats():
+    stats = tracklist_parser_stats()
+    total = sum(stats.values())
+    if total:
+        print(f"Tracklists: {stats['heuristic']} parsed locally, {stats['llm']} by the LLM "
+              f"({stats['llm'] / total * 100:.0f}% fallback rate)")
+
+
+def parse_tracklist(comment_text: str, model: str = "gpt-5-mini", min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+                    completion_fn: Optional[Callable] = None) -> Tracklist:
+    """
+    Parse a tracklist locally, falling back to the LLM when the local parse
+    is less confident than min_confidence.
+    
+    Args:
+        comment_text: Raw comment text containing the tracklist
+        model: LLM model to use for the fallback
+        min_confidence: Confidence a local parse needs to be used
+        completion_fn: Stand-in for litellm's completion() in the fallback
+        
+    Returns:
+        Parsed Tracklist object (parser and confidence tell which path was taken)
+    """
+    tracklist = parse_tracklist_heuristic(comment_text)
+    if tracklist.tracks and tracklist.confidence >= min_confidence:
+        print(f"Parsed tracklist locally (confidence {tracklist.confidence:.2f})")
+    else:
+        print(f"Local parse not confident enough ({tracklist.confidence:.2f} < {min_confidence}), parsing tracklist with {model}...")
+        confidence = tracklist.confidence
+        tracklist = parse_tracklist_with_llm(comment_text, model, completion_fn)
+        tracklist.confidence = confidence
+    
+    with _stats_lock:
+        _parser_counts[tracklist.parser] += 1
+    events.emit('tracklist_parse', parser=tracklist.parser, confidence=tracklist.confidence, tracks=len(tracklist.tracks))
+    return tracklist
 
 
-def parse_tracklist_from_url(url: str, model: str = "gpt-5-mini") -> Tracklist:
+def parse_tracklist_from_url(url: str, model: str = "gpt-5-mini", min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+                             completion_fn: Optional[Callable] = None,
+                             max_comments: int = DEFAULT_MAX_COMMENTS) -> Tracklist:
     """
-    Extract and parse a tracklist from a YouTube comment URL.
+    Extract and parse a tracklist from a YouTube comment URL (or the video's
+    chapters or description, see fetch_tracklist_source).
     
     Args:
         url: YouTube URL (optionally with lc= comment parameter)
-        model: LLM model to use
+        model: LLM model to use when the local parser isn't confident
+        min_confidence: Confidence a local parse needs to skip the LLM
+        completion_fn: Stand-in for litellm's completion() in the fallback
+        max_comments: Most top-level comments to look through
         
     Returns:
         Parsed Tracklist object
     """
     comment_id = extract_comment_id_from_url(url)
     
-    print(f"Fetching comments from video...")
     if comment_id:
         print(f"Looking for specific comment: {comment_id}")
     
-    comment_text = fetch_youtube_comment_via_ytdlp(url, comment_id)
-    print(f"Comment text:\n{comment_text}\n")
+    source, content = fetch_tracklist_source(url, comment_id, max_comments)
+    return tracklist_from_source(source, content, model, min_confidence, completion_fn)
+
+
+def tracklist_from_source(source: str, content, model: str = "gpt-5-mini", min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+                          completion_fn: Optional[Callable] = None) -> Tracklist:
+    """
+    Turn what fetch_tracklist_source() found into a Tracklist.
     
-    print(f"Parsing tracklist with {model}...")
-    tracklist = parse_tracklist_with_llm(comment_text, model)
+    Args:
+        source: 'chapters', 'comment' or 'description'
+        content: Chapter dicts for 'chapters', else the text to parse
+        model: LLM model to use when the local parser isn't confident
+        min_confidence: Confidence a local parse needs to skip the LLM
+        completion_fn: Stand-in for litellm's completion() in the fallback
+        
+    Returns:
+        Parsed Tracklist object
+    """
+    if source == 'chapters':
+        tracklist = tracklist_from_chapters(content)
+        tracklist.parser = 'chapters'
+    else:
+        print(f"{source.capitalize()} text:\n{content}\n")
+        tracklist = parse_tracklist(content, model, min_confidence, completion_fn)
     print(f"Found {len(tracklist.tracks)} tracks")
     
     return tracklist
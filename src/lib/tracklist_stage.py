@@ -0,0 +1,237 @@
+"""
+Concurrent, rate-limited tracklist stage for --guess-chapters batches.
+
+Looking a tracklist up fetches the video's comments through yt-dlp and may
+ask the LLM to parse one. Done by every download worker on its own, a
+playlist runs into the provider's rate limits and every worker retries at
+once. Here the tracklists of a whole batch are looked up on one asyncio event
+loop as the URLs arrive: comment fetches and LLM calls each go through a
+shared token bucket (requests per minute) and a concurrency cap, and a
+rate-limited (429) response pauses the whole bucket before the call is
+retried. Download workers wait on the future of their URL.
+"""
+import re
+import time
+import random
+import asyncio
+import inspect
+import threading
+import functools
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .tracklist_parser import (
+    Tracklist, extract_comment_id_from_url, fetch_tracklist_source, tracklist_from_source,
+    DEFAULT_MIN_CONFIDENCE, DEFAULT_MAX_COMMENTS
+)
+from . import events
+from .utils import log
+
+
+DEFAULT_LLM_REQUESTS_PER_MINUTE = 60
+DEFAULT_LLM_CONCURRENCY = 4
+DEFAULT_FETCH_REQUESTS_PER_MINUTE = 30
+DEFAULT_FETCH_CONCURRENCY = 4
+# Retries of a rate-limited call, with exponential backoff unless the response says how long to wait
+MAX_RATE_LIMIT_RETRIES = 5
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+
+
+def stage_log(*msgs: str):
+    log("TRACKLISTS", *msgs)
+
+
+# How yt-dlp (and errors without a status) report a rate limit
+RATE_LIMITED_MESSAGE = re.compile(r'\bHTTP Error 429\b|\btoo many requests\b|\brate[ -]limit', re.IGNORECASE)
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Whether an error is a 429 / rate limit response (LiteLLM or yt-dlp)."""
+    for attribute in ('status_code', 'http_status', 'status'):
+        if getattr(error, attribute, None) == 429:
+            return True
+    return RATE_LIMITED_MESSAGE.search(str(error)) is not None
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """The Retry-After of the response behind an error, if it has one."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Requests per minute, with bursts of up to `burst` requests."""
+
+    def __init__(self, per_minute: Optional[float], burst: int = 1):
+        self.rate = per_minute / 60 if per_minute else None
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # Waiters take tokens in arrival order
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate is None and not self._paused_until:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self.rate is None:
+                    return
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for `seconds`, e.g. after a 429."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Refill from the end of the pause, so the waiters don't all go at once when it ends
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+
+class RateLimit:
+    """A token bucket and a concurrency cap shared by the calls to one service."""
+
+    def __init__(self, name: str, per_minute: Optional[float], concurrency: int):
+        self.name = name
+        self.bucket = TokenBucket(per_minute, concurrency)
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        # Runs the blocking calls; one thread per call allowed at once
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix=f'tracklists-{name}')
+        self.calls = 0
+        self.rate_limited = 0
+
+    async def call(self, func: Callable[[], Any]) -> Any:
+        """
+        Run func (blocking, or a coroutine function) within the limits,
+        retrying it with backoff when it is rate limited.
+        """
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            async with self._semaphore:
+                await self.bucket.acquire()
+                self.calls += 1
+                try:
+                    if inspect.iscoroutinefunction(func):
+                        return await func()
+                    context = contextvars.copy_context()
+                    return await asyncio.get_running_loop().run_in_executor(self._executor, context.run, func)
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == MAX_RATE_LIMIT_RETRIES:
+                        raise
+                    self.rate_limited += 1
+                    delay = retry_after_seconds(e)
+                    if delay is None:
+                        delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(1, 1.5)
+                    # Every caller backs off, not just this one
+                    self.bucket.pause(delay)
+                    stage_log(f"{self.name} rate limited, retrying in {delay:.1f}s (attempt {attempt + 1} of {MAX_RATE_LIMIT_RETRIES})")
+                    events.emit('rate_limited', service=self.name, delay=delay, attempt=attempt + 1)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class TracklistStage:
+    """
+    Looks the tracklists of a batch up concurrently on an event loop thread.
+
+    submit() may be called from any thread and returns a concurrent.futures
+    Future; submitting the same URL again returns the same Future.
+    """
+
+    def __init__(self, model: str = "gpt-5-mini", min_confidence: float = DEFAULT_MIN_CONFIDENCE,
+                 max_comments: int = DEFAULT_MAX_COMMENTS,
+                 llm_per_minute: Optional[float] = DEFAULT_LLM_REQUESTS_PER_MINUTE, llm_concurrency: int = DEFAULT_LLM_CONCURRENCY,
+                 fetch_per_minute: Optional[float] = DEFAULT_FETCH_REQUESTS_PER_MINUTE, fetch_concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+                 completion_fn: Optional[Callable] = None):
+        self.model = model
+        self.min_confidence = min_confidence
+        self.max_comments = max_comments
+        self._completion_fn = completion_fn
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='tracklists', daemon=True)
+        self._thread.start()
+        self._llm = RateLimit('llm', llm_per_minute, llm_concurrency)
+        self._fetch = RateLimit('comments', fetch_per_minute, fetch_concurrency)
+        # Local parses (and the wait for an LLM call) of fetched comments
+        self._parse_executor = ThreadPoolExecutor(max_workers=max(1, llm_concurrency + fetch_concurrency), thread_name_prefix='tracklists-parse')
+        self._lock = threading.Lock()
+        self._pending: dict[str, Future] = {}
+
+    def submit(self, url: str) -> Future:
+        """Start looking the tracklist of url up (once)."""
+        with self._lock:
+            future = self._pending.get(url)
+            if future is None:
+                future = asyncio.run_coroutine_threadsafe(self._lookup(url), self._loop)
+                self._pending[url] = future
+        return future
+
+    async def _lookup(self, url: str) -> Tracklist:
+        with events.job(url), events.stage('tracklist') as stage_fields:
+            comment_id = extract_comment_id_from_url(url)
+            source, content = await self._fetch.call(functools.partial(fetch_tracklist_source, url, comment_id, self.max_comments))
+            context = contextvars.copy_context()
+            tracklist = await self._loop.run_in_executor(self._parse_executor, context.run, functools.partial(
+                tracklist_from_source, source, content, self.model, self.min_confidence, self._limited_completion
+            ))
+            stage_fields['tracks'] = len(tracklist.tracks)
+            stage_fields['parser'] = tracklist.parser
+            stage_fields['confidence'] = tracklist.confidence
+        return tracklist
+
+    def _limited_completion(self, **kwargs):
+        """completion() for parse_tracklist_with_llm, called on a parse thread, run within the LLM limits."""
+        if self._completion_fn is not None:
+            completion = functools.partial(self._completion_fn, **kwargs)
+        else:
+            try:
+                from litellm import acompletion
+            except ImportError:
+                raise ImportError("litellm is required for --guess-chapters. Install with: pip install litellm")
+            completion = functools.partial(acompletion, **kwargs)
+        return asyncio.run_coroutine_threadsafe(self._llm.call(completion), self._loop).result()
+
+    def close(self):
+        self._parse_executor.shutdown(wait=False, cancel_futures=True)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._llm.close()
+        self._fetch.close()
+        if self._llm.calls or self._fetch.calls:
+            stage_log(f"{self._fetch.calls} comment fetch(es), {self._llm.calls} LLM call(s), "
+                      f"{self._fetch.rate_limited + self._llm.rate_limited} rate limited")
+
+
+_stage: Optional[TracklistStage] = None
+
+
+def start_tracklist_stage(**options) -> TracklistStage:
+    """Start the stage that --guess-chapters jobs wait on (options as for TracklistStage)."""
+    global _stage
+    _stage = TracklistStage(**options)
+    return _stage
+
+
+def tracklist_stage() -> Optional[TracklistStage]:
+    return _stage
+
+
+def stop_tracklist_stage():
+    global _stage
+    if _stage is not None:
+        _stage.close()
+        _stage = None
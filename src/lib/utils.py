@@ -7,14 +7,52 @@ import time
 import subprocess
 import re
 import threading
-from typing import Tuple, List, Callable
+from typing import Tuple, List, Callable, Optional
 
 
 def log(prefix: str, *msgs: str):
     print(f'[{prefix}]:', *msgs)
 
 
-def run_subprocess_with_realtime_output(cmd: List[str], log_func: Callable, log_prefix: str = "") -> Tuple[int, str, str]:
+def probe_audio_duration(audio_path: str) -> Optional[float]:
+    """
+    Get the duration of an audio file with ffprobe (reads the container header only).
+
+    Args:
+        audio_path: Path to the audio file
+
+    Returns:
+        Duration in seconds, or None if it could not be determined
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        audio_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        return float(result.stdout.strip())
+    except (OSError, ValueError):
+        return None
+
+
+def link_or_copy(source: str, target: str):
+    """
+    Hardlink source to target, copying instead if linking isn't possible
+    (e.g. across filesystems). An existing target is replaced.
+    """
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def run_subprocess_with_realtime_output(cmd: List[str], log_func: Callable, log_prefix: str = "", env: Optional[dict] = None, cpus: Optional[List[int]] = None,
+                                        cancel: Optional[threading.Event] = None) -> Tuple[int, str, str]:
     """
     Run a subprocess and print its output in real time.
     
@@ -22,6 +60,9 @@ def run_subprocess_with_realtime_output(cmd: List[str], log_func: Callable, log_
         cmd: Command to run as a list of strings
         log_func: Function to use for logging
         log_prefix: Prefix for log messages
+        env: Optional environment for the subprocess (default: inherit)
+        cpus: Optional CPUs to pin the subprocess to
+        cancel: Optional event that terminates the subprocess when set
         
     Returns:
         Tuple of (return_code, stdout, stderr)
@@ -31,8 +72,15 @@ def run_subprocess_with_realtime_output(cmd: List[str], log_func: Callable, log_
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         universal_newlines=True,
-        bufsize=1
+        bufsize=1,
+        env=env
     )
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        # Threads the process starts from now on inherit the CPU set
+        try:
+            os.sched_setaffinity(process.pid, cpus)
+        except OSError as e:
+            log_func(f"{log_prefix} Could not pin to CPUs {cpus}: {e}")
     
     stdout_lines = []
     stderr_lines = []
@@ -63,7 +111,17 @@ def run_subprocess_with_realtime_output(cmd: List[str], log_func: Callable, log_
     stderr_thread.start()
     
     # Wait for the process to complete
-    return_code = process.wait()
+    if cancel is None:
+        return_code = process.wait()
+    else:
+        while True:
+            try:
+                return_code = process.wait(timeout=0.2)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel.is_set():
+                    log_func(f"{log_prefix} Cancelled, terminating")
+                    process.terminate()
     
     # Wait for the threads to finish
     stdout_thread.join()
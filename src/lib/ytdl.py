@@ -9,16 +9,244 @@ import re
 import json
 import urllib.request
 import urllib.parse
-from typing import Tuple, Optional
+import tempfile
+import threading
+from typing import Iterator, Tuple, Optional
 
-from .utils import log, run_subprocess_with_realtime_output
+from .utils import log, link_or_copy, run_subprocess_with_realtime_output
+from . import events
+from .demucs_processor import DEMUCS_OUTPUT_CODEC, stem_output_paths
+from .metadata_cache import lookup_title
+from .download_index import download_index
 from .envutils import YTSPLEET_DEFAULT_OUTPUT_FOLDER
 
 
+YTDL_BACKENDS = ('auto', 'inprocess', 'subprocess')
+
+# 'inprocess' or 'subprocess', chosen once per run by set_ytdl_backend
+_ytdl_backend = 'subprocess'
+
+# Formats the download is kept in: 'native' keeps YouTube's audio stream as it
+# is (opus/m4a, remuxed without re-encoding), 'flac' and 'wav' are lossless
+INTERMEDIATE_FORMATS = ('mp3', 'native', 'flac', 'wav')
+DEFAULT_INTERMEDIATE_FORMAT = 'mp3'
+# Extensions yt-dlp -x can produce when the stream is kept as is
+NATIVE_AUDIO_EXTENSIONS = ('.opus', '.m4a', '.ogg', '.webm', '.aac', '.mp3')
+
+
 def ytdl_log(*msgs: str):
     log("S1 (YTDL)", *msgs)
 
 
+def set_ytdl_backend(backend: str = 'auto') -> str:
+    """
+    Choose how yt-dlp commands are run.
+
+    Args:
+        backend: 'inprocess', 'subprocess' or 'auto' (in-process if yt-dlp is importable)
+
+    Returns:
+        The backend in use
+    """
+    global _ytdl_backend
+    from .ytdl_inprocess import ytdl_inprocess_available
+
+    if backend not in YTDL_BACKENDS:
+        raise ValueError(f"Unknown yt-dlp backend: {backend}")
+    if backend == 'subprocess':
+        _ytdl_backend = 'subprocess'
+    elif ytdl_inprocess_available():
+        _ytdl_backend = 'inprocess'
+    else:
+        if backend == 'inprocess':
+            ytdl_log("Warning: yt_dlp not importable, using subprocess backend")
+        _ytdl_backend = 'subprocess'
+    return _ytdl_backend
+
+
+def run_ytdl_json(cmd: list[str], log_prefix: str) -> list[dict]:
+    """
+    Run a `yt-dlp --dump-json` command and parse its output.
+
+    Args:
+        cmd: yt-dlp command line
+        log_prefix: Prefix for log messages
+
+    Returns:
+        One info dict per printed line (per entry for a flat playlist)
+    """
+    if _ytdl_backend == 'inprocess':
+        from .ytdl_inprocess import extract_info
+        return extract_info(cmd[1:], ytdl_log, log_prefix)
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise Exception(e.stderr)
+    return [json.loads(line) for line in result.stdout.strip().split('\n') if line]
+
+
+def run_ytdl_command(cmd: list[str], log_prefix: str, cancel: Optional[threading.Event] = None) -> Tuple[int, str, str]:
+    """
+    Run a yt-dlp download command with real-time output, reporting the
+    download and the audio transcode as separate stages.
+    
+    Args:
+        cmd: yt-dlp command line
+        log_prefix: Prefix for log messages
+        cancel: Optional event that aborts the download when set
+        
+    Returns:
+        Tuple of (return_code, stdout, stderr)
+    """
+    started = time.time()
+    transcode_started = None
+    
+    def mark_postprocess(name: str):
+        nonlocal transcode_started
+        # yt-dlp hands the finished download to ffmpeg at this point
+        if transcode_started is None and name == 'ExtractAudio':
+            transcode_started = time.time()
+    
+    def log_line(line: str):
+        if '[ExtractAudio]' in line:
+            mark_postprocess('ExtractAudio')
+        ytdl_log(line)
+    
+    if _ytdl_backend == 'inprocess':
+        from .ytdl_inprocess import run_download
+        return_code, stdout, stderr = run_download(cmd[1:], ytdl_log, log_prefix, mark_postprocess, cancel)
+    else:
+        return_code, stdout, stderr = run_subprocess_with_realtime_output(cmd, log_line, log_prefix, cancel=cancel)
+    ended = time.time()
+    events.record_stage('ytdl_download', started, transcode_started or ended, return_code=return_code)
+    if transcode_started is not None:
+        events.record_stage('ytdl_transcode', transcode_started, ended)
+    return return_code, stdout, stderr
+
+
+def iter_ytdl_json(cmd: list[str], log_prefix: str) -> Iterator[dict]:
+    """
+    Run a `yt-dlp --flat-playlist --dump-json` command, yielding every info
+    dict as soon as yt-dlp prints it instead of after the whole listing.
+
+    Args:
+        cmd: yt-dlp command line
+        log_prefix: Prefix for log messages
+
+    Yields:
+        One info dict per printed line
+    """
+    if _ytdl_backend == 'inprocess':
+        from .ytdl_inprocess import iter_entries
+        yield from iter_entries(cmd[1:], ytdl_log, log_prefix)
+        return
+
+    # stderr goes to a file, so a chatty yt-dlp can't block on a full pipe
+    with tempfile.TemporaryFile(mode='w+') as stderr_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, text=True)
+        try:
+            for line in process.stdout:
+                if line.strip():
+                    yield json.loads(line)
+            if process.wait() != 0:
+                stderr_file.seek(0)
+                raise Exception(stderr_file.read())
+        finally:
+            # The consumer may stop early
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+
+def ytdl_audio_args(intermediate: str = DEFAULT_INTERMEDIATE_FORMAT) -> list[str]:
+    """yt-dlp audio extraction arguments for an intermediate format."""
+    if intermediate == 'native':
+        # --audio-format defaults to "best": remux, no re-encoding
+        return ['-x']
+    return ['-x', '--audio-format', intermediate]
+
+
+def audio_extensions(intermediate: str = DEFAULT_INTERMEDIATE_FORMAT) -> tuple[str, ...]:
+    """File extensions a download in the given intermediate format can have."""
+    if intermediate == 'native':
+        return NATIVE_AUDIO_EXTENSIONS
+    return (f'.{intermediate}',)
+
+
+def find_audio_file(path_without_ext: str, intermediate: str = DEFAULT_INTERMEDIATE_FORMAT) -> Optional[str]:
+    """
+    Find a downloaded audio file by its path without extension.
+
+    Args:
+        path_without_ext: Path of the download, without extension
+        intermediate: Intermediate format the download was made in
+
+    Returns:
+        Path of the existing file, or None
+    """
+    for ext in audio_extensions(intermediate):
+        if os.path.exists(path_without_ext + ext):
+            return path_without_ext + ext
+    return None
+
+
+def timestamp_to_seconds(timestamp: str) -> int:
+    """Convert an HH:MM:SS (or MM:SS) timestamp to seconds."""
+    seconds = 0
+    for part in timestamp.split(':'):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def reuse_indexed_audio(video_id: str, path_without_ext: str, intermediate: str = DEFAULT_INTERMEDIATE_FORMAT,
+                        time_range: Optional[Tuple[int, int]] = None) -> Optional[str]:
+    """
+    Provide a download from the global download index instead of the network.
+
+    A file with the same range is hardlinked; a section is cut (without
+    re-encoding) from a full download or a longer section.
+
+    Args:
+        video_id: YouTube video ID
+        path_without_ext: Where the download would go, without extension
+        intermediate: Intermediate format of the download
+        time_range: Optional (start_seconds, end_seconds) of the requested section
+
+    Returns:
+        Path of the provided file, or None if the index has nothing usable
+    """
+    index = download_index()
+    if index is None:
+        return None
+    asset = index.find(video_id, audio_extensions(intermediate), time_range)
+    if asset is None:
+        return None
+
+    target = path_without_ext + os.path.splitext(asset.path)[1]
+    if (asset.start_seconds, asset.end_seconds) == (tuple(time_range) if time_range else (None, None)):
+        method = 'link'
+        link_or_copy(asset.path, target)
+        ytdl_log(f"Linked from download index: {asset.path}")
+    else:
+        method = 'cut'
+        offset = asset.start_seconds or 0
+        if not split_audio_tracks_with_ffmpeg(asset.path, [(target, time_range[0] - offset, time_range[1] - offset)]):
+            return None
+        ytdl_log(f"Cut {format_seconds_to_timestamp(time_range[0])}-{format_seconds_to_timestamp(time_range[1])} locally from: {asset.path}")
+    events.emit('download_index_hit', video_id=video_id, source=asset.path, method=method)
+    index.register(video_id, target, time_range)
+    return target
+
+
+def index_download(video_id: str, path: str, time_range: Optional[Tuple[int, int]] = None):
+    """Add a fresh download to the global download index (if enabled)."""
+    index = download_index()
+    if index is not None:
+        index.register(video_id, path, time_range)
+
+
 def get_video_id(url: str) -> str:
     """
     Extract the video ID from a YouTube URL.
@@ -43,15 +271,15 @@ def get_video_id(url: str) -> str:
     return video_id
 
 
-def get_playlist_video_urls(url: str) -> list[str]:
+def iter_playlist_video_urls(url: str) -> Iterator[str]:
     """
-    Extract all video URLs from a YouTube playlist URL.
+    Yield the video URLs of a YouTube playlist as yt-dlp lists them.
     
     Args:
         url: YouTube URL (may contain a playlist parameter)
         
-    Returns:
-        List of individual video URLs from the playlist
+    Yields:
+        Individual video URLs from the playlist
     """
     ytdl_log(f"Extracting playlist videos from: {url}")
     
@@ -63,29 +291,65 @@ def get_playlist_video_urls(url: str) -> list[str]:
         url
     ]
     
+    count = 0
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        
-        video_urls = []
-        # Each line is a separate JSON object for each video in the playlist
-        for line in result.stdout.strip().split('\n'):
-            if line:
-                video_info = json.loads(line)
-                video_id = video_info.get('id')
-                if video_id:
-                    video_urls.append(f"https://www.youtube.com/watch?v={video_id}")
+        # Each entry is a separate JSON object for each video in the playlist
+        for video_info in iter_ytdl_json(cmd, "YTDL (playlist)"):
+            video_id = video_info.get('id')
+            if video_id:
+                count += 1
+                yield f"https://www.youtube.com/watch?v={video_id}"
+    except Exception as e:
+        ytdl_log(f"Error extracting playlist: {e}")
+        raise Exception(f"Failed to extract playlist videos: {e}")
+    
+    ytdl_log(f"Found {count} videos in playlist")
+
+
+def get_playlist_video_urls(url: str) -> list[str]:
+    """
+    Extract all video URLs from a YouTube playlist URL.
+    
+    Args:
+        url: YouTube URL (may contain a playlist parameter)
         
-        ytdl_log(f"Found {len(video_urls)} videos in playlist")
-        return video_urls
+    Returns:
+        List of individual video URLs from the playlist
+    """
+    return list(iter_playlist_video_urls(url))
+
+
+def get_video_chapters(url: str) -> list[dict]:
+    """
+    Get the chapters of a YouTube video without downloading it.
+    
+    Args:
+        url: YouTube video URL
         
-    except subprocess.CalledProcessError as e:
-        ytdl_log(f"Error extracting playlist: {e.stderr}")
-        raise Exception(f"Failed to extract playlist videos: {e.stderr}")
+    Returns:
+        List of chapter dicts with 'title', 'start_time' and 'end_time' (seconds)
+    """
+    ytdl_log(f"Getting chapters for: {url}")
+    
+    cmd = [
+        'yt-dlp',
+        '--skip-download',
+        '--dump-json',
+        '--no-playlist',
+        url
+    ]
+    
+    try:
+        chapters = run_ytdl_json(cmd, "YTDL (chapters)")[0].get('chapters') or []
+    except Exception as e:
+        raise Exception(f"Failed to get chapters: {e}")
+    ytdl_log(f"Found {len(chapters)} chapters")
+    return chapters
 
 
 def get_video_title(video_id: str) -> str:
     """
-    Get the title of a YouTube video using the oEmbed API.
+    Get the title of a YouTube video using the oEmbed API (via the metadata cache).
     
     Args:
         video_id: YouTube video ID
@@ -95,32 +359,23 @@ def get_video_title(video_id: str) -> str:
     """
     ytdl_log(f"Getting title for video ID: {video_id}")
     
-    # Use YouTube's oEmbed API to get video metadata
-    oembed_url = f"https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json"
-    
-    try:
-        with urllib.request.urlopen(oembed_url) as response:
-            data = json.loads(response.read().decode())
-            title = data.get('title')
-            
-            if not title:
-                raise ValueError(f"Could not get title for video ID: {video_id}")
-            
-            # Clean the title to make it suitable for a filename
-            title = re.sub(r'[^\w\s-]', '', title)  # Remove special characters
-            title = re.sub(r'\s+', ' ', title).strip()  # Normalize whitespace
-            
-            ytdl_log(f"Video title: {title}")
-            return title
-    except Exception as e:
-        ytdl_log(f"Error getting video title: {e}")
+    # Cached, or looked up with YouTube's oEmbed API
+    title = lookup_title(video_id)
+    if not title:
         # Fall back to using the video ID as the title
         return video_id
+    
+    # Clean the title to make it suitable for a filename
+    title = re.sub(r'[^\w\s-]', '', title)  # Remove special characters
+    title = re.sub(r'\s+', ' ', title).strip()  # Normalize whitespace
+    
+    ytdl_log(f"Video title: {title}")
+    return title
 
 
-def run_ytdl(video_path: str, po_token: Optional[str] = None, output_folder: Optional[str] = None, split_chapters: bool = False, time_range: Optional[Tuple[str, str]] = None) -> str:
+def run_ytdl(video_path: str, po_token: Optional[str] = None, output_folder: Optional[str] = None, split_chapters: bool = False, time_range: Optional[Tuple[str, str]] = None, video_title: Optional[str] = None, intermediate: str = DEFAULT_INTERMEDIATE_FORMAT) -> str:
     """
-    Run youtube-dl to download a video and convert it to MP3.
+    Run youtube-dl to download a video and extract its audio (MP3 by default).
     
     Args:
         video_path: YouTube URL to download
@@ -128,13 +383,16 @@ def run_ytdl(video_path: str, po_token: Optional[str] = None, output_folder: Opt
         output_folder: Optional custom output folder path (overrides default)
         split_chapters: Split video into separate files by chapter
         time_range: Optional tuple of (start_time, end_time) in HH:MM:SS format
+        video_title: Optional already looked up (clean) video title
+        intermediate: Audio format to keep (one of INTERMEDIATE_FORMATS)
         
     Returns:
-        Path to the downloaded MP3 file (or output directory if split_chapters is True)
+        Path to the downloaded audio file (or output directory if split_chapters is True)
     """
     # Extract video ID and get title
     video_id = get_video_id(video_path)
-    video_title = get_video_title(video_id)
+    if video_title is None:
+        video_title = get_video_title(video_id)
     
     # Create a clean filename with title and ID
     clean_filename = f"{video_title}-{video_id}"
@@ -166,19 +424,24 @@ def run_ytdl(video_path: str, po_token: Optional[str] = None, output_folder: Opt
         mp3_path = output_dir  # Return directory when splitting chapters
     else:
         output_template = os.path.join(output_dir, f"{file_basename}.%(ext)s")
-        mp3_path = os.path.join(output_dir, f"{file_basename}.mp3")
-        mp3_path = os.path.abspath(mp3_path)
+        audio_base = os.path.abspath(os.path.join(output_dir, file_basename))
+        mp3_path = find_audio_file(audio_base, intermediate)
         
         # If the file already exists, return its path
-        if os.path.exists(mp3_path):
+        if mp3_path is not None:
             ytdl_log(f"File already exists: {mp3_path}")
             return mp3_path
+        
+        # Downloaded before, into another output folder or for another range?
+        range_seconds = (timestamp_to_seconds(time_range[0]), timestamp_to_seconds(time_range[1])) if time_range else None
+        mp3_path = reuse_indexed_audio(video_id, audio_base, intermediate, range_seconds)
+        if mp3_path is not None:
+            return mp3_path
     
     # Base command with alternative clients to avoid DRM issues
     ytdl_cmd = [
         'yt-dlp',
-        '-x',
-        '--audio-format', 'mp3',
+        *ytdl_audio_args(intermediate),
         '--extractor-args',
         'youtube:player-client=default,-tv,web_safari,web_embedded',  # Use alternative clients, avoid TV client
     ]
@@ -208,16 +471,18 @@ def run_ytdl(video_path: str, po_token: Optional[str] = None, output_folder: Opt
         ytdl_log("Splitting by chapters...")
     
     # Run the download command with real-time output
-    return_code, stdout, stderr = run_subprocess_with_realtime_output(
+    return_code, stdout, stderr = run_ytdl_command(
         ytdl_cmd + [video_path],
-        ytdl_log,
         "YTDL"
     )
     
     # Check if the download was successful
     if split_chapters:
-        # For chapter splits, check if any mp3 files were created in the output directory
-        mp3_files = glob.glob(os.path.join(output_dir, "*.mp3"))
+        # For chapter splits, check if any audio files were created in the output directory
+        def chapter_files() -> list[str]:
+            return [path for ext in audio_extensions(intermediate) for path in glob.glob(os.path.join(output_dir, f"*{ext}"))]
+        
+        mp3_files = chapter_files()
         if not mp3_files and return_code != 0:
             # Try with cookies
             ytdl_log("Initial download failed. Trying with cookies if available...")
@@ -227,21 +492,21 @@ def run_ytdl(video_path: str, po_token: Optional[str] = None, output_folder: Opt
                 ytdl_log("Found cookies file, retrying with cookies...")
                 ytdl_cmd.extend(['--cookies', cookies_path])
                 
-                return_code, stdout, stderr = run_subprocess_with_realtime_output(
+                return_code, stdout, stderr = run_ytdl_command(
                     ytdl_cmd + [video_path],
-                    ytdl_log,
                     "YTDL (with cookies)"
                 )
-                mp3_files = glob.glob(os.path.join(output_dir, "*.mp3"))
+                mp3_files = chapter_files()
         
         if mp3_files:
             ytdl_log(f"Successfully downloaded {len(mp3_files)} chapter(s) to: {output_dir}")
             return output_dir
         else:
             raise Exception(
-                f"Error encountered running youtube-dl. No mp3 files found in {output_dir}. Return code: {return_code}. Stderr follows: {stderr}")
+                f"Error encountered running youtube-dl. No audio files found in {output_dir}. Return code: {return_code}. Stderr follows: {stderr}")
     else:
-        if not os.path.exists(mp3_path) and return_code != 0:
+        mp3_path = find_audio_file(audio_base, intermediate)
+        if mp3_path is None and return_code != 0:
             # If download failed, try with cookies if available
             ytdl_log("Initial download failed. Trying with cookies if available...")
             cookies_path = os.path.expanduser("~/.config/yt-dlp/cookies.txt")
@@ -250,20 +515,21 @@ def run_ytdl(video_path: str, po_token: Optional[str] = None, output_folder: Opt
                 ytdl_log("Found cookies file, retrying with cookies...")
                 ytdl_cmd.extend(['--cookies', cookies_path])
                 
-                return_code, stdout, stderr = run_subprocess_with_realtime_output(
+                return_code, stdout, stderr = run_ytdl_command(
                     ytdl_cmd + [video_path],
-                    ytdl_log,
                     "YTDL (with cookies)"
                 )
+                mp3_path = find_audio_file(audio_base, intermediate)
         
         # Check if the file exists now (after download attempts)
-        if os.path.exists(mp3_path):
+        if mp3_path is not None:
             ytdl_log(f"Successfully downloaded: {mp3_path}")
+            index_download(video_id, mp3_path, range_seconds)
             return mp3_path
         else:
             # If still failed, raise exception
             raise Exception(
-                f"Error encountered running youtube-dl. mp3_path not found after youtube-dl: {mp3_path}. Return code: {return_code}. Stderr follows: {stderr}")
+                f"Error encountered running youtube-dl. Audio not found after youtube-dl: {audio_base}.*. Return code: {return_code}. Stderr follows: {stderr}")
 
 
 def format_seconds_to_timestamp(seconds: int) -> str:
@@ -274,40 +540,161 @@ def format_seconds_to_timestamp(seconds: int) -> str:
     return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
 
-def split_audio_with_ffmpeg(input_path: str, output_path: str, start_seconds: int, end_seconds: int) -> bool:
+def split_audio_tracks_with_ffmpeg(input_path: str, segments: list[Tuple[str, int, int]]) -> list[str]:
     """
-    Split an audio file using ffmpeg with stream copy (no re-encoding = fast).
-    
+    Split an audio file into many segments with a single ffmpeg run.
+
+    Every segment is a separate output of the same ffmpeg invocation, so the
+    input is read once in total instead of once per segment. Output-side -ss/-t
+    keep stream copy (no re-encoding).
+
     Args:
         input_path: Path to input audio file
-        output_path: Path for output audio file
-        start_seconds: Start time in seconds
-        end_seconds: End time in seconds
-        
+        segments: List of (output_path, start_seconds, end_seconds)
+
     Returns:
-        True if successful, False otherwise
+        Output paths that were written successfully
     """
-    duration = end_seconds - start_seconds
-    
-    cmd = [
-        'ffmpeg',
-        '-y',  # Overwrite output
-        '-i', input_path,
-        '-ss', str(start_seconds),
-        '-t', str(duration),
-        '-c', 'copy',  # Stream copy = no re-encoding = FAST
-        output_path
-    ]
-    
+    if not segments:
+        return []
+
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-i', input_path]
+    for output_path, start_seconds, end_seconds in segments:
+        cmd.extend([
+            '-map', '0:a',
+            '-ss', str(start_seconds),
+            '-t', str(end_seconds - start_seconds),
+            '-c', 'copy',  # Stream copy = no re-encoding = FAST
+            output_path
+        ])
+
     try:
         result = subprocess.run(cmd, capture_output=True, text=True)
-        return result.returncode == 0
+        if result.returncode != 0:
+            ytdl_log(f"ffmpeg error: {result.stderr}")
     except Exception as e:
         ytdl_log(f"ffmpeg error: {e}")
-        return False
+
+    written = []
+    for output_path, _, _ in segments:
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            written.append(output_path)
+        elif os.path.exists(output_path):
+            # Leave no empty files behind, so a re-run retries them
+            os.remove(output_path)
+    return written
+
+
+def tracklist_segments(tracklist) -> list:
+    """
+    Compute the time span of every timestamped track in a tracklist.
+
+    Args:
+        tracklist: Tracklist object
+
+    Returns:
+        List of (track, start_seconds, end_seconds)
+    """
+    tracks_with_times = []
+    for i, track in enumerate(tracklist.tracks):
+        if track.start_seconds < 0:
+            ytdl_log(f"Skipping track {track.number} '{track.title}' - no timestamp")
+            continue
+            
+        start_seconds = track.start_seconds
+        
+        # End time is the start of the next track, or +10 minutes for last track
+        if i + 1 < len(tracklist.tracks) and tracklist.tracks[i + 1].start_seconds >= 0:
+            end_seconds = tracklist.tracks[i + 1].start_seconds
+        else:
+            end_seconds = start_seconds + 600  # 10 minutes for last track
+        
+        tracks_with_times.append((track, start_seconds, end_seconds))
+    return tracks_with_times
+
+
+def track_filename(track) -> str:
+    """Build the (clean) base filename for a tracklist track."""
+    artist_part = f"{track.artist} - " if track.artist else ""
+    filename = f"{track.number:03d} - {artist_part}{track.title}"
+    return re.sub(r'[^\w\s\-\.]', '', filename)
+
+
+def tracklist_full_audio_path(output_dir: str, intermediate: str = DEFAULT_INTERMEDIATE_FORMAT) -> Optional[str]:
+    """Path of the full-length download inside a tracklist output directory (None if not downloaded)."""
+    return find_audio_file(_tracklist_full_audio_base(output_dir), intermediate)
+
+
+def _tracklist_full_audio_base(output_dir: str) -> str:
+    return os.path.join(output_dir, f"{os.path.basename(os.path.normpath(output_dir))}_full")
+
+
+def split_stems_by_tracklist(full_audio_path: str, tracklist, output_dir: str, codec: str = DEMUCS_OUTPUT_CODEC) -> int:
+    """
+    Slice the stems of a separated full-length download into per-track stems.
+    
+    Each track gets yts-vox_/yts-acc_ files named after its split audio file.
+    Stems that already exist are skipped.
+    
+    Args:
+        full_audio_path: Full-length audio whose stems were separated
+        tracklist: Tracklist object with the track boundaries
+        output_dir: Directory holding the per-track files
+        codec: Output codec of the stems
+        
+    Returns:
+        Number of per-track stem files written
+    """
+    tracks_with_times = tracklist_segments(tracklist)
+    # The track files are cut from the full audio and keep its extension
+    track_ext = os.path.splitext(full_audio_path)[1]
+    written = 0
+    for stem, full_stem_path in stem_output_paths(full_audio_path, codec).items():
+        if not os.path.exists(full_stem_path):
+            ytdl_log(f"Warning: Expected stem {full_stem_path} not found")
+            continue
+        
+        segments = []
+        for track, start_secs, end_secs in tracks_with_times:
+            # With the extension, so a dot in the title isn't taken for one
+            track_path = os.path.join(output_dir, f"{track_filename(track)}{track_ext}")
+            stem_path = stem_output_paths(track_path, codec)[stem]
+            if not os.path.exists(stem_path):
+                segments.append((stem_path, start_secs, end_secs))
+        
+        ytdl_log(f"Slicing {stem} stem into {len(segments)} track(s)")
+        written += len(split_audio_tracks_with_ffmpeg(full_stem_path, segments))
+    
+    return written
 
 
-def run_ytdl_tracklist(video_path: str, tracklist, po_token: Optional[str] = None, output_folder: Optional[str] = None) -> str:
+def slice_stems(source_audio_path: str, target_audio_path: str, start_seconds: int, end_seconds: int, codec: str = DEMUCS_OUTPUT_CODEC) -> int:
+    """
+    Cut the stems of a separated file into the stems of a section of it.
+
+    Args:
+        source_audio_path: Audio whose stems were separated
+        target_audio_path: Audio file of the section (its stems are written next to it)
+        start_seconds: Start of the section within the source
+        end_seconds: End of the section within the source
+        codec: Output codec of the stems
+
+    Returns:
+        Number of stem files written
+    """
+    written = 0
+    targets = stem_output_paths(target_audio_path, codec)
+    for stem, source_stem_path in stem_output_paths(source_audio_path, codec).items():
+        if os.path.exists(targets[stem]):
+            continue
+        if not os.path.exists(source_stem_path):
+            ytdl_log(f"Warning: Expected stem {source_stem_path} not found")
+            continue
+        written += len(split_audio_tracks_with_ffmpeg(source_stem_path, [(targets[stem], start_seconds, end_seconds)]))
+    return written
+
+
+def run_ytdl_tracklist(video_path: str, tracklist, po_token: Optional[str] = None, output_folder: Optional[str] = None, video_title: Optional[str] = None, intermediate: str = DEFAULT_INTERMEDIATE_FORMAT) -> str:
     """
     Download full video once, then split into tracks locally with ffmpeg.
     Much faster than downloading each track separately!
@@ -317,13 +704,37 @@ def run_ytdl_tracklist(video_path: str, tracklist, po_token: Optional[str] = Non
         tracklist: Tracklist object with tracks to download
         po_token: Optional PO token for authentication
         output_folder: Optional custom output folder path
+        video_title: Optional already looked up (clean) video title
+        intermediate: Audio format to keep (one of INTERMEDIATE_FORMATS); the
+            tracks are cut from it without re-encoding
         
     Returns:
         Path to the output directory containing all track files
     """
+    output_dir, full_audio_path = download_tracklist_audio(video_path, po_token, output_folder, video_title, intermediate)
+    return split_tracklist_audio(output_dir, full_audio_path, tracklist)
+
+
+def download_tracklist_audio(video_path: str, po_token: Optional[str] = None, output_folder: Optional[str] = None, video_title: Optional[str] = None,
+                             intermediate: str = DEFAULT_INTERMEDIATE_FORMAT, cancel: Optional[threading.Event] = None) -> Tuple[str, str]:
+    """
+    Download the full audio a tracklist is split from (first step of run_ytdl_tracklist).
+    
+    Args:
+        video_path: YouTube URL to download
+        po_token: Optional PO token for authentication
+        output_folder: Optional custom output folder path
+        video_title: Optional already looked up (clean) video title
+        intermediate: Audio format to keep (one of INTERMEDIATE_FORMATS)
+        cancel: Optional event that aborts the download when set
+        
+    Returns:
+        Tuple of (output_directory, full_audio_path)
+    """
     # Extract video ID and get title
     video_id = get_video_id(video_path)
-    video_title = get_video_title(video_id)
+    if video_title is None:
+        video_title = get_video_title(video_id)
     
     # Create a clean filename with title and ID
     clean_filename = f"{video_title}-{video_id}"
@@ -335,79 +746,87 @@ def run_ytdl_tracklist(video_path: str, tracklist, po_token: Optional[str] = Non
     output_dir = os.path.join(base_output_folder, clean_filename)
     os.makedirs(output_dir, exist_ok=True)
     
-    # Step 1: Download full audio once
-    full_audio_path = os.path.join(output_dir, f"{clean_filename}_full.mp3")
+    full_audio_path = tracklist_full_audio_path(output_dir, intermediate)
     
-    if os.path.exists(full_audio_path):
+    if full_audio_path is None:
+        full_audio_path = reuse_indexed_audio(video_id, _tracklist_full_audio_base(output_dir), intermediate)
+    
+    if full_audio_path is not None:
         ytdl_log(f"Full audio already exists: {full_audio_path}")
-    else:
-        ytdl_log(f"Downloading full audio: {video_title}")
-        
-        ytdl_cmd = [
-            'yt-dlp',
-            '-x',
-            '--audio-format', 'mp3',
-            '-o', full_audio_path.replace('.mp3', '.%(ext)s'),
-            '--extractor-args',
-            'youtube:player-client=default,-tv,web_safari,web_embedded',
-        ]
-        
-        if po_token:
-            ytdl_cmd.extend(['--extractor-args', f'youtube:player-skip=js,po_token={po_token}'])
-        
-        return_code, stdout, stderr = run_subprocess_with_realtime_output(
-            ytdl_cmd + [video_path],
-            ytdl_log,
-            "YTDL (full)"
-        )
-        
-        if return_code != 0 or not os.path.exists(full_audio_path):
-            raise Exception(f"Failed to download full audio: {stderr}")
+        return output_dir, full_audio_path
+    
+    ytdl_log(f"Downloading full audio: {video_title}")
+    
+    ytdl_cmd = [
+        'yt-dlp',
+        *ytdl_audio_args(intermediate),
+        '-o', f"{_tracklist_full_audio_base(output_dir)}.%(ext)s",
+        '--extractor-args',
+        'youtube:player-client=default,-tv,web_safari,web_embedded',
+    ]
+    
+    if po_token:
+        ytdl_cmd.extend(['--extractor-args', f'youtube:player-skip=js,po_token={po_token}'])
+    
+    return_code, stdout, stderr = run_ytdl_command(
+        ytdl_cmd + [video_path],
+        "YTDL (full)",
+        cancel
+    )
     
+    if cancel is not None and cancel.is_set():
+        # yt-dlp resumes from the .part file it leaves if the video is requested again
+        raise Exception(f"Full audio download cancelled: {video_path}")
+    full_audio_path = tracklist_full_audio_path(output_dir, intermediate)
+    if return_code != 0 or full_audio_path is None:
+        raise Exception(f"Failed to download full audio: {stderr}")
+    index_download(video_id, full_audio_path)
+    return output_dir, full_audio_path
+
+
+def split_tracklist_audio(output_dir: str, full_audio_path: str, tracklist) -> str:
+    """
+    Split the full audio into the tracks of a tracklist with ffmpeg (second
+    step of run_ytdl_tracklist).
+    
+    Args:
+        output_dir: Directory the tracks are written to
+        full_audio_path: Full audio from download_tracklist_audio
+        tracklist: Tracklist object with tracks to split
+        
+    Returns:
+        Path to the output directory containing all track files
+    """
     ytdl_log(f"Splitting into {len(tracklist.tracks)} tracks...")
     
     # Step 2: Build track list with times
-    tracks_with_times = []
-    for i, track in enumerate(tracklist.tracks):
-        if track.start_seconds < 0:
-            ytdl_log(f"Skipping track {track.number} '{track.title}' - no timestamp")
-            continue
-            
-        start_seconds = track.start_seconds
-        
-        # End time is the start of the next track, or +10 minutes for last track
-        if i + 1 < len(tracklist.tracks) and tracklist.tracks[i + 1].start_seconds >= 0:
-            end_seconds = tracklist.tracks[i + 1].start_seconds
-        else:
-            end_seconds = start_seconds + 600  # 10 minutes for last track
-        
-        tracks_with_times.append((track, start_seconds, end_seconds))
+    tracks_with_times = tracklist_segments(tracklist)
     
-    # Step 3: Split with ffmpeg (very fast - no re-encoding)
+    # Step 3: Split with a single ffmpeg pass (very fast - no re-encoding)
+    track_ext = os.path.splitext(full_audio_path)[1]
     successful = 0
+    segments = []
     for track, start_secs, end_secs in tracks_with_times:
         # Create filename for this track
-        artist_part = f"{track.artist} - " if track.artist else ""
-        track_filename = f"{track.number:03d} - {artist_part}{track.title}"
-        # Clean filename
-        track_filename = re.sub(r'[^\w\s\-\.]', '', track_filename)
-        
-        track_path = os.path.join(output_dir, f"{track_filename}.mp3")
+        track_name = track_filename(track)
+        track_path = os.path.join(output_dir, f"{track_name}{track_ext}")
         
         # Skip if already exists
         if os.path.exists(track_path):
-            ytdl_log(f"Track exists: {track_filename}")
+            ytdl_log(f"Track exists: {track_name}")
             successful += 1
             continue
         
         start_ts = format_seconds_to_timestamp(start_secs)
         end_ts = format_seconds_to_timestamp(end_secs)
         ytdl_log(f"Splitting track {track.number}: {track.title} ({start_ts} - {end_ts})")
-        
-        if split_audio_with_ffmpeg(full_audio_path, track_path, start_secs, end_secs):
-            successful += 1
-        else:
-            ytdl_log(f"Warning: Failed to split track {track.number}: {track.title}")
+        segments.append((track_path, start_secs, end_secs))
+    
+    written = set(split_audio_tracks_with_ffmpeg(full_audio_path, segments))
+    successful += len(written)
+    for track_path, _, _ in segments:
+        if track_path not in written:
+            ytdl_log(f"Warning: Failed to split track: {os.path.basename(track_path)}")
     
     ytdl_log(f"Successfully created {successful} track(s) in: {output_dir}")
     
@@ -0,0 +1,237 @@
+"""
+In-process yt-dlp backend.
+
+Every `yt-dlp` subprocess re-imports yt-dlp and repeats extractor
+initialisation, several times per video for a tracklist run. Here the same
+command lines are parsed with yt-dlp's own option parser and run on a
+`yt_dlp.YoutubeDL` instance that each worker thread keeps for every distinct
+set of options, so the HTTP session, cookies and extractor state are reused
+across videos. Progress is reported through yt-dlp's hooks instead of by
+parsing stdout.
+"""
+import time
+import threading
+from typing import Callable, Iterator, Optional, Tuple
+
+
+# Options that change on every call; they are applied to a reused instance
+PER_CALL_OPTIONS = ('outtmpl', 'download_ranges')
+# Options of `--dump-json` style commands that would print instead of returning the info
+PRINT_OPTIONS = ('forcejson', 'dump_single_json', 'simulate', 'quiet', 'noprogress')
+# Seconds between download progress log lines
+PROGRESS_INTERVAL = 5.0
+
+_local = threading.local()
+
+
+def ytdl_inprocess_available() -> bool:
+    """Check whether yt-dlp can be imported in this interpreter."""
+    try:
+        import yt_dlp  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _Call:
+    """State of the call currently running on a thread's YoutubeDL instances."""
+
+    def __init__(self, log_func: Callable, log_prefix: str, on_postprocess: Optional[Callable] = None,
+                 cancel: Optional[threading.Event] = None):
+        self.log_func = log_func
+        self.log_prefix = log_prefix
+        self.on_postprocess = on_postprocess
+        self.cancel = cancel
+        self.errors: list[str] = []
+        self.last_progress = 0.0
+
+    def log(self, message: str):
+        self.log_func(f"{self.log_prefix}: {message}")
+
+
+class _Logger:
+    """Routes yt-dlp's messages to the current call's log function."""
+
+    def debug(self, message: str):
+        # yt-dlp sends regular screen output to debug(), prefixed with [debug] for verbose output
+        if not message.startswith('[debug] '):
+            _current_call().log(message)
+
+    def info(self, message: str):
+        _current_call().log(message)
+
+    def warning(self, message: str):
+        _current_call().log(message)
+
+    def error(self, message: str):
+        call = _current_call()
+        call.errors.append(message)
+        call.log(message)
+
+
+def _current_call() -> _Call:
+    call = getattr(_local, 'call', None)
+    if call is None:
+        return _Call(print, "YTDL")
+    return call
+
+
+def _progress_hook(status: dict):
+    call = _current_call()
+    if call.cancel is not None and call.cancel.is_set():
+        import yt_dlp
+        # Aborts the download; run_download() reports it as a failure
+        raise yt_dlp.utils.DownloadCancelled('Download cancelled')
+    if status['status'] == 'downloading':
+        now = time.time()
+        if now - call.last_progress < PROGRESS_INTERVAL:
+            return
+        call.last_progress = now
+        downloaded = status.get('downloaded_bytes') or 0
+        total = status.get('total_bytes') or status.get('total_bytes_estimate')
+        speed = status.get('speed')
+        progress = f"{downloaded / total * 100:.1f}% of {total / 1024 / 1024:.1f} MiB" if total else f"{downloaded / 1024 / 1024:.1f} MiB"
+        if speed:
+            progress += f" at {speed / 1024 / 1024:.2f} MiB/s"
+        call.log(f"[download] {progress}")
+    elif status['status'] == 'finished':
+        call.log(f"[download] Finished {status.get('filename')}")
+
+
+def _postprocessor_hook(status: dict):
+    call = _current_call()
+    if status['status'] == 'started' and call.on_postprocess is not None:
+        call.on_postprocess(status['postprocessor'])
+
+
+def _instance(ydl_opts: dict):
+    """This thread's YoutubeDL for ydl_opts (ignoring PER_CALL_OPTIONS), created on first use."""
+    import yt_dlp
+
+    instances = getattr(_local, 'instances', None)
+    if instances is None:
+        instances = _local.instances = {}
+
+    key = repr(sorted((name, value) for name, value in ydl_opts.items() if name not in PER_CALL_OPTIONS))
+    ydl = instances.get(key)
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL({
+            **ydl_opts,
+            'logger': _Logger(),
+            'quiet': False,
+            'noprogress': True,
+            'progress_hooks': [_progress_hook],
+            'postprocessor_hooks': [_postprocessor_hook],
+        })
+        instances[key] = ydl
+    for name in PER_CALL_OPTIONS:
+        ydl.params[name] = ydl_opts.get(name)
+    # Templates the command line leaves out keep their defaults, as when
+    # YoutubeDL.__init__ is given the options
+    ydl.params['outtmpl'] = {**yt_dlp.utils.DEFAULT_OUTTMPL, **(ydl_opts.get('outtmpl') or {})}
+    return ydl
+
+
+def run_download(args: list[str], log_func: Callable, log_prefix: str,
+                 on_postprocess: Optional[Callable[[str], None]] = None,
+                 cancel: Optional[threading.Event] = None) -> Tuple[int, str, str]:
+    """
+    Run a yt-dlp command line (without the leading 'yt-dlp') on this thread's instance.
+
+    Args:
+        args: yt-dlp arguments, options followed by URLs
+        log_func: Function to use for logging
+        log_prefix: Prefix for log messages
+        on_postprocess: Called with the postprocessor name (e.g. 'ExtractAudio') when it starts
+        cancel: Optional event that aborts the download at its next progress update when set
+
+    Returns:
+        Tuple of (return_code, stdout, stderr), like the subprocess backend
+    """
+    import yt_dlp
+
+    parsed = yt_dlp.parse_options(args)
+    _local.call = _Call(log_func, log_prefix, on_postprocess, cancel)
+    try:
+        ydl = _instance(dict(parsed.ydl_opts))
+        # download() returns the return code accumulated over the instance's
+        # lifetime; every error it counts is reported through the logger
+        ydl.download(parsed.urls)
+        return_code = 1 if _local.call.errors else 0
+    except yt_dlp.utils.DownloadError:
+        # Already reported through the logger
+        return_code = 1
+    except Exception as e:
+        _local.call.errors.append(str(e))
+        return_code = 1
+    finally:
+        call = _local.call
+        _local.call = None
+    return return_code, '', '\n'.join(call.errors)
+
+
+def extract_info(args: list[str], log_func: Callable, log_prefix: str) -> list[dict]:
+    """
+    Run a `--dump-json` style yt-dlp command line in-process.
+
+    Args:
+        args: yt-dlp arguments, options followed by a single URL
+        log_func: Function to use for logging
+        log_prefix: Prefix for log messages
+
+    Returns:
+        The info dicts `yt-dlp --dump-json` would print: one per entry for a
+        (flat) playlist, otherwise the single video's
+    """
+    import yt_dlp
+
+    parsed = yt_dlp.parse_options(args)
+    ydl_opts = {name: value for name, value in parsed.ydl_opts.items() if name not in PRINT_OPTIONS}
+    _local.call = _Call(log_func, log_prefix)
+    try:
+        ydl = _instance(ydl_opts)
+        info = ydl.sanitize_info(ydl.extract_info(parsed.urls[0], download=False))
+    except yt_dlp.utils.DownloadError as e:
+        raise Exception('\n'.join(_local.call.errors) or str(e))
+    finally:
+        _local.call = None
+
+    if info.get('_type') == 'playlist':
+        return [entry for entry in info.get('entries') or [] if entry]
+    return [info]
+
+
+def iter_entries(args: list[str], log_func: Callable, log_prefix: str) -> Iterator[dict]:
+    """
+    Run a `--flat-playlist --dump-json` style command line in-process,
+    yielding entries while the playlist pages are still being fetched.
+
+    Args:
+        args: yt-dlp arguments, options followed by a single URL
+        log_func: Function to use for logging
+        log_prefix: Prefix for log messages
+
+    Yields:
+        The info dicts `yt-dlp --dump-json` would print, one per entry
+    """
+    import yt_dlp
+
+    parsed = yt_dlp.parse_options(args)
+    ydl_opts = {name: value for name, value in parsed.ydl_opts.items() if name not in PRINT_OPTIONS}
+    _local.call = _Call(log_func, log_prefix)
+    try:
+        ydl = _instance(ydl_opts)
+        # process=False leaves the playlist's entries as a lazy, paged iterator
+        result = ydl.extract_info(parsed.urls[0], download=False, process=False)
+        while result.get('_type') in ('url', 'url_transparent'):
+            result = ydl.extract_info(result['url'], download=False, process=False, ie_key=result.get('ie_key'))
+        if result.get('_type') != 'playlist':
+            yield ydl.sanitize_info(result)
+            return
+        for entry in result.get('entries') or []:
+            if entry:
+                yield ydl.sanitize_info(entry)
+    except yt_dlp.utils.DownloadError as e:
+        raise Exception('\n'.join(_local.call.errors) or str(e))
+    finally:
+        _local.call = None
@@ -1,12 +1,46 @@
-from typing import Optional
+from typing import Callable, Iterable, Iterator, Optional, Tuple
 import re
 import os
+import glob
+import queue
+import shutil
+import threading
+import functools
+import contextlib
+import contextvars
+from concurrent.futures import Future
 from dataclasses import dataclass
-from concurrent.futures import ProcessPoolExecutor
 import argparse
+import time
 
-from src.lib.ytdl import run_ytdl, get_playlist_video_urls, run_ytdl_tracklist
-from src.lib.demucs_processor import run_demucs
+from src.lib.ytdl import (
+    run_ytdl, iter_playlist_video_urls, download_tracklist_audio, split_tracklist_audio, get_video_chapters,
+    split_stems_by_tracklist, slice_stems, get_video_id, get_video_title,
+    set_ytdl_backend, YTDL_BACKENDS, INTERMEDIATE_FORMATS, DEFAULT_INTERMEDIATE_FORMAT
+)
+from src.lib.tracklist_parser import Tracklist, parse_tracklist_from_url, tracklist_from_chapters, print_tracklist_parser_stats, DEFAULT_MIN_CONFIDENCE, DEFAULT_MAX_COMMENTS
+from src.lib.demucs_processor import run_demucs, stem_output_paths, DEMUCS_MODEL, DEMUCS_STEM_MODE, DEMUCS_OUTPUT_CODEC, OUTPUT_CODECS
+from src.lib.demucs_engine import DemucsEngine, create_demucs_engine, demucs_engine_available
+from src.lib.demucs_batch import DemucsBatcher, DEFAULT_BATCH_SIZE, DEFAULT_BATCH_MAX_MINUTES, DEFAULT_BATCH_MAX_WAIT_SECONDS
+from src.lib.demucs_chunked import run_demucs_chunked, is_long_input, DEFAULT_LONG_INPUT_MINUTES
+from src.lib.stem_cache import StemCache, create_stem_cache, stem_cache_key, DEFAULT_STEM_CACHE_FOLDER, DEFAULT_STEM_CACHE_SIZE_GB
+from src.lib.envutils import YTSPLEET_DEFAULT_OUTPUT_FOLDER
+from src.lib.journal import Journal, journal_path
+from src.lib.metadata_cache import (
+    TitlePrefetcher, configure_metadata_cache, start_title_prefetch, stop_title_prefetch,
+    DEFAULT_METADATA_CACHE_PATH, DEFAULT_METADATA_TTL_DAYS, DEFAULT_LOOKUP_WORKERS
+)
+from src.lib.download_index import configure_download_index, DEFAULT_DOWNLOAD_INDEX_PATH
+from src.lib.tracklist_cache import configure_tracklist_cache, DEFAULT_TRACKLIST_CACHE_PATH, DEFAULT_TRACKLIST_CACHE_ENTRIES
+from src.lib.tracklist_stage import (
+    TracklistStage, start_tracklist_stage, stop_tracklist_stage, tracklist_stage,
+    DEFAULT_LLM_REQUESTS_PER_MINUTE, DEFAULT_LLM_CONCURRENCY, DEFAULT_FETCH_REQUESTS_PER_MINUTE, DEFAULT_FETCH_CONCURRENCY
+)
+from src.lib import events
+from src.lib.pipeline import run_pipeline, default_download_workers
+from src.lib.cpu_budget import CpuSlots, configure_thread_plan, plan_threads, DEMUCS_PARALLEL_FRACTION, DEMUCS_WORKER_CONTENTION
+from src.lib.memory_budget import configure_memory_budget, default_memory_budget_mb, estimate_separation_mb, memory_budget
+from src.lib.utils import probe_audio_duration
 
 
 # DEBUG
@@ -104,6 +138,17 @@ def format_timestamp(seconds: int) -> str:
     return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
 
+def merge_time_ranges(ranges: Iterable[Tuple[int, int]]) -> list[Tuple[int, int]]:
+    """Merge overlapping or adjacent (start_seconds, end_seconds) ranges."""
+    merged: list[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
 @dataclass
 class YTSpleetSingleFileArgs:
     source_youtube_url: str
@@ -115,83 +160,159 @@ class YTSpleetSingleFileArgs:
     window: Optional[int] = None  # minutes on each side (None = no extraction)
     guess_chapters: bool = False
     llm_model: str = "gpt-5-mini"
+    long_input_minutes: Optional[float] = DEFAULT_LONG_INPUT_MINUTES  # separate longer inputs in windows
+    separate_tracks: bool = False  # with chapter modes: separate the full audio once, then slice the stems
+    intermediate: str = DEFAULT_INTERMEDIATE_FORMAT  # format the download is kept in and fed to Demucs
+    output_codec: str = DEMUCS_OUTPUT_CODEC  # codec of the final stems
+    span: Optional[Tuple[int, int]] = None  # merged time range downloaded and separated once for overlapping windows
+    tracklist_min_confidence: float = DEFAULT_MIN_CONFIDENCE  # local tracklist parses below this go to the LLM
+    max_comments: int = DEFAULT_MAX_COMMENTS  # top comments searched for a tracklist
+    on_parse_failure: str = 'keep'  # what happens to the concurrent full-audio download when the tracklist parse fails
 
 
-def ytspleet_single_file(args: YTSpleetSingleFileArgs):
+@dataclass
+class DownloadedAudio:
+    """Output of the download stage that still needs stem separation."""
+    audio_path: str
+    # If set, the stems of audio_path are sliced into per-track stems
+    tracklist: Optional[Tracklist] = None
+    output_dir: Optional[str] = None
+    # If set, audio_path is a window of span_audio_path, whose stems are
+    # sliced at span_slice (seconds within the span) instead
+    span_audio_path: Optional[str] = None
+    span_slice: Optional[Tuple[int, int]] = None
+
+
+
+# Serialises the download and the separation of each merged span, see plan_time_windows()
+# (reentrant: separate_stage holds a span's lock around ytspleet_separate, which takes it too).
+# Locks are kept with the number of threads holding or waiting for them and
+# dropped with the last one, so a long batch doesn't keep one per span.
+_span_locks: dict[tuple, list] = {}
+_span_locks_guard = threading.Lock()
+
+
+@contextlib.contextmanager
+def span_lock(*key):
+    with _span_locks_guard:
+        entry = _span_locks.setdefault(key, [threading.RLock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _span_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _span_locks[key]
+
+
+def job_timestamp(args: YTSpleetSingleFileArgs) -> Optional[str]:
+    """Center timestamp of a job: --timestamp, else the URL's t= if --window is set."""
+    if args.timestamp:
+        return args.timestamp
+    if args.window is not None:
+        return extract_timestamp_from_url(args.source_youtube_url)
+    return None
+
+
+def job_time_range(args: YTSpleetSingleFileArgs) -> Optional[Tuple[int, int]]:
+    """(start_seconds, end_seconds) a job extracts, or None for the whole video."""
+    timestamp = job_timestamp(args)
+    if not timestamp:
+        return None
+    # Default to 4 minutes each side
+    window_seconds = (args.window if args.window is not None else 4) * 60
+    center_seconds = parse_timestamp(timestamp)
+    return max(0, center_seconds - window_seconds), center_seconds + window_seconds
+
+
+def print_tracklist(tracklist: Tracklist):
+    print("\nParsed tracklist:")
+    for track in tracklist.tracks:
+        artist = f"{track.artist} - " if track.artist else ""
+        print(f"  {track.number:3d}. {artist}{track.title} @ {track.start_time}")
+    print()
+
+
+def journal_mark(journal: Optional[Journal], url: str, stage: str, output_path: Optional[str] = None):
+    if journal is not None:
+        journal.mark(url, stage, output_path)
+
+
+def ytspleet_download(args: YTSpleetSingleFileArgs, journal: Optional[Journal] = None) -> Optional[DownloadedAudio]:
+    """
+    Download stage: fetch the audio for a single URL.
+
+    Returns:
+        The audio that still needs stem separation, or None if the item is
+        already finished (download-only and chapter modes)
+    """
+    with events.stage('title'):
+        video_title = get_video_title(get_video_id(args.source_youtube_url))
+
     # Handle --guess-chapters mode (parse tracklist from comment)
     if args.guess_chapters:
         print("--------------------------")
         print("GUESS CHAPTERS MODE: Parsing tracklist from YouTube comment")
         print("--------------------------")
         
-        from src.lib.tracklist_parser import parse_tracklist_from_url
-        
-        tracklist = parse_tracklist_from_url(
-            args.source_youtube_url,
-            model=args.llm_model
-        )
+        # The full audio doesn't depend on the tracklist until it is split,
+        # so it is downloaded while the tracklist is parsed
+        cancel_download = threading.Event()
+        parsed_tracklist = start_in_thread('tracklist', ytspleet_parse_tracklist, args, cancel_download)
+        journal_mark(journal, args.source_youtube_url, 'download')
+        try:
+            output_dir, full_audio_path = ytspleet_download_full_audio(args, video_title, cancel_download)
+        except Exception:
+            # A cancelled download is reported through the parse failure
+            parsed_tracklist.result()
+            raise
+        tracklist = parsed_tracklist.result()
         
         # Print parsed tracklist
-        print("\nParsed tracklist:")
-        for track in tracklist.tracks:
-            artist = f"{track.artist} - " if track.artist else ""
-            print(f"  {track.number:3d}. {artist}{track.title} @ {track.start_time}")
-        print()
-        
-        print("--------------------------")
-        print("DOWNLOADING TRACKS")
-        print("--------------------------")
-        
-        output_dir = run_ytdl_tracklist(
-            args.source_youtube_url,
-            tracklist,
-            args.po_token,
-            args.output_folder
-        )
-        
+        print_tracklist(tracklist)
+        return ytspleet_split_tracklist(args, tracklist, "--guess-chapters", output_dir, full_audio_path)
+    
+    # Chapter splitting with stems: use the chapters as a tracklist, so the
+    # full audio can be separated once and the stems sliced at the chapters
+    if args.split_chapters and args.separate_tracks and not args.dl_only:
         print("--------------------------")
-        print("Download complete (--guess-chapters mode)")
+        print("SPLIT CHAPTERS MODE: Reading chapters")
         print("--------------------------")
-        print(f"Output: '{output_dir}'")
-        return
+        with events.stage('chapters'):
+            tracklist = tracklist_from_chapters(get_video_chapters(args.source_youtube_url))
+        if not tracklist.tracks:
+            raise Exception(f"No chapters found for {args.source_youtube_url}")
+        print_tracklist(tracklist)
+        journal_mark(journal, args.source_youtube_url, 'download')
+        return ytspleet_download_tracklist(args, tracklist, "--split-chapters", video_title)
     
     print("--------------------------")
     print("STARTING STEP 1: youtube-dl (YTDL)")
     print("--------------------------")
     
     # Calculate time range if timestamp/window extraction is requested
-    time_range = None
-    timestamp = args.timestamp
-    window = args.window
-    
-    # If window is set but no timestamp, try to extract timestamp from URL
-    if window is not None and not timestamp:
-        url_timestamp = extract_timestamp_from_url(args.source_youtube_url)
-        if url_timestamp:
-            timestamp = url_timestamp
-            print(f"Found timestamp in URL: {timestamp}")
+    if args.window is not None and not args.timestamp:
+        if job_timestamp(args):
+            print(f"Found timestamp in URL: {job_timestamp(args)}")
         else:
             print(f"Warning: --window specified but no timestamp found in URL. Use --timestamp to specify.")
     
-    # If we have a timestamp and window, calculate the time range
-    if timestamp and window is not None:
-        center_seconds = parse_timestamp(timestamp)
-        window_seconds = window * 60
-        start_seconds = max(0, center_seconds - window_seconds)
-        end_seconds = center_seconds + window_seconds
-        time_range = (format_timestamp(start_seconds), format_timestamp(end_seconds))
-        print(f"Extracting time range: {time_range[0]} to {time_range[1]} (centered on {timestamp}, ±{window}min)")
-    elif timestamp and window is None:
-        # Timestamp provided but no window - default to 4 minutes each side
-        window = 4
-        center_seconds = parse_timestamp(timestamp)
-        window_seconds = window * 60
-        start_seconds = max(0, center_seconds - window_seconds)
-        end_seconds = center_seconds + window_seconds
-        time_range = (format_timestamp(start_seconds), format_timestamp(end_seconds))
-        print(f"Extracting time range: {time_range[0]} to {time_range[1]} (centered on {timestamp}, ±{window}min)")
+    time_range = None
+    range_seconds = job_time_range(args)
+    if range_seconds is not None:
+        time_range = (format_timestamp(range_seconds[0]), format_timestamp(range_seconds[1]))
+        print(f"Extracting time range: {time_range[0]} to {time_range[1]} (centered on {job_timestamp(args)}, ±{args.window if args.window is not None else 4}min)")
+    
+    if args.span is not None and range_seconds is not None:
+        return ytspleet_download_window(args, range_seconds, video_title, journal)
     
-    mp3_path = run_ytdl(args.source_youtube_url, args.po_token, args.output_folder, args.split_chapters, time_range)
+    journal_mark(journal, args.source_youtube_url, 'download')
+    with events.stage('download') as stage_fields:
+        mp3_path = run_ytdl(args.source_youtube_url, args.po_token, args.output_folder, args.split_chapters, time_range, video_title, args.intermediate)
+        if not args.split_chapters:
+            stage_fields.update(events.file_fields(mp3_path))
 
     if args.dl_only or args.split_chapters:
         print("--------------------------")
@@ -201,52 +322,517 @@ def ytspleet_single_file(args: YTSpleetSingleFileArgs):
             print("Download complete (--dl-only mode, skipping stem separation)")
         print("--------------------------")
         print(f"Output: '{mp3_path}'")
-        return
+        return None
 
+    return DownloadedAudio(mp3_path)
+
+
+def start_in_thread(name: str, func: Callable, *func_args) -> Future:
+    """Run func on a thread of its own, attributing its events to the current job."""
+    future: Future = Future()
+    context = contextvars.copy_context()
+    
+    def run():
+        try:
+            future.set_result(context.run(func, *func_args))
+        except Exception as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
+
+
+def ytspleet_parse_tracklist(args: YTSpleetSingleFileArgs, cancel_download: Optional[threading.Event] = None) -> Tracklist:
+    """
+    Find and parse the tracklist of a --guess-chapters job.
+
+    Args:
+        args: The job
+        cancel_download: Set when the parse fails or finds no tracks and
+            args.on_parse_failure is 'cancel'
+
+    Returns:
+        The tracklist (with at least one track)
+    """
+    try:
+        stage = tracklist_stage()
+        if stage is not None:
+            # Looked up (rate limited) by the batch's tracklist stage
+            tracklist = stage.submit(args.source_youtube_url).result()
+        else:
+            with events.stage('tracklist') as stage_fields:
+                tracklist = parse_tracklist_from_url(
+                    args.source_youtube_url,
+                    model=args.llm_model,
+                    min_confidence=args.tracklist_min_confidence,
+                    max_comments=args.max_comments
+                )
+                stage_fields['tracks'] = len(tracklist.tracks)
+                stage_fields['parser'] = tracklist.parser
+                stage_fields['confidence'] = tracklist.confidence
+        if not tracklist.tracks:
+            raise Exception(f"No tracks found in the tracklist of {args.source_youtube_url}")
+    except Exception:
+        if cancel_download is not None and args.on_parse_failure == 'cancel':
+            print("Tracklist parse failed, cancelling the full audio download")
+            cancel_download.set()
+        else:
+            print("Tracklist parse failed, keeping the full audio download for a later run")
+        raise
+    return tracklist
+
+
+def ytspleet_download_full_audio(args: YTSpleetSingleFileArgs, video_title: Optional[str] = None,
+                                 cancel: Optional[threading.Event] = None) -> Tuple[str, str]:
+    """
+    Download the full audio a tracklist is split from.
+
+    Returns:
+        Tuple of (output_directory, full_audio_path)
+    """
+    print("--------------------------")
+    print("DOWNLOADING FULL AUDIO")
+    print("--------------------------")
+    
+    with events.stage('download') as stage_fields:
+        output_dir, full_audio_path = download_tracklist_audio(
+            args.source_youtube_url,
+            args.po_token,
+            args.output_folder,
+            video_title,
+            args.intermediate,
+            cancel
+        )
+        stage_fields.update(events.file_fields(full_audio_path))
+    return output_dir, full_audio_path
+
+
+def ytspleet_download_tracklist(args: YTSpleetSingleFileArgs, tracklist: Tracklist, mode: str, video_title: Optional[str] = None) -> Optional[DownloadedAudio]:
+    """
+    Download the full audio once and split it into the tracks of a tracklist.
+
+    Returns:
+        The full audio if its stems should be sliced per track, else None
+    """
+    output_dir, full_audio_path = ytspleet_download_full_audio(args, video_title)
+    return ytspleet_split_tracklist(args, tracklist, mode, output_dir, full_audio_path)
+
+
+def ytspleet_split_tracklist(args: YTSpleetSingleFileArgs, tracklist: Tracklist, mode: str, output_dir: str, full_audio_path: str) -> Optional[DownloadedAudio]:
+    """
+    Split the downloaded full audio into the tracks of a tracklist.
+
+    Returns:
+        The full audio if its stems should be sliced per track, else None
+    """
+    print("--------------------------")
+    print("SPLITTING TRACKS")
+    print("--------------------------")
+    
+    with events.stage('split', tracks=len(tracklist.tracks)):
+        split_tracklist_audio(output_dir, full_audio_path, tracklist)
+    
+    if args.separate_tracks and not args.dl_only:
+        return DownloadedAudio(full_audio_path, tracklist, output_dir)
+    
+    print("--------------------------")
+    print(f"Download complete ({mode} mode)")
+    print("--------------------------")
+    print(f"Output: '{output_dir}'")
+    return None
+
+
+def ytspleet_download_window(args: YTSpleetSingleFileArgs, range_seconds: Tuple[int, int], video_title: Optional[str] = None, journal: Optional[Journal] = None) -> Optional[DownloadedAudio]:
+    """
+    Download a window that overlaps other windows of the same video: the merged
+    span is downloaded once and the window is cut from it locally.
+
+    Returns:
+        The window, with the span whose stems are sliced for it, or None in
+        download-only mode
+    """
+    span_range = (format_timestamp(args.span[0]), format_timestamp(args.span[1]))
+    journal_mark(journal, args.source_youtube_url, 'download')
+    with events.stage('download', span=True) as stage_fields:
+        with span_lock('download', get_video_id(args.source_youtube_url), args.span):
+            print(f"Downloading merged span: {span_range[0]} to {span_range[1]}")
+            span_path = run_ytdl(args.source_youtube_url, args.po_token, args.output_folder, False, span_range, video_title, args.intermediate)
+        # Cut from the span through the download index
+        window_range = (format_timestamp(range_seconds[0]), format_timestamp(range_seconds[1]))
+        mp3_path = run_ytdl(args.source_youtube_url, args.po_token, args.output_folder, False, window_range, video_title, args.intermediate)
+        stage_fields.update(events.file_fields(mp3_path))
+
+    if args.dl_only:
+        print("--------------------------")
+        print("Download complete (--dl-only mode, skipping stem separation)")
+        print("--------------------------")
+        print(f"Output: '{mp3_path}'")
+        return None
+
+    span_slice = (range_seconds[0] - args.span[0], range_seconds[1] - args.span[0])
+    return DownloadedAudio(mp3_path, span_audio_path=span_path, span_slice=span_slice)
+
+
+def separate_audio(args: YTSpleetSingleFileArgs, mp3_path: str, engine: Optional[DemucsEngine] = None, stem_cache: Optional[StemCache] = None, batcher: Optional[DemucsBatcher] = None) -> str:
+    """
+    Split downloaded audio into vocals and accompaniment next to it, using the stem
+    cache and the windowed path for long inputs where applicable.
+
+    Returns:
+        Directory containing the stems
+    """
+    cache_key = None
+    if stem_cache is not None:
+        with events.stage('stem_cache') as stage_fields:
+            cache_key = stem_cache_key(mp3_path, DEMUCS_MODEL, DEMUCS_STEM_MODE, args.output_codec)
+            stage_fields['hit'] = stem_cache.lookup(cache_key, stem_output_paths(mp3_path, args.output_codec))
+        if stage_fields['hit']:
+            print(f"Stems found in cache, skipping Demucs. Output files in: '{os.path.dirname(mp3_path)}'")
+            return os.path.dirname(mp3_path)
+
+    duration = probe_audio_duration(mp3_path)
+    long_input = is_long_input(mp3_path, args.long_input_minutes, duration)
+
+    # Only start while the estimated peak memory fits next to the running separations
+    admission = contextlib.nullcontext()
+    budget = memory_budget()
+    if budget is not None and batcher is not None and not long_input and engine is None:
+        # Batches reserve their memory themselves
+        budget = None
+    if budget is not None:
+        # Without Demucs importable here, long inputs are separated in one piece too
+        windowed = long_input and (engine is not None or demucs_engine_available())
+        estimate_mb = estimate_separation_mb(duration, windowed)
+        if not budget.fits(estimate_mb) and not long_input and (engine is not None or demucs_engine_available()):
+            print(f"Estimated {estimate_mb:.0f} MB exceeds the memory budget of {budget.budget_mb:.0f} MB, separating in windows")
+            long_input = True
+            estimate_mb = estimate_separation_mb(duration, chunked=True)
+        elif not budget.fits(estimate_mb):
+            print(f"Estimated {estimate_mb:.0f} MB exceeds the memory budget of {budget.budget_mb:.0f} MB, separating it on its own")
+        admission = budget.reserve(estimate_mb)
+
+    with admission:
+        output_dir = run_separation(args, mp3_path, long_input, engine, batcher, duration)
+
+    if cache_key is not None:
+        stem_cache.store(cache_key, stem_output_paths(mp3_path, args.output_codec))
+
+    return output_dir
+
+
+def run_separation(args: YTSpleetSingleFileArgs, mp3_path: str, long_input: bool, engine: Optional[DemucsEngine] = None, batcher: Optional[DemucsBatcher] = None, duration: Optional[float] = None) -> str:
+    """Run Demucs on the backend that fits: the engine or a (batched) subprocess, windowed for long inputs."""
+    if long_input and engine is not None:
+        output_dir, _ = engine.run_chunked(mp3_path, args.output_codec)
+    elif long_input and demucs_engine_available():
+        output_dir, _ = run_demucs_chunked(mp3_path, codec=args.output_codec)
+    elif engine is not None:
+        output_dir, _ = engine.run(mp3_path, codec=args.output_codec)
+    elif batcher is not None and not long_input:
+        output_dir, _ = batcher.run(mp3_path, codec=args.output_codec, duration=duration)
+    else:
+        if long_input:
+            print("Warning: Demucs is not importable here, separating the long input in one piece")
+        output_dir, _ = run_demucs(mp3_path, codec=args.output_codec)
+    return output_dir
+
+
+def ytspleet_separate(args: YTSpleetSingleFileArgs, downloaded: DownloadedAudio, engine: Optional[DemucsEngine] = None, stem_cache: Optional[StemCache] = None, batcher: Optional[DemucsBatcher] = None) -> str:
+    """
+    Separation stage: split downloaded audio into vocals and accompaniment.
+
+    Args:
+        args: Job arguments
+        downloaded: Audio returned by the download stage
+        engine: Optional resident Demucs engine (default: run a Demucs subprocess)
+        stem_cache: Optional stem cache consulted before running Demucs
+        batcher: Optional batcher sharing Demucs subprocesses between short tracks
+
+    Returns:
+        Directory containing the stems
+    """
     print("--------------------------")
     print("STARTING STEP 2: Demucs")
     print("--------------------------")
-    output_dir, _ = run_demucs(mp3_path, args.output_folder)
+    if downloaded.span_audio_path is not None:
+        # One separation for all the windows in the span, sliced per window
+        with span_lock('separate', downloaded.span_audio_path):
+            span_stems = stem_output_paths(downloaded.span_audio_path, args.output_codec).values()
+            if not all(os.path.exists(path) for path in span_stems):
+                separate_audio(args, downloaded.span_audio_path, engine, stem_cache, batcher)
+        output_dir = os.path.dirname(downloaded.audio_path)
+        with events.stage('slice_stems') as stage_fields:
+            stage_fields['stems'] = slice_stems(downloaded.span_audio_path, downloaded.audio_path, *downloaded.span_slice, args.output_codec)
+    else:
+        output_dir = separate_audio(args, downloaded.audio_path, engine, stem_cache, batcher)
+
+    if downloaded.tracklist is not None:
+        # One separation for the whole video, sliced at the track boundaries
+        output_dir = downloaded.output_dir
+        with events.stage('slice_stems') as stage_fields:
+            count = split_stems_by_tracklist(downloaded.audio_path, downloaded.tracklist, output_dir, args.output_codec)
+            stage_fields['tracks'] = count
+        print(f"Sliced {count} track stem(s)")
 
     print(f"Processing complete. Output files in: '{output_dir}'")
     print("Files:", os.listdir(output_dir))
+    return output_dir
+
+
+def download_stage(args: YTSpleetSingleFileArgs, journal: Optional[Journal] = None) -> Optional[DownloadedAudio]:
+    """Pipeline download stage: ytspleet_download plus journal bookkeeping."""
+    url = args.source_youtube_url
+    if journal is not None:
+        journal.start(url)
+    try:
+        with events.job(url), events.stage('download_stage'):
+            downloaded = ytspleet_download(args, journal)
+    except Exception as e:
+        if journal is not None:
+            journal.fail(url, str(e))
+        raise
+    if downloaded is None:
+        journal_mark(journal, url, 'done')
+    return downloaded
+
+
+def separate_stage(args: YTSpleetSingleFileArgs, downloaded: DownloadedAudio, engine: Optional[DemucsEngine] = None, stem_cache: Optional[StemCache] = None, journal: Optional[Journal] = None, cpu_slots: Optional[CpuSlots] = None, batcher: Optional[DemucsBatcher] = None) -> str:
+    """Pipeline separation stage: ytspleet_separate plus journal bookkeeping."""
+    url = args.source_youtube_url
+    journal_mark(journal, url, 'separate', downloaded.audio_path)
+    # A window waits for its span's separation before taking a CPU slot, so
+    # it doesn't hold a slot while idle
+    span = span_lock('separate', downloaded.span_audio_path) if downloaded.span_audio_path is not None else contextlib.nullcontext()
+    slot = cpu_slots.slot() if cpu_slots is not None else contextlib.nullcontext()
+    try:
+        with events.job(url), events.stage('separate_stage'), span, slot:
+            output_dir = ytspleet_separate(args, downloaded, engine, stem_cache, batcher)
+    except Exception as e:
+        if journal is not None:
+            journal.fail(url, str(e))
+        raise
+    journal_mark(journal, url, 'done', output_dir)
+    return output_dir
+
 
+def print_journal_status(journal: Journal):
+    summary = journal.summary()
+    total = sum(count for stage, count in summary.items() if stage != 'failed')
+    print(f"Journal: {journal.path}")
+    print(f"  {total} URL(s): " + ", ".join(f"{stage} {count}" for stage, count in summary.items()))
+    for playlist_url, listed, removed, last_sync in journal.playlists():
+        print(f"  Playlist {playlist_url}: {listed} video(s), {removed} removed, synced {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_sync))}")
+    for url, stage, error, attempts in journal.failures():
+        print(f"  FAILED at {stage} after {attempts} attempt(s): {url}: {error.splitlines()[0] if error else ''}")
 
-def expand_playlist_urls(urls: list[str], full_playlist: bool) -> list[str]:
+
+def ytspleet_single_file(args: YTSpleetSingleFileArgs):
+    downloaded = ytspleet_download(args)
+    if downloaded is None:
+        return
+    ytspleet_separate(args, downloaded)
+
+
+def video_key(url: str) -> str:
+    """Identity of a URL's video, for removing duplicates."""
+    try:
+        return get_video_id(url)
+    except ValueError:
+        return url
+
+
+def expand_playlist_urls(urls: list[str], full_playlist: bool, on_listed: Optional[Callable[[str, list[str]], None]] = None) -> Iterator[str]:
     """
     Expand URLs to include all videos from playlists if --full-playlist is set.
     
+    Playlists are expanded concurrently and their videos are yielded as soon as
+    yt-dlp lists them, after the URLs that need no expansion. A video that
+    shows up more than once (e.g. in two playlists) is yielded once.
+    
     Args:
         urls: List of YouTube URLs
         full_playlist: Whether to expand playlist URLs
+        on_listed: Called with (playlist_url, video_urls) once a playlist has
+            been listed completely
         
-    Returns:
-        Expanded list of video URLs
+    Yields:
+        Video URLs
     """
-    if not full_playlist:
-        return urls
+    seen = set()
     
-    expanded_urls = []
+    def first_time(url: str) -> bool:
+        # Different t= offsets of a video are different windows of it
+        key = (video_key(url), extract_timestamp_from_url(url))
+        if key in seen:
+            return False
+        seen.add(key)
+        return True
+    
+    playlists = [url for url in urls if full_playlist and 'list=' in url]
     for url in urls:
-        # Check if URL contains a playlist parameter
-        if 'list=' in url:
-            print(f"Expanding playlist: {url}")
-            try:
-                playlist_urls = get_playlist_video_urls(url)
-                expanded_urls.extend(playlist_urls)
-                print(f"  Added {len(playlist_urls)} videos from playlist")
-            except Exception as e:
-                print(f"  Warning: Failed to expand playlist, using original URL: {e}")
-                expanded_urls.append(url)
-        else:
-            expanded_urls.append(url)
+        if url not in playlists and first_time(url):
+            yield url
+    if not playlists:
+        return
+    
+    found: queue.Queue = queue.Queue()
+    finished = object()
+    
+    def expand(playlist_url: str):
+        listed = []
+        try:
+            for video_url in iter_playlist_video_urls(playlist_url):
+                found.put(video_url)
+                listed.append(video_url)
+            print(f"  Added {len(listed)} videos from playlist {playlist_url}")
+            if on_listed is not None:
+                on_listed(playlist_url, listed)
+        except Exception as e:
+            print(f"  Warning: Failed to expand playlist, using original URL: {e}")
+            if not listed:
+                found.put(playlist_url)
+        finally:
+            found.put(finished)
     
-    return expanded_urls
+    for url in playlists:
+        print(f"Expanding playlist: {url}")
+        threading.Thread(target=expand, args=(url,), name='expand', daemon=True).start()
+    
+    remaining = len(playlists)
+    while remaining:
+        url = found.get()
+        if url is finished:
+            remaining -= 1
+        elif first_time(url):
+            yield url
+
+
+def plan_time_windows(jobs: Iterable[YTSpleetSingleFileArgs]) -> Iterator[YTSpleetSingleFileArgs]:
+    """
+    Merge the overlapping or adjacent time windows of each video as the jobs
+    arrive. Windows that share a merged span get it as their span, so it is
+    downloaded and separated once and the windows are cut from it.
+
+    Jobs are passed on as they arrive (playlists are still streamed): only the
+    windows of the video the latest job is for are held back, until a job for
+    another video or the end of the batch shows they are complete. A later
+    window that falls inside a span already planned for its video joins it.
+    """
+    spans: dict[str, list[Tuple[int, int]]] = {}
+    held: list[tuple[YTSpleetSingleFileArgs, Tuple[int, int]]] = []
+    held_video = None
+
+    def release() -> list[YTSpleetSingleFileArgs]:
+        for span in merge_time_ranges(range_seconds for _, range_seconds in held):
+            members = [job for job, (start, end) in held if span[0] <= start and end <= span[1]]
+            if len(members) > 1:
+                print(f"Merged {len(members)} windows of {held_video} into {format_timestamp(span[0])}-{format_timestamp(span[1])}")
+                spans.setdefault(held_video, []).append(span)
+                for job in members:
+                    job.span = span
+        released = [job for job, _ in held]
+        held.clear()
+        return released
+
+    for job in jobs:
+        range_seconds = None if job.split_chapters or job.guess_chapters else job_time_range(job)
+        if range_seconds is None:
+            yield job
+            continue
+        video_id = video_key(job.source_youtube_url)
+        if video_id != held_video:
+            yield from release()
+            held_video = video_id
+        span = next((span for span in spans.get(video_id, []) if span[0] <= range_seconds[0] and range_seconds[1] <= span[1]), None)
+        if span is not None:
+            job.span = span
+            yield job
+            continue
+        held.append((job, range_seconds))
+    yield from release()
+
+
+def retire_video(journal: Journal, output_folder: Optional[str], url: str):
+    """Move the output folder(s) of a video into OUTPUT_FOLDER/retired."""
+    base_output_folder = output_folder if output_folder else YTSPLEET_DEFAULT_OUTPUT_FOLDER
+    retired_folder = os.path.join(base_output_folder, 'retired')
+    for video_dir in glob.glob(os.path.join(base_output_folder, f"*-{glob.escape(video_key(url))}")):
+        target = os.path.join(retired_folder, os.path.basename(video_dir))
+        if os.path.exists(target):
+            print(f"  Warning: {target} already exists, leaving {video_dir} in place")
+            continue
+        os.makedirs(retired_folder, exist_ok=True)
+        shutil.move(video_dir, target)
+        print(f"  Retired {os.path.basename(video_dir)}")
+    journal_mark(journal, url, 'retired')
+
+
+def sync_playlist_snapshot(journal: Journal, output_folder: Optional[str], retire_removed: bool, playlist_url: str, urls: list[str]):
+    """Store a playlist's listing for --sync and handle the videos it no longer lists."""
+    removed = journal.sync_playlist(playlist_url, urls)
+    if not removed:
+        return
+    print(f"  {len(removed)} video(s) were removed from playlist {playlist_url}")
+    for url in removed:
+        if not retire_removed:
+            print(f"  Removed: {url}")
+        elif journal.still_listed(url):
+            print(f"  Not retiring {url}, another synced playlist still lists it")
+        else:
+            retire_video(journal, output_folder, url)
+
+
+def batch_urls(urls: Iterable[str], journal: Journal, prefetcher: TitlePrefetcher, resume: bool = False) -> Iterator[str]:
+    """
+    Record the URLs of a batch in the journal as they arrive, skip the ones
+    already done when resuming, and start looking their titles up.
+    """
+    done = journal.done_urls() if resume else set()
+    for url in urls:
+        journal.add([url])
+        if url in done:
+            continue
+        video_id = video_key(url)
+        if video_id != url:
+            prefetcher.submit(video_id)
+        yield url
+
+
+def submit_tracklists_ahead(jobs: Iterable[YTSpleetSingleFileArgs], stage: TracklistStage, look_ahead: int) -> Iterator[YTSpleetSingleFileArgs]:
+    """
+    Submit the tracklist of every job to the stage as soon as it arrives,
+    rather than when a download worker picks the job up, so the lookups run
+    ahead of the downloads at the pace the rate limits allow.
+
+    At most look_ahead jobs are read ahead of the pipeline, which keeps its
+    backpressure on a long playlist.
+    """
+    arrived: queue.Queue = queue.Queue(maxsize=max(1, look_ahead))
+    done = object()
+
+    def feed():
+        try:
+            for job in jobs:
+                stage.submit(job.source_youtube_url)
+                arrived.put(job)
+        except Exception as e:
+            arrived.put(e)
+        finally:
+            arrived.put(done)
+
+    threading.Thread(target=feed, name='tracklists-feed', daemon=True).start()
+    while True:
+        job = arrived.get()
+        if job is done:
+            return
+        if isinstance(job, Exception):
+            raise job
+        yield job
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--urls', nargs='+', required=True, help='YouTube URLs to download and process')
+    parser.add_argument('--urls', nargs='+', help='YouTube URLs to download and process (required unless --resume or --status)')
     parser.add_argument('--po-token', help='YouTube PO token for authentication (optional, helps with DRM issues)')
     parser.add_argument('--cookies', help='Path to cookies file for YouTube authentication (optional)')
     parser.add_argument('-o', '--output-folder', help='Custom output folder path (optional, overrides default)')
@@ -256,29 +842,168 @@ def main():
     parser.add_argument('--timestamp', '-t', help='Center timestamp for extraction (formats: "123", "2:30", "1:02:30", or auto-detected from URL)')
     parser.add_argument('--window', '-w', type=int, default=None, help='Minutes on each side of timestamp (default: 4 when -t used). Enables URL timestamp detection.')
     parser.add_argument('--guess-chapters', action='store_true', help='Parse tracklist from YouTube comment using AI (requires OPENAI_API_KEY)')
+    parser.add_argument('--separate-tracks', action='store_true', help='With --split-chapters/--guess-chapters: separate the full audio once and slice vocal/accompaniment stems per track')
     parser.add_argument('--llm-model', default='gpt-5-mini', help='LLM model for tracklist parsing (default: gpt-5-mini)')
+    parser.add_argument('--tracklist-min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE, help='With --guess-chapters: use the local tracklist parse when it is at least this confident (0-1), else ask the LLM (default: %(default)s, above 1 always uses the LLM)')
+    parser.add_argument('--max-comments', type=int, default=DEFAULT_MAX_COMMENTS, help='With --guess-chapters: most top comments searched for a tracklist, after the first 20 (default: %(default)s)')
+    parser.add_argument('--on-parse-failure', choices=['keep', 'cancel'], default='keep', help='With --guess-chapters: keep or cancel the full audio download (which runs while the tracklist is parsed) when no tracklist is found (default: %(default)s)')
+    parser.add_argument('--llm-rpm', type=float, default=DEFAULT_LLM_REQUESTS_PER_MINUTE, help='With --guess-chapters: LLM requests per minute across the batch (default: %(default)s, 0 for no limit)')
+    parser.add_argument('--llm-concurrency', type=int, default=DEFAULT_LLM_CONCURRENCY, help='With --guess-chapters: concurrent LLM requests (default: %(default)s)')
+    parser.add_argument('--comment-rpm', type=float, default=DEFAULT_FETCH_REQUESTS_PER_MINUTE, help='With --guess-chapters: comment fetches per minute across the batch (default: %(default)s, 0 for no limit)')
+    parser.add_argument('--comment-concurrency', type=int, default=DEFAULT_FETCH_CONCURRENCY, help='With --guess-chapters: concurrent comment fetches (default: %(default)s)')
+    parser.add_argument('--tracklist-cache', default=DEFAULT_TRACKLIST_CACHE_PATH, help='SQLite cache of LLM-parsed tracklists (default: %(default)s)')
+    parser.add_argument('--tracklist-cache-size', type=int, default=DEFAULT_TRACKLIST_CACHE_ENTRIES, help='Tracklists kept in the cache, least recently used are evicted (default: %(default)s)')
+    parser.add_argument('--no-tracklist-cache', action='store_true', help='Keep LLM-parsed tracklists in memory for this run only')
+    parser.add_argument('--download-workers', type=int, default=default_download_workers(), help='Number of concurrent downloads (default: %(default)s)')
+    parser.add_argument('--separate-workers', type=int, default=None, help='Number of concurrent Demucs separations (default: the split of the cores with the most tracks per hour, bounded by available memory)')
+    parser.add_argument('--demucs-threads', type=int, default=None, help='Torch/OpenMP/MKL threads per Demucs separation (default: the cores divided by the separation workers)')
+    parser.add_argument('--memory-budget-mb', type=float, default=default_memory_budget_mb(), help='Memory the concurrent separations may use together; separations wait for room and inputs too large for it are separated in windows (default: 80%% of the available memory, 0 disables)')
+    parser.add_argument('--pin-cpus', action='store_true', help='Pin every separation worker to its own set of CPUs')
+    parser.add_argument('--demucs-parallel-fraction', type=float, default=DEMUCS_PARALLEL_FRACTION, help='CPU split model: share of a Demucs run that speeds up with more threads (default: %(default)s)')
+    parser.add_argument('--demucs-worker-contention', type=float, default=DEMUCS_WORKER_CONTENTION, help='CPU split model: slowdown of every separation per additional concurrent separation (default: %(default)s)')
+    parser.add_argument('--intermediate', choices=INTERMEDIATE_FORMATS, default=DEFAULT_INTERMEDIATE_FORMAT, help='Format the download is kept in and fed to Demucs: "native" keeps YouTube\'s opus/m4a stream without re-encoding, flac/wav are lossless (default: mp3)')
+    parser.add_argument('--output-codec', choices=OUTPUT_CODECS, default=DEMUCS_OUTPUT_CODEC, help='Codec of the vocals/accompaniment stems (default: mp3)')
+    parser.add_argument('--ytdl-backend', choices=YTDL_BACKENDS, default='auto', help='Run yt-dlp in-process with a reused YoutubeDL per worker ("inprocess") or as one subprocess per command (default: auto, inprocess when yt_dlp is importable)')
+    parser.add_argument('--demucs-backend', choices=['auto', 'engine', 'subprocess'], default='auto', help='Run Demucs in resident worker processes ("engine") or as one subprocess per track (default: auto, engine when Demucs is importable)')
+    parser.add_argument('--demucs-batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='With the subprocess backend: separate up to this many short tracks in one Demucs run, loading the model once (default: %(default)s, 1 disables)')
+    parser.add_argument('--demucs-batch-minutes', type=float, default=DEFAULT_BATCH_MAX_MINUTES, help='Maximum total duration of a Demucs batch in minutes (default: %(default)s)')
+    parser.add_argument('--demucs-batch-wait', type=float, default=DEFAULT_BATCH_MAX_WAIT_SECONDS, help='Seconds a track waits for others to join its Demucs batch (default: %(default)s)')
+    parser.add_argument('--long-input-minutes', type=float, default=DEFAULT_LONG_INPUT_MINUTES, help='Separate inputs longer than this in overlapping windows with bounded memory (default: %(default)s, 0 disables)')
+    parser.add_argument('--stem-cache-dir', default=DEFAULT_STEM_CACHE_FOLDER, help='Directory of the content-addressed stem cache (default: %(default)s)')
+    parser.add_argument('--stem-cache-size', type=float, default=DEFAULT_STEM_CACHE_SIZE_GB, help='Stem cache size limit in GB, least recently used entries are evicted (default: %(default)s)')
+    parser.add_argument('--no-stem-cache', action='store_true', help='Always run Demucs, even for audio that was separated before')
+    parser.add_argument('--metadata-cache', default=DEFAULT_METADATA_CACHE_PATH, help='SQLite cache of video titles (default: %(default)s)')
+    parser.add_argument('--metadata-ttl-days', type=float, default=DEFAULT_METADATA_TTL_DAYS, help='Look cached titles up again after this many days (default: %(default)s)')
+    parser.add_argument('--no-metadata-cache', action='store_true', help='Keep looked up titles in memory for this run only')
+    parser.add_argument('--download-index', default=DEFAULT_DOWNLOAD_INDEX_PATH, help='SQLite index of downloaded audio, shared by all output folders (default: %(default)s)')
+    parser.add_argument('--no-download-index', action='store_true', help='Only reuse downloads made in this run or found in the output folder')
+    parser.add_argument('--metadata-workers', type=int, default=DEFAULT_LOOKUP_WORKERS, help='Concurrent title lookups for the batch (default: %(default)s)')
+    parser.add_argument('--queue-size', type=int, default=None, help='Maximum downloaded files waiting for separation (default: 2 per separation worker)')
+    parser.add_argument('--resume', action='store_true', help='Continue the unfinished work recorded in the output folder\'s journal (with --urls: skip URLs already done)')
+    parser.add_argument('--sync', action='store_true', help='Incremental playlist sync (implies --full-playlist): only process videos that are new or unfinished since the last sync, using the playlist snapshots in the journal')
+    parser.add_argument('--retire-removed', action='store_true', help='With --sync: move the output folders of videos removed from a playlist to OUTPUT_FOLDER/retired')
+    parser.add_argument('--events-file', help='JSON lines file for per-stage timing events (default: OUTPUT_FOLDER/.yt-spleet-events.jsonl)')
+    parser.add_argument('--status', action='store_true', help='Print batch progress from the output folder\'s journal and exit')
     parsed = parser.parse_args()
+    if not (parsed.urls or parsed.resume or parsed.status):
+        parser.error('--urls is required unless --resume or --status is given')
+    if parsed.sync and not parsed.urls:
+        parser.error('--sync requires playlist --urls')
+
+    journal = Journal(journal_path(parsed.output_folder))
+    if parsed.status:
+        print_journal_status(journal)
+        return
+
+    set_ytdl_backend(parsed.ytdl_backend)
+
+    events.configure_events(parsed.events_file or events.events_path(parsed.output_folder))
+    events.emit('batch_start')
+
+    # Titles are looked up in the background, concurrently, as URLs arrive
+    configure_metadata_cache(None if parsed.no_metadata_cache else parsed.metadata_cache, parsed.metadata_ttl_days)
+    prefetcher = start_title_prefetch(parsed.metadata_workers)
+
+    # Audio downloaded before (into any output folder) is linked or cut locally
+    configure_download_index(None if parsed.no_download_index else parsed.download_index)
+
+    # Comments the LLM parsed before are not sent to it again
+    configure_tracklist_cache(None if parsed.no_tracklist_cache else parsed.tracklist_cache, parsed.tracklist_cache_size)
 
-    # Expand playlist URLs if requested
-    urls = expand_playlist_urls(parsed.urls, parsed.full_playlist)
-    print(f"Processing {len(urls)} video(s)")
-
-    # Set the number of processes to the number of URLs or your preferred limit
-    max_workers = len(urls)  # Or set a fixed number like 4 or 8, etc.
-
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(ytspleet_single_file, YTSpleetSingleFileArgs(
-            url, parsed.output_folder, parsed.po_token, parsed.dl_only, 
-            parsed.split_chapters, parsed.timestamp, parsed.window,
-            parsed.guess_chapters, parsed.llm_model
-        )) for url in urls]
-        for future in futures:
-            # If you need to handle results or exceptions, do it here
-            try:
-                result = future.result()  # This will block until the future is completed
-                print("Process completed successfully", result)
-            except Exception as exc:
-                print("Generated an exception: ", exc)
+    if parsed.resume and not parsed.urls:
+        # Continue from the journal without re-expanding playlists
+        urls = batch_urls(journal.unfinished(), journal, prefetcher)
+    else:
+        # Expand playlist URLs if requested; downloads start while playlists are still being listed
+        on_listed = None
+        if parsed.sync:
+            # Snapshot every playlist; videos done in an earlier sync are skipped below
+            on_listed = functools.partial(sync_playlist_snapshot, journal, parsed.output_folder, parsed.retire_removed)
+        expanded = expand_playlist_urls(parsed.urls, parsed.full_playlist or parsed.sync, on_listed)
+        urls = batch_urls(expanded, journal, prefetcher, parsed.resume or parsed.sync)
+
+    # Consumed lazily by the pipeline
+    jobs = (YTSpleetSingleFileArgs(
+        url, parsed.output_folder, parsed.po_token, parsed.dl_only,
+        parsed.split_chapters, parsed.timestamp, parsed.window,
+        parsed.guess_chapters, parsed.llm_model, parsed.long_input_minutes,
+        parsed.separate_tracks, parsed.intermediate, parsed.output_codec,
+        tracklist_min_confidence=parsed.tracklist_min_confidence,
+        max_comments=parsed.max_comments,
+        on_parse_failure=parsed.on_parse_failure
+    ) for url in urls)
+    if parsed.timestamp or parsed.window is not None:
+        # Windows of the same video are merged before anything is downloaded
+        jobs = plan_time_windows(jobs)
+    if parsed.guess_chapters:
+        # Tracklists are looked up concurrently, within shared rate limits,
+        # as the URLs arrive; download workers wait on them
+        stage = start_tracklist_stage(
+            model=parsed.llm_model, min_confidence=parsed.tracklist_min_confidence, max_comments=parsed.max_comments,
+            llm_per_minute=parsed.llm_rpm, llm_concurrency=parsed.llm_concurrency,
+            fetch_per_minute=parsed.comment_rpm, fetch_concurrency=parsed.comment_concurrency
+        )
+
+    stem_cache = None if parsed.no_stem_cache else create_stem_cache(parsed.stem_cache_dir, parsed.stem_cache_size)
+
+    # Split the cores across the separation workers instead of letting every
+    # Demucs run size its thread pools to all of them
+    plan = plan_threads(parsed.separate_workers, parsed.demucs_threads, parsed.pin_cpus,
+                        parallel_fraction=parsed.demucs_parallel_fraction, contention=parsed.demucs_worker_contention)
+    print(f"CPU plan: {plan.describe()}")
+    configure_thread_plan(plan)
+    cpu_slots = CpuSlots(plan)
+    configure_memory_budget(parsed.memory_budget_mb)
+
+    engine = None
+    if not parsed.dl_only and (parsed.separate_tracks or not (parsed.split_chapters or parsed.guess_chapters)):
+        engine = create_demucs_engine(parsed.demucs_backend, plan.workers, plan)
+
+    # Without the engine, short tracks share Demucs subprocesses (one model
+    # load per batch). More separation threads wait on the batcher than Demucs
+    # runs at once, so it has tracks to batch; it takes the CPU slots itself.
+    batcher = None
+    separate_workers = plan.workers
+    if engine is None and not parsed.dl_only and parsed.demucs_batch_size > 1:
+        batcher = DemucsBatcher(plan.workers, parsed.demucs_batch_size, parsed.demucs_batch_minutes, parsed.demucs_batch_wait, cpu_slots)
+        separate_workers = plan.workers * parsed.demucs_batch_size
+        cpu_slots = None
+
+    if parsed.guess_chapters:
+        # Look up as many tracklists ahead as the download workers and the
+        # separation queue can hold
+        queue_size = parsed.queue_size if parsed.queue_size is not None else 2 * separate_workers
+        jobs = submit_tracklists_ahead(jobs, stage, parsed.download_workers * queue_size)
+
+    # Downloads feed separations through a bounded queue, so the next
+    # download overlaps with the current separation.
+    try:
+        results = run_pipeline(
+            jobs,
+            functools.partial(download_stage, journal=journal),
+            functools.partial(separate_stage, engine=engine, stem_cache=stem_cache, journal=journal, cpu_slots=cpu_slots, batcher=batcher),
+            download_workers=parsed.download_workers,
+            separate_workers=separate_workers,
+            queue_size=parsed.queue_size,
+        )
+    finally:
+        if engine is not None:
+            engine.shutdown()
+        if batcher is not None:
+            batcher.close()
+        stop_tracklist_stage()
+        stop_title_prefetch()
+    print(f"Processed {len(results)} video(s)")
+    for result in results:
+        if result.error is not None:
+            print("Generated an exception: ", result.error)
+        else:
+            print("Process completed successfully", result.result)
+    events.emit('batch_end', urls=len(results), failed=sum(result.error is not None for result in results))
+    events.print_stage_summary()
+    print_tracklist_parser_stats()
+    print_journal_status(journal)
+    journal.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,33 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src.lib.tracklist_cache import configure_tracklist_cache
+
+
+class FakeCompletion:
+    """Local stand-in for litellm's completion(), answering with fixed tracks."""
+
+    def __init__(self, tracks=None):
+        self.tracks = tracks if tracks is not None else [
+            {"number": 1, "title": "Kerala", "artist": "Bonobo", "start_time": "0:00"},
+            {"number": 2, "title": "Awake", "artist": "Tycho", "start_time": "4:12"},
+        ]
+        self.calls = []
+
+    def __call__(self, model, messages, response_format=None):
+        self.calls.append({"model": model, "messages": messages})
+        content = json.dumps({"tracks": self.tracks})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def fake_completion():
+    return FakeCompletion()
+
+
+@pytest.fixture(autouse=True)
+def memory_tracklist_cache():
+    # Every test starts with an empty in-memory cache instead of ~/.cache
+    configure_tracklist_cache(None)
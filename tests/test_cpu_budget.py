@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from src.lib import cpu_budget
+from src.lib.cpu_budget import CpuSlots, THREAD_ENV_VARS, ThreadPlan, plan_threads, relative_throughput, subprocess_cpus
+
+
+@pytest.fixture(autouse=True)
+def plenty_of_memory(monkeypatch):
+    monkeypatch.setattr(cpu_budget, 'available_memory_mb', lambda: 1024 ** 2)
+
+
+def test_given_workers_split_the_cores():
+    plan = plan_threads(workers=3, cpus=list(range(12)))
+    assert (plan.workers, plan.threads, plan.cpu_sets) == (3, 4, None)
+
+
+def test_given_threads_decide_the_workers():
+    plan = plan_threads(threads=3, cpus=list(range(8)))
+    assert (plan.workers, plan.threads) == (2, 3)
+
+
+def test_pinned_workers_get_disjoint_cpu_sets():
+    plan = plan_threads(workers=2, pin=True, cpus=[0, 1, 2, 3, 8, 9, 10, 11])
+    assert plan.cpu_sets == [[0, 1, 2, 3], [8, 9, 10, 11]]
+    assert plan.describe() == "2 separation worker(s) x 4 thread(s), pinned to 0-3, 8-11"
+
+
+def test_oversubscribed_plans_are_not_pinned():
+    plan = plan_threads(workers=4, threads=4, pin=True, cpus=list(range(8)))
+    assert plan.cpu_sets is None
+
+
+@pytest.mark.parametrize("cores", [1, 2, 4, 6, 7, 8, 12, 16, 24, 32, 48])
+def test_chosen_split_uses_every_core(cores):
+    plan = plan_threads(cpus=list(range(cores)))
+    assert plan.workers * plan.threads == cores
+    best = max(relative_throughput(workers, cores // workers) for workers in range(1, cores + 1) if cores % workers == 0)
+    assert relative_throughput(plan.workers, plan.threads) == pytest.approx(best)
+
+
+def test_model_constants_can_be_set():
+    # Without contention nothing beats a single-threaded worker per core
+    plan = plan_threads(cpus=list(range(16)), contention=0)
+    assert (plan.workers, plan.threads) == (16, 1)
+    # A perfectly parallel run gains nothing from more workers
+    plan = plan_threads(cpus=list(range(16)), parallel_fraction=1.0)
+    assert (plan.workers, plan.threads) == (1, 16)
+
+
+def test_workers_are_bounded_by_memory(monkeypatch):
+    monkeypatch.setattr(cpu_budget, 'available_memory_mb', lambda: 7000)
+    plan = plan_threads(cpus=list(range(64)), worker_memory_mb=3000)
+    assert plan.workers <= 2
+
+
+def test_plan_sizes_the_thread_pools_of_subprocesses():
+    env = ThreadPlan(2, 3).env()
+    assert all(env[name] == '3' for name in THREAD_ENV_VARS)
+
+
+def test_concurrent_separations_hold_different_cpu_sets():
+    slots = CpuSlots(ThreadPlan(2, 2, [[0, 1], [2, 3]]))
+    held = []
+    barrier = threading.Barrier(2)
+
+    def separate():
+        with slots.slot() as cpus:
+            held.append((cpus, subprocess_cpus()))
+            barrier.wait(timeout=5)
+
+    threads = [threading.Thread(target=separate) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(cpus for cpus, _ in held) == [[0, 1], [2, 3]]
+    assert all(cpus == seen for cpus, seen in held)
+    assert subprocess_cpus() is None
+
+
+@pytest.mark.parametrize("cores, split", [(4, (2, 2)), (8, (2, 4)), (16, (4, 4)), (32, (4, 8)), (64, (8, 8))])
+def test_contention_keeps_workers_multi_threaded(cores, split):
+    plan = plan_threads(cpus=list(range(cores)))
+    assert (plan.workers, plan.threads) == split
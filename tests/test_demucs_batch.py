@@ -0,0 +1,119 @@
+import os
+import threading
+
+import pytest
+
+from src.lib import demucs_batch
+from src.lib.demucs_batch import DemucsBatcher
+
+
+class Runs(list):
+    """Tracks of every Demucs invocation; batches leave out the tracks in failing."""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = set()
+
+
+@pytest.fixture
+def demucs(monkeypatch):
+    runs = Runs()
+    lock = threading.Lock()
+
+    def run_demucs_batch(mp3_paths, *args, **kwargs):
+        with lock:
+            runs.append(sorted(mp3_paths))
+        return [path for path in mp3_paths if path not in runs.failing], ''
+
+    def run_demucs(mp3_path, *args, **kwargs):
+        with lock:
+            runs.append([mp3_path])
+        return os.path.dirname(mp3_path), ''
+
+    monkeypatch.setattr(demucs_batch, 'run_demucs_batch', run_demucs_batch)
+    monkeypatch.setattr(demucs_batch, 'run_demucs', run_demucs)
+    return runs
+
+
+@pytest.fixture
+def batcher():
+    batchers = []
+
+    def create(*args, **kwargs):
+        kwargs.setdefault('max_wait_seconds', 0.3)
+        batchers.append(DemucsBatcher(*args, **kwargs))
+        return batchers[-1]
+
+    yield create
+    for batcher in batchers:
+        batcher.close()
+
+
+def submit_together(batcher, tracks):
+    """Submit (path, duration, codec) tracks from one thread each, at the same time."""
+    results = {}
+
+    def run(path, duration, codec):
+        results[path] = batcher.run(path, codec=codec, duration=duration)
+
+    threads = [threading.Thread(target=run, args=track) for track in tracks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def test_tracks_submitted_together_share_one_run(demucs, batcher):
+    tracks = [(f'/out/{name}/{name}.mp3', 240, 'mp3') for name in 'abc']
+    results = submit_together(batcher(1), tracks)
+    assert demucs == [['/out/a/a.mp3', '/out/b/b.mp3', '/out/c/c.mp3']]
+    assert results['/out/b/b.mp3'] == ('/out/b', '')
+
+
+def test_a_lone_track_runs_on_its_own(demucs, batcher):
+    submit_together(batcher(1), [('/out/a/a.mp3', 240, 'mp3')])
+    assert demucs == [['/out/a/a.mp3']]
+
+
+def test_batches_are_bounded_by_tracks_and_minutes(demucs, batcher):
+    tracks = [(f'/out/{i}/{i}.mp3', 240, 'mp3') for i in range(5)]
+    submit_together(batcher(2, max_tracks=2), tracks)
+    assert sorted(len(run) for run in demucs) == [1, 2, 2]
+
+    demucs.clear()
+    tracks = [(f'/out/{i}/{i}.mp3', 600, 'mp3') for i in range(4)]
+    submit_together(batcher(2, max_minutes=20), tracks)
+    assert sorted(len(run) for run in demucs) == [2, 2]
+
+
+def test_tracks_that_cant_share_a_run_are_kept_apart(demucs, batcher):
+    tracks = [
+        ('/out/a/mix.mp3', 240, 'mp3'),
+        ('/out/b/mix.mp3', 240, 'mp3'),   # Same file name: Demucs would write both to one place
+        ('/out/c/song.flac', 240, 'flac'),  # Other codec
+    ]
+    submit_together(batcher(1), tracks)
+    assert len(demucs) == 3
+    assert all(len(run) == 1 for run in demucs)
+
+
+def test_tracks_missing_from_a_batch_are_separated_alone(demucs, batcher):
+    demucs.failing.add('/out/b/b.mp3')
+    results = submit_together(batcher(1), [(f'/out/{name}/{name}.mp3', 240, 'mp3') for name in 'abc'])
+    assert demucs == [['/out/a/a.mp3', '/out/b/b.mp3', '/out/c/c.mp3'], ['/out/b/b.mp3']]
+    assert set(results) == {'/out/a/a.mp3', '/out/b/b.mp3', '/out/c/c.mp3'}
+
+
+def test_held_tracks_share_a_run_with_each_other(demucs, batcher):
+    tracks = [('/out/a/a.mp3', 240, 'mp3'), ('/out/b/b.flac', 240, 'flac'), ('/out/c/c.flac', 240, 'flac')]
+    submit_together(batcher(1), tracks)
+    # Whichever codec comes first, the other two are held and then run together
+    assert sorted(demucs) == [['/out/a/a.mp3'], ['/out/b/b.flac', '/out/c/c.flac']]
+
+
+def test_tracks_on_other_filesystems_are_kept_apart(demucs, batcher, monkeypatch):
+    monkeypatch.setattr(demucs_batch, '_device', lambda path: path.split('/')[1])
+    tracks = [('/mnt1/a/a.mp3', 240, 'mp3'), ('/mnt1/b/b.mp3', 240, 'mp3'), ('/mnt2/c/c.mp3', 240, 'mp3')]
+    submit_together(batcher(1), tracks)
+    assert sorted(demucs) == [['/mnt1/a/a.mp3', '/mnt1/b/b.mp3'], ['/mnt2/c/c.mp3']]
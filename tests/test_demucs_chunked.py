@@ -0,0 +1,90 @@
+import io
+
+import numpy as np
+import pytest
+
+from src.lib import demucs_chunked
+from src.lib.demucs_chunked import CrossFader, _read_frames, is_long_input
+
+
+class TrickleStream(io.BytesIO):
+    """A pipe that hands out at most `block` bytes per read."""
+
+    def __init__(self, data, block):
+        super().__init__(data)
+        self.block = block
+
+    def read(self, size=-1):
+        return super().read(min(size, self.block))
+
+
+def test_read_frames_fills_whole_frames_from_short_reads():
+    samples = np.arange(20, dtype=np.float32)
+    stream = TrickleStream(samples.tobytes(), block=7)
+    first = _read_frames(stream, 4, 2)
+    assert first.shape == (4, 2)
+    assert first.ravel().tolist() == list(range(8))
+    rest = _read_frames(stream, 100, 2)
+    assert rest.ravel().tolist() == list(range(8, 20))
+    assert _read_frames(stream, 4, 2).shape == (0, 2)
+
+
+def test_read_frames_drops_a_partial_frame_at_the_end():
+    stream = io.BytesIO(np.arange(5, dtype=np.float32).tobytes())
+    assert _read_frames(stream, 4, 2).ravel().tolist() == [0, 1, 2, 3]
+
+
+def test_long_inputs_go_through_the_windowed_path(monkeypatch):
+    monkeypatch.setattr(demucs_chunked, 'probe_audio_duration', lambda path: {'set.mp3': 3 * 3600, 'song.mp3': 240}.get(path))
+    assert is_long_input('set.mp3', 30)
+    assert not is_long_input('song.mp3', 30)
+    # Unknown length or windowing disabled
+    assert not is_long_input('unknown.mp3', 30)
+    assert not is_long_input('set.mp3', 0)
+    assert not is_long_input('set.mp3', None)
+
+
+def cross_faded(windows, overlap):
+    """The windows joined in one array the length of the input, as a reference."""
+    total = sum(len(window) for window in windows) - overlap * (len(windows) - 1)
+    out = np.zeros((total, windows[0].shape[1]), dtype=np.float32)
+    ramp = np.linspace(0.0, 1.0, overlap, dtype=np.float32)[:, None]
+    start = 0
+    for index, window in enumerate(windows):
+        blend = min(overlap, len(window)) if index else 0
+        out[start:start + blend] = out[start:start + blend] * (1 - ramp[:blend]) + window[:blend] * ramp[:blend]
+        out[start + blend:start + len(window)] = window[blend:]
+        start += len(window) - overlap
+    return out
+
+
+def join(windows, overlap, size):
+    fader = CrossFader({'vocals': np.zeros((size, 2), dtype=np.float32)}, overlap)
+    pieces = [fader.add({'vocals': window})['vocals'] for window in windows]
+    pieces.append(fader.finish()['vocals'])
+    return pieces
+
+
+# The last window holds the overlap and at least one new frame
+@pytest.mark.parametrize("last", [10, 7, 5])
+def test_windows_are_cross_faded_through_a_ring_buffer(last):
+    rng = np.random.default_rng(0)
+    window, overlap = 10, 4
+    windows = [rng.standard_normal((window, 2)).astype(np.float32) for _ in range(7)] + [rng.standard_normal((last, 2)).astype(np.float32)]
+    # Far more frames than the ring buffer holds
+    pieces = join(windows, overlap, window + overlap)
+    np.testing.assert_allclose(np.concatenate(pieces), cross_faded(windows, overlap), rtol=1e-6)
+    # Frames are handed back as soon as no later window touches them
+    assert [len(piece) for piece in pieces[:3]] == [window - overlap] * 3
+
+
+def test_cross_fade_is_linear():
+    pieces = join([np.zeros((8, 2), dtype=np.float32), np.ones((8, 2), dtype=np.float32)], 4, 12)
+    out = np.concatenate(pieces)[:, 0]
+    assert out.tolist() == pytest.approx([0, 0, 0, 0, 0, 1 / 3, 2 / 3, 1, 1, 1, 1, 1])
+
+
+def test_windows_larger_than_the_buffers_are_refused():
+    fader = CrossFader({'vocals': np.zeros((8, 2), dtype=np.float32)}, 2)
+    with pytest.raises(ValueError):
+        fader.add({'vocals': np.zeros((9, 2), dtype=np.float32)})
@@ -0,0 +1,49 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from src.lib import demucs_engine
+from src.lib.demucs_engine import DemucsEngine
+
+
+class FailingExecutor:
+    """Stands in for the worker pool, failing every track with error."""
+
+    def __init__(self, error):
+        self.error = error
+
+    def submit(self, func, *args):
+        future = Future()
+        future.set_exception(self.error)
+        return future
+
+
+@pytest.fixture
+def fallbacks(monkeypatch):
+    calls = []
+    monkeypatch.setattr(demucs_engine, 'run_demucs', lambda path, codec: calls.append(('subprocess', path)) or ('/out', ''))
+    monkeypatch.setattr(demucs_engine, 'run_demucs_chunked', lambda path, codec: calls.append(('chunked', path)) or ('/out', ''))
+    return calls
+
+
+def engine_failing_with(error):
+    engine = DemucsEngine.__new__(DemucsEngine)
+    engine._executor = FailingExecutor(error)
+    return engine
+
+
+def test_a_broken_engine_falls_back(fallbacks):
+    engine = engine_failing_with(BrokenProcessPool("A child process terminated abruptly"))
+    assert engine.run('/out/a.mp3', codec='mp3') == ('/out', '')
+    assert engine.run_chunked('/out/set.mp3', 'mp3') == ('/out', '')
+    assert fallbacks == [('subprocess', '/out/a.mp3'), ('chunked', '/out/set.mp3')]
+
+
+def test_errors_separating_a_track_are_raised(fallbacks):
+    engine = engine_failing_with(RuntimeError("Invalid data found when processing input"))
+    with pytest.raises(RuntimeError):
+        engine.run('/out/a.mp3', codec='mp3')
+    with pytest.raises(RuntimeError):
+        engine.run_chunked('/out/set.mp3', 'mp3')
+    assert fallbacks == []
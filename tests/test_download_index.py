@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from src.lib.download_index import DownloadIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = DownloadIndex(str(tmp_path / 'downloads.sqlite3'))
+    yield index
+    index.close()
+
+
+def download(tmp_path, name, size=100):
+    path = tmp_path / 'out' / name
+    os.makedirs(path.parent, exist_ok=True)
+    path.write_bytes(b'\1' * size)
+    return str(path)
+
+
+def indexed_paths(index, video_id):
+    return sorted(row[0] for row in index._conn.execute('SELECT path FROM assets WHERE video_id = ?', (video_id,)))
+
+
+def test_full_download_is_found_from_any_folder(tmp_path, index):
+    path = download(tmp_path, 'a/Song.mp3')
+    index.register('vid', path)
+    asset = index.find('vid', ('.mp3',))
+    assert asset.path == path
+    assert asset.is_full
+    assert index.find('other', ('.mp3',)) is None
+    # Only files the caller can use
+    assert index.find('vid', ('.wav', '.flac')) is None
+
+
+def test_sections_prefer_an_exact_match_then_the_shortest_covering_file(tmp_path, index):
+    full = download(tmp_path, 'full.mp3')
+    wide = download(tmp_path, 'wide.mp3')
+    narrow = download(tmp_path, 'narrow.mp3')
+    index.register('vid', full)
+    index.register('vid', wide, (0, 1200))
+    index.register('vid', narrow, (240, 720))
+
+    assert index.find('vid', ('.mp3',), (240, 720)).path == narrow
+    assert index.find('vid', ('.mp3',), (300, 600)).path == narrow
+    assert index.find('vid', ('.mp3',), (100, 600)).path == wide
+    assert index.find('vid', ('.mp3',), (1000, 1500)).path == full
+    # A full download isn't served by sections
+    assert index.find('vid', ('.mp3',)).path == full
+
+
+def test_deleted_or_modified_files_are_dropped(tmp_path, index):
+    deleted = download(tmp_path, 'deleted.mp3')
+    modified = download(tmp_path, 'modified.mp3')
+    kept = download(tmp_path, 'kept.mp3')
+    index.register('vid', deleted)
+    index.register('vid', modified, (0, 600))
+    index.register('vid', kept, (0, 1200))
+
+    os.remove(deleted)
+    with open(modified, 'ab') as f:
+        f.write(b'more')
+    assert index.find('vid', ('.mp3',)) is None
+    assert index.find('vid', ('.mp3',), (0, 600)).path == kept
+    assert indexed_paths(index, 'vid') == [kept]
+
+
+def test_index_survives_a_restart(tmp_path):
+    path = download(tmp_path, 'Song.mp3')
+    index = DownloadIndex(str(tmp_path / 'downloads.sqlite3'))
+    index.register('vid', path)
+    index.close()
+    index = DownloadIndex(str(tmp_path / 'downloads.sqlite3'))
+    assert index.find('vid', ('.mp3',)).path == path
+    index.close()
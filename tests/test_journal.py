@@ -0,0 +1,87 @@
+import pytest
+
+from src.lib.journal import Journal, journal_path
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = Journal(journal_path(str(tmp_path / 'out')))
+    yield journal
+    journal.close()
+
+
+def test_unfinished_urls_resume_in_the_order_they_were_added(tmp_path, journal):
+    journal.add(['a', 'b', 'c'])
+    journal.add(['d', 'b'])
+    for url in ('a', 'b', 'c', 'd'):
+        journal.start(url)
+    journal.mark('a', 'done', '/out/a')
+    journal.mark('c', 'download')
+    journal.fail('c', 'HTTP Error 403')
+    journal.close()
+
+    # A new run (e.g. after a crash) picks up where the last one stopped
+    reopened = Journal(journal_path(str(tmp_path / 'out')))
+    assert reopened.unfinished() == ['b', 'c', 'd']
+    assert reopened.done_urls() == {'a'}
+    reopened.close()
+
+
+def test_known_urls_keep_their_state(journal):
+    journal.add(['a'])
+    journal.start('a')
+    journal.mark('a', 'done')
+    journal.add(['a'])
+    assert journal.done_urls() == {'a'}
+    assert journal.unfinished() == []
+
+
+def test_a_new_attempt_clears_the_last_error(journal):
+    journal.add(['a', 'b'])
+    journal.start('a')
+    journal.mark('a', 'separate')
+    journal.fail('a', 'Demucs crashed')
+    assert journal.failures() == [('a', 'separate', 'Demucs crashed', 1)]
+
+    journal.start('a')
+    assert journal.failures() == []
+    journal.mark('a', 'done')
+    summary = journal.summary()
+    assert summary['done'] == 1
+    assert summary['expand'] == 1
+    assert summary['failed'] == 0
+
+
+def test_unknown_stages_are_rejected(journal):
+    journal.add(['a'])
+    with pytest.raises(ValueError):
+        journal.mark('a', 'uploaded')
+
+
+def test_sync_reports_videos_no_longer_listed(journal, monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr('src.lib.journal.time.time', lambda: next(clock))
+
+    assert journal.sync_playlist('PL1', ['a', 'b', 'c']) == []
+    assert journal.sync_playlist('PL1', ['a', 'c', 'd']) == ['b']
+    # Reported once, not on every later sync
+    assert journal.sync_playlist('PL1', ['a', 'c', 'd']) == []
+    assert not journal.still_listed('b')
+    assert journal.still_listed('d')
+
+    # Listed again
+    assert journal.sync_playlist('PL1', ['a', 'b']) == ['c', 'd']
+    assert journal.still_listed('b')
+    assert [row[:3] for row in journal.playlists()] == [('PL1', 2, 2)]
+
+
+def test_a_video_stays_listed_while_another_playlist_has_it(journal, monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr('src.lib.journal.time.time', lambda: next(clock))
+
+    journal.sync_playlist('PL1', ['a', 'b'])
+    journal.sync_playlist('PL2', ['b'])
+    assert journal.sync_playlist('PL1', ['a']) == ['b']
+    assert journal.still_listed('b')
+    journal.sync_playlist('PL2', [])
+    assert not journal.still_listed('b')
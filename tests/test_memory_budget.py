@@ -0,0 +1,105 @@
+import time
+import threading
+
+import pytest
+
+from src.lib.memory_budget import (
+    DEMUCS_BASE_MEMORY_MB, DEMUCS_MEMORY_MB_PER_MINUTE, MemoryBudget, configure_memory_budget, estimate_separation_mb,
+    memory_budget,
+)
+
+
+def start(budget, mb, events, name, hold):
+    """Run a separation of mb in a thread, recording when it starts and stops."""
+    def run():
+        with budget.reserve(mb):
+            events.append(f'start {name}')
+            hold.wait(timeout=5)
+            events.append(f'stop {name}')
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_estimate_grows_with_the_input_unless_chunked():
+    assert estimate_separation_mb(600) == DEMUCS_BASE_MEMORY_MB + 10 * DEMUCS_MEMORY_MB_PER_MINUTE
+    assert estimate_separation_mb(3 * 3600) > estimate_separation_mb(600)
+    # Windowed separations hold one window whatever the input length
+    assert estimate_separation_mb(3 * 3600, chunked=True) == estimate_separation_mb(60, chunked=True) < estimate_separation_mb(600)
+    assert estimate_separation_mb(None) == estimate_separation_mb(300)
+
+
+def test_reservations_wait_while_the_budget_is_used_up():
+    budget = MemoryBudget(5000)
+    events = []
+    first, second = threading.Event(), threading.Event()
+    a = start(budget, 3000, events, 'a', first)
+    time.sleep(0.05)
+    b = start(budget, 3000, events, 'b', second)
+    time.sleep(0.1)
+    assert events == ['start a']
+    assert budget.reserved_mb == 3000
+
+    first.set()
+    a.join()
+    time.sleep(0.05)
+    assert events == ['start a', 'stop a', 'start b']
+    second.set()
+    b.join()
+    assert budget.reserved_mb == 0
+
+
+def test_small_reservations_run_side_by_side():
+    budget = MemoryBudget(5000)
+    events = []
+    hold = threading.Event()
+    threads = [start(budget, 2000, events, name, hold) for name in 'ab']
+    time.sleep(0.1)
+    assert sorted(events) == ['start a', 'start b']
+    hold.set()
+    for thread in threads:
+        thread.join()
+
+
+def test_oversized_reservations_run_alone():
+    budget = MemoryBudget(5000)
+    assert not budget.fits(8000)
+    events = []
+    small, large, after = threading.Event(), threading.Event(), threading.Event()
+    a = start(budget, 1000, events, 'small', small)
+    time.sleep(0.05)
+    b = start(budget, 8000, events, 'large', large)
+    time.sleep(0.1)
+    # Waits for the running separation, then runs although it doesn't fit
+    assert events == ['start small']
+    small.set()
+    a.join()
+    time.sleep(0.05)
+    assert events == ['start small', 'stop small', 'start large']
+
+    c = start(budget, 1000, events, 'after', after)
+    time.sleep(0.1)
+    assert events[-1] == 'start large'
+    large.set()
+    b.join()
+    after.set()
+    c.join()
+    assert events[-2:] == ['start after', 'stop after']
+
+
+def test_no_budget_admits_everything():
+    configure_memory_budget(None)
+    assert memory_budget() is None
+    configure_memory_budget(4096)
+    assert memory_budget().budget_mb == 4096
+    configure_memory_budget(None)
+
+
+@pytest.mark.parametrize("mb", [0, 5000])
+def test_reservation_released_on_errors(mb):
+    budget = MemoryBudget(5000)
+    with pytest.raises(RuntimeError):
+        with budget.reserve(mb):
+            raise RuntimeError("separation failed")
+    assert budget.reserved_mb == 0
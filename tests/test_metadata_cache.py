@@ -0,0 +1,130 @@
+import os
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.lib import metadata_cache as metadata_module
+from src.lib.metadata_cache import MetadataCache, OEmbedClient, TitlePrefetcher, configure_metadata_cache, lookup_title
+
+
+class OEmbedStandIn(BaseHTTPRequestHandler):
+    """Local oEmbed endpoint counting connections and requests."""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            drop = self.server.drop > 0
+            if drop:
+                self.server.drop -= 1
+        if drop:
+            # Like a server closing an idle keep-alive connection
+            self.close_connection = True
+            return
+        video_id = urllib.parse.parse_qs(urllib.parse.urlsplit(urllib.parse.parse_qs(
+            urllib.parse.urlsplit(self.path).query)['url'][0]).query)['v'][0]
+        body = json.dumps({'title': f'Title of {video_id}'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def oembed(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), OEmbedStandIn)
+    server.lock = threading.Lock()
+    server.connections = server.requests = server.drop = 0
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    monkeypatch.setenv('YTSPLEET_OEMBED_URL', f'http://127.0.0.1:{server.server_address[1]}/oembed')
+    # The module-level client reads the endpoint at import
+    monkeypatch.setattr(metadata_module, '_client', OEmbedClient(os.environ['YTSPLEET_OEMBED_URL']))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    yield str(tmp_path / 'metadata.sqlite3')
+    configure_metadata_cache(None)
+
+
+def test_a_second_run_makes_no_requests(oembed, cache_path):
+    configure_metadata_cache(cache_path)
+    assert [lookup_title(video_id) for video_id in ('aaa', 'bbb')] == ['Title of aaa', 'Title of bbb']
+    assert oembed.requests == 2
+
+    # A new run opens the cache again
+    configure_metadata_cache(cache_path)
+    prefetcher = TitlePrefetcher(workers=4)
+    for video_id in ('aaa', 'bbb'):
+        prefetcher.submit(video_id)
+    prefetcher.close()
+    assert [lookup_title(video_id) for video_id in ('aaa', 'bbb')] == ['Title of aaa', 'Title of bbb']
+    assert (prefetcher.cached, prefetcher.requested) == (2, 0)
+    assert oembed.requests == 2
+
+
+def test_expired_titles_are_looked_up_again(oembed, cache_path, monkeypatch):
+    configure_metadata_cache(cache_path, ttl_days=1)
+    now = 1_000_000.0
+    monkeypatch.setattr(metadata_module.time, 'time', lambda: now)
+    assert lookup_title('aaa') == 'Title of aaa'
+
+    now += 23 * 3600
+    assert lookup_title('aaa') == 'Title of aaa'
+    assert oembed.requests == 1
+
+    now += 2 * 3600
+    assert lookup_title('aaa') == 'Title of aaa'
+    assert oembed.requests == 2
+
+
+def test_lookups_reuse_the_keep_alive_connection(oembed):
+    client = OEmbedClient(os.environ['YTSPLEET_OEMBED_URL'])
+    for i in range(10):
+        assert client.fetch_title(f'v{i}') == f'Title of v{i}'
+    assert (oembed.connections, oembed.requests) == (1, 10)
+
+
+def test_a_dropped_connection_is_retried_once(oembed):
+    client = OEmbedClient(os.environ['YTSPLEET_OEMBED_URL'])
+    assert client.fetch_title('aaa') == 'Title of aaa'
+    oembed.drop = 1
+    assert client.fetch_title('bbb') == 'Title of bbb'
+    assert (oembed.connections, oembed.requests) == (2, 3)
+
+    oembed.drop = 2
+    with pytest.raises(Exception):
+        client.fetch_title('ccc')
+    assert oembed.requests == 5
+
+
+def test_prefetched_titles_are_looked_up_concurrently(oembed, cache_path):
+    configure_metadata_cache(cache_path)
+    metadata_module._prefetcher = prefetcher = TitlePrefetcher(workers=4)
+    try:
+        for i in range(20):
+            prefetcher.submit(f'v{i}')
+        # Waits for the background lookup instead of starting another
+        assert lookup_title('v7') == 'Title of v7'
+    finally:
+        metadata_module._prefetcher = None
+        prefetcher.close()
+    assert oembed.requests == 20
+    # One keep-alive connection per lookup thread
+    assert oembed.connections <= 4
+    assert MetadataCache(cache_path, 3600).get('v19') == 'Title of v19'
@@ -0,0 +1,96 @@
+import time
+import threading
+
+import pytest
+
+from src.lib.pipeline import run_pipeline
+
+
+def test_results_come_back_in_input_order():
+    def download(item):
+        # Later items finish first
+        time.sleep(0.01 * (5 - item))
+        return item * 10
+
+    results = run_pipeline(range(5), download, lambda item, downloaded: downloaded + 1,
+                           download_workers=3, separate_workers=2)
+    assert [result.item for result in results] == [0, 1, 2, 3, 4]
+    assert [result.result for result in results] == [1, 11, 21, 31, 41]
+    assert all(result.error is None for result in results)
+
+
+def test_items_downloaded_to_none_are_not_separated():
+    separated = []
+
+    def separate(item, downloaded):
+        separated.append(item)
+        return downloaded
+
+    results = run_pipeline(range(4), lambda item: item if item % 2 else None, separate,
+                           download_workers=2, separate_workers=2)
+    assert sorted(separated) == [1, 3]
+    assert [result.result for result in results] == [None, 1, None, 3]
+
+
+def test_errors_are_recorded_per_item():
+    def download(item):
+        if item == 1:
+            raise RuntimeError("download failed")
+        return item
+
+    def separate(item, downloaded):
+        if item == 2:
+            raise ValueError("separation failed")
+        return item
+
+    results = run_pipeline(range(4), download, separate, download_workers=2, separate_workers=2)
+    assert [type(result.error) for result in results] == [type(None), RuntimeError, ValueError, type(None)]
+    assert [result.result for result in results] == [0, None, None, 3]
+
+
+def test_downloads_wait_for_a_saturated_separation_stage():
+    release = threading.Event()
+    read = []
+    downloaded = []
+
+    def items():
+        for item in range(20):
+            read.append(item)
+            yield item
+
+    def download(item):
+        downloaded.append(item)
+        return item
+
+    def separate(item, value):
+        release.wait()
+        return value
+
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(
+        run_pipeline(items(), download, separate, download_workers=1, separate_workers=1, queue_size=1)))
+    thread.start()
+    time.sleep(0.3)
+    # One item separating, one queued for separation and one download blocked on the queue
+    assert len(downloaded) == 3
+    # The items are read lazily, only as far as the download queue holds
+    assert len(read) < 20
+    release.set()
+    thread.join(timeout=10)
+    assert [result.result for result in results] == list(range(20))
+
+
+def test_iterator_errors_are_raised_after_the_items_read_so_far():
+    separated = []
+
+    def items():
+        yield 0
+        yield 1
+        raise OSError("playlist expansion failed")
+
+    def separate(item, downloaded):
+        separated.append(item)
+
+    with pytest.raises(OSError, match="playlist expansion failed"):
+        run_pipeline(items(), lambda item: item, separate, download_workers=2, separate_workers=1)
+    assert sorted(separated) == [0, 1]
@@ -0,0 +1,69 @@
+import os
+import subprocess
+
+from src.lib import ytdl
+from src.lib.tracklist_parser import Track, Tracklist
+from src.lib.ytdl import split_audio_tracks_with_ffmpeg, track_filename, tracklist_segments
+
+
+def fake_ffmpeg(monkeypatch, sizes):
+    """Record ffmpeg commands, writing each output with the size sizes gives its file name."""
+    commands = []
+
+    def run(cmd, **kwargs):
+        commands.append(cmd)
+        for arg in cmd:
+            if os.path.basename(arg) in sizes:
+                with open(arg, 'wb') as f:
+                    f.write(b'\0' * sizes[os.path.basename(arg)])
+        return subprocess.CompletedProcess(cmd, 0, '', '')
+
+    monkeypatch.setattr(ytdl.subprocess, 'run', run)
+    return commands
+
+
+def test_all_segments_come_from_one_ffmpeg_run(tmp_path, monkeypatch):
+    segments = [(str(tmp_path / f'{i}.mp3'), start, end) for i, (start, end) in enumerate([(0, 252), (252, 570), (570, 1170)])]
+    commands = fake_ffmpeg(monkeypatch, {'0.mp3': 10, '1.mp3': 10, '2.mp3': 10})
+
+    assert split_audio_tracks_with_ffmpeg('/in/mix.mp3', segments) == [path for path, _, _ in segments]
+    assert len(commands) == 1
+    cmd = commands[0]
+    # The input is read once, every segment is a stream-copied output of it
+    assert cmd[:6] == ['ffmpeg', '-y', '-v', 'error', '-i', '/in/mix.mp3']
+    assert cmd[6:] == [
+        '-map', '0:a', '-ss', '0', '-t', '252', '-c', 'copy', segments[0][0],
+        '-map', '0:a', '-ss', '252', '-t', '318', '-c', 'copy', segments[1][0],
+        '-map', '0:a', '-ss', '570', '-t', '600', '-c', 'copy', segments[2][0],
+    ]
+
+
+def test_empty_outputs_are_removed(tmp_path, monkeypatch):
+    segments = [(str(tmp_path / 'ok.mp3'), 0, 10), (str(tmp_path / 'empty.mp3'), 10, 20), (str(tmp_path / 'missing.mp3'), 20, 30)]
+    fake_ffmpeg(monkeypatch, {'ok.mp3': 10, 'empty.mp3': 0})
+
+    assert split_audio_tracks_with_ffmpeg('/in/mix.mp3', segments) == [segments[0][0]]
+    assert not os.path.exists(segments[1][0])
+
+
+def test_nothing_to_split_runs_nothing(monkeypatch):
+    commands = fake_ffmpeg(monkeypatch, {})
+    assert split_audio_tracks_with_ffmpeg('/in/mix.mp3', []) == []
+    assert commands == []
+
+
+def test_segments_end_at_the_next_track():
+    tracks = [
+        Track(1, 'Kerala', 'Bonobo', '0:00', 0),
+        Track(2, 'Untimed', None, '', -1),
+        Track(3, 'Awake', 'Tycho', '4:12', 252),
+        Track(4, 'Baby', 'Four Tet', '9:30', 570),
+    ]
+    segments = tracklist_segments(Tracklist(tracks=tracks))
+    # A track without a timestamp is skipped, the one before it runs for 10 minutes
+    assert [(track.number, start, end) for track, start, end in segments] == [(1, 0, 600), (3, 252, 570), (4, 570, 1170)]
+
+
+def test_track_filenames_are_clean():
+    assert track_filename(Track(7, 'Da Funk / Live?', 'Daft Punk', '3:45', 225)) == '007 - Daft Punk - Da Funk  Live'
+    assert track_filename(Track(12, 'Intro', None, '0:00', 0)) == '012 - Intro'
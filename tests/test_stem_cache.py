@@ -0,0 +1,125 @@
+import os
+
+from src.lib import stem_cache as stem_cache_module
+from src.lib.stem_cache import StemCache, create_stem_cache, stem_cache_key
+
+
+def write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    return str(path)
+
+
+def separated(tmp_path, name, size=1000):
+    """Stems as a separation leaves them in its output folder."""
+    return {stem: write(tmp_path / 'separated' / name / f'{stem}.mp3', size) for stem in ('vocals', 'no_vocals')}
+
+
+def targets(tmp_path, name):
+    os.makedirs(tmp_path / 'out' / name, exist_ok=True)
+    return {stem: str(tmp_path / 'out' / name / f'{stem}.mp3') for stem in ('vocals', 'no_vocals')}
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def set_last_used(cache, key, when):
+    os.utime(cache._entry_dir(key), (when, when))
+
+
+def test_miss_then_hit(tmp_path):
+    cache = StemCache(str(tmp_path / 'cache'))
+    assert not cache.lookup('ab' * 32, targets(tmp_path, 'first'))
+
+    sources = separated(tmp_path, 'first')
+    cache.store('ab' * 32, sources)
+    assert cache.lookup('ab' * 32, targets(tmp_path, 'second'))
+    for stem, path in targets(tmp_path, 'second').items():
+        assert read(path) == read(sources[stem])
+
+
+def test_entry_missing_a_stem_is_a_miss(tmp_path):
+    cache = StemCache(str(tmp_path / 'cache'))
+    cache.store('ab' * 32, separated(tmp_path, 'first'))
+    wanted = dict(targets(tmp_path, 'second'), drums=str(tmp_path / 'out' / 'second' / 'drums.mp3'))
+    assert not cache.lookup('ab' * 32, wanted)
+    assert not os.path.exists(wanted['drums'])
+
+
+def test_stored_entries_are_not_replaced(tmp_path):
+    cache = StemCache(str(tmp_path / 'cache'))
+    first = separated(tmp_path, 'first')
+    cache.store('ab' * 32, first)
+    cache.store('ab' * 32, separated(tmp_path, 'second'))
+    assert cache.lookup('ab' * 32, targets(tmp_path, 'out'))
+    assert read(targets(tmp_path, 'out')['vocals']) == read(first['vocals'])
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    # Room for two entries of two 1000 byte stems
+    cache = StemCache(str(tmp_path / 'cache'), max_bytes=4500)
+    keys = ['aa' * 32, 'bb' * 32, 'cc' * 32]
+
+    for when, key in enumerate(keys[:2]):
+        cache.store(key, separated(tmp_path, key))
+        set_last_used(cache, key, 1000 + when)
+    # Reusing the first entry makes the second the least recently used
+    assert cache.lookup(keys[0], targets(tmp_path, 'reused'))
+
+    # Entries count in full although their stems are hardlinked from output folders
+    sources = separated(tmp_path, keys[2])
+    cache.store(keys[2], sources)
+    assert os.stat(sources['vocals']).st_nlink == 2
+
+    assert os.path.isdir(cache._entry_dir(keys[0]))
+    assert not os.path.exists(cache._entry_dir(keys[1]))
+    assert os.path.isdir(cache._entry_dir(keys[2]))
+
+
+def test_key_covers_audio_and_separation_parameters(monkeypatch):
+    monkeypatch.setattr(stem_cache_module, 'hash_decoded_audio', lambda path: f'pcm of {os.path.basename(path)}')
+    key = stem_cache_key('/a/mix.mp3', 'htdemucs', 'vocals', 'mp3')
+    # The decoded audio decides, not where the file is
+    assert stem_cache_key('/b/mix.mp3', 'htdemucs', 'vocals', 'mp3') == key
+    assert stem_cache_key('/a/other.mp3', 'htdemucs', 'vocals', 'mp3') != key
+    assert stem_cache_key('/a/mix.mp3', 'htdemucs_ft', 'vocals', 'mp3') != key
+    assert stem_cache_key('/a/mix.mp3', 'htdemucs', 'all', 'mp3') != key
+    assert stem_cache_key('/a/mix.mp3', 'htdemucs', 'vocals', 'flac') != key
+
+
+def test_no_cache_dir_disables_the_cache(tmp_path):
+    assert create_stem_cache(None, 10) is None
+    cache = create_stem_cache(str(tmp_path / 'cache'), 0.5)
+    assert cache.max_bytes == 512 * 1024 ** 2
+
+
+def test_entry_evicted_during_lookup_is_a_miss(tmp_path, monkeypatch):
+    cache = StemCache(str(tmp_path / 'cache'))
+    cache.store('ab' * 32, separated(tmp_path, 'first'))
+
+    def evicted(source, target):
+        raise FileNotFoundError(source)
+
+    monkeypatch.setattr(stem_cache_module, 'link_or_copy', evicted)
+    assert not cache.lookup('ab' * 32, targets(tmp_path, 'second'))
+
+
+def test_failing_eviction_does_not_fail_the_store(tmp_path, monkeypatch):
+    cache = StemCache(str(tmp_path / 'cache'), max_bytes=0)
+
+    def fail():
+        raise PermissionError("read-only cache")
+
+    monkeypatch.setattr(cache, 'evict', fail)
+    cache.store('ab' * 32, separated(tmp_path, 'first'))
+    assert cache.lookup('ab' * 32, targets(tmp_path, 'second'))
+
+
+def test_entries_removed_during_eviction_are_skipped(tmp_path):
+    cache = StemCache(str(tmp_path / 'cache'))
+    assert StemCache._entry_usage(str(tmp_path / 'cache' / 'ab' / 'gone')) is None
+    os.makedirs(tmp_path / 'cache' / 'ab' / 'empty')
+    cache.evict()
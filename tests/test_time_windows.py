@@ -0,0 +1,86 @@
+import time
+import threading
+
+from src import main as main_module
+from src.main import YTSpleetSingleFileArgs, merge_time_ranges, plan_time_windows, span_lock
+
+
+def window(video, seconds, minutes=4, **kwargs):
+    return YTSpleetSingleFileArgs(f'https://www.youtube.com/watch?v={video}&t={seconds}', window=minutes, **kwargs)
+
+
+def test_merge_time_ranges():
+    assert merge_time_ranges([]) == []
+    assert merge_time_ranges([(600, 900), (0, 300), (250, 400)]) == [(0, 400), (600, 900)]
+    # Adjacent ranges are merged, contained ones disappear
+    assert merge_time_ranges([(0, 300), (300, 600), (100, 200)]) == [(0, 600)]
+    assert merge_time_ranges([(0, 300), (301, 600)]) == [(0, 300), (301, 600)]
+
+
+def test_overlapping_windows_of_a_video_share_one_span():
+    jobs = [window('aaa', 600), window('aaa', 900), window('aaa', 3000)]
+    planned = list(plan_time_windows(jobs))
+    assert planned == jobs
+    assert [job.span for job in planned] == [(360, 1140), (360, 1140), None]
+
+
+def test_windows_of_different_videos_are_not_merged():
+    jobs = [window('aaa', 600), window('bbb', 700)]
+    assert [job.span for job in plan_time_windows(jobs)] == [None, None]
+
+
+def test_jobs_without_a_window_are_left_alone():
+    jobs = [
+        YTSpleetSingleFileArgs('https://www.youtube.com/watch?v=aaa'),
+        window('aaa', 600, guess_chapters=True),
+        window('aaa', 700, split_chapters=True),
+        window('aaa', 800),
+    ]
+    assert [job.span for job in plan_time_windows(jobs)] == [None, None, None, None]
+
+
+def test_jobs_are_passed_on_while_the_batch_is_still_arriving():
+    read = []
+
+    def arriving():
+        for job in [window('aaa', 600), window('aaa', 700), window('bbb', 600), window('ccc', 600)]:
+            read.append(job)
+            yield job
+
+    planned = plan_time_windows(arriving())
+    first = next(planned)
+    # The windows of aaa are complete once a job for another video arrives
+    assert len(read) == 3
+    assert first.span == (360, 940)
+    assert next(planned).span == (360, 940)
+    assert len(read) == 3
+    assert [job.span for job in planned] == [None, None]
+
+
+def test_a_later_window_inside_a_planned_span_joins_it():
+    jobs = [window('aaa', 600), window('aaa', 900), window('bbb', 600), window('aaa', 700, minutes=2)]
+    assert [job.span for job in plan_time_windows(jobs)] == [(360, 1140), (360, 1140), None, (360, 1140)]
+
+
+def test_span_locks_are_dropped_with_their_last_holder():
+    events = []
+
+    def separate(name):
+        with span_lock('separate', '/out/span.mp3'):
+            events.append(f'start {name}')
+            time.sleep(0.05)
+            events.append(f'stop {name}')
+
+    threads = [threading.Thread(target=separate, args=(name,)) for name in 'ab']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # One separation of the span at a time
+    assert events in (['start a', 'stop a', 'start b', 'stop b'], ['start b', 'stop b', 'start a', 'stop a'])
+
+    with span_lock('separate', '/out/span.mp3'):
+        # Reentrant for the same thread
+        with span_lock('separate', '/out/span.mp3'):
+            assert len(main_module._span_locks) == 1
+    assert main_module._span_locks == {}
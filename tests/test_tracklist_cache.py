@@ -0,0 +1,63 @@
+from src.lib.tracklist_cache import TracklistCache, configure_tracklist_cache, tracklist_cache_key
+from src.lib.tracklist_parser import LLM_PROMPT_VERSION, parse_tracklist, parse_tracklist_with_llm
+from conftest import FakeCompletion
+
+
+COMMENT = "Bonobo - Kerala 0:00\nsomething in between\nTycho - Awake 4:12\n"
+
+
+def tracks(tracklist):
+    return [(track.number, track.artist, track.title, track.start_time, track.start_seconds) for track in tracklist.tracks]
+
+
+def test_second_parse_comes_from_the_cache(fake_completion):
+    first = parse_tracklist_with_llm(COMMENT, model="fake-model", completion_fn=fake_completion)
+    second = parse_tracklist_with_llm(COMMENT, model="fake-model", completion_fn=fake_completion)
+    assert len(fake_completion.calls) == 1
+    assert tracks(second) == tracks(first) == [
+        (1, "Bonobo", "Kerala", "0:00", 0),
+        (2, "Tycho", "Awake", "4:12", 252),
+    ]
+    assert second.parser == "llm"
+
+
+def test_parse_tracklist_fallback_uses_the_cache(fake_completion):
+    # min_confidence above 1 sends every comment to the LLM
+    for _ in range(2):
+        tracklist = parse_tracklist(COMMENT, model="fake-model", min_confidence=1.01, completion_fn=fake_completion)
+        assert tracklist.parser == "llm"
+    assert len(fake_completion.calls) == 1
+
+
+def test_other_model_or_text_is_a_miss(fake_completion):
+    parse_tracklist_with_llm(COMMENT, model="fake-model", completion_fn=fake_completion)
+    parse_tracklist_with_llm(COMMENT, model="other-model", completion_fn=fake_completion)
+    parse_tracklist_with_llm(COMMENT + "Four Tet - Baby 9:30\n", model="fake-model", completion_fn=fake_completion)
+    assert len(fake_completion.calls) == 3
+
+
+def test_cache_survives_a_restart(tmp_path, fake_completion):
+    path = str(tmp_path / "tracklists.sqlite3")
+    configure_tracklist_cache(path)
+    parse_tracklist_with_llm(COMMENT, model="fake-model", completion_fn=fake_completion)
+    configure_tracklist_cache(path)
+    tracklist = parse_tracklist_with_llm(COMMENT, model="fake-model", completion_fn=fake_completion)
+    assert len(fake_completion.calls) == 1
+    assert len(tracklist.tracks) == 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr("src.lib.tracklist_cache.time.time", lambda: next(clock))
+    cache = TracklistCache(str(tmp_path / "tracklists.sqlite3"), max_entries=2)
+    tracklist = parse_tracklist_with_llm(COMMENT, model="fake-model", completion_fn=FakeCompletion())
+    keys = [tracklist_cache_key(f"comment {i}", "fake-model", LLM_PROMPT_VERSION) for i in range(3)]
+    cache.put(keys[0], "fake-model", tracklist)
+    cache.put(keys[1], "fake-model", tracklist)
+    # Touch the first entry so the second is the least recently used
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], "fake-model", tracklist)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    cache.close()
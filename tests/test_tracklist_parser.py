@@ -0,0 +1,222 @@
+import pytest
+
+from src.lib.tracklist_parser import (
+    DEFAULT_MIN_CONFIDENCE, FIRST_COMMENT_ROUND, extract_comment_id_from_url, fetch_tracklist_source,
+    looks_like_tracklist, parse_timestamp_to_seconds, parse_tracklist, parse_tracklist_heuristic,
+)
+
+
+def track_tuples(tracklist):
+    return [(track.number, track.artist, track.title, track.start_time, track.start_seconds) for track in tracklist.tracks]
+
+
+@pytest.mark.parametrize("timestamp, seconds", [
+    ("0:00", 0),
+    ("4:12", 252),
+    ("07:45", 465),
+    ("1:02:03", 3723),
+    ("0:58:10", 3490),
+    ("", -1),
+    ("abc", -1),
+])
+def test_parse_timestamp_to_seconds(timestamp, seconds):
+    assert parse_timestamp_to_seconds(timestamp) == seconds
+
+
+def test_mm_ss_lines():
+    tracklist = parse_tracklist_heuristic(
+        "0:00 Bonobo - Kerala\n"
+        "4:12 Tycho - Awake\n"
+        "9:30 Four Tet - Baby\n"
+    )
+    assert track_tuples(tracklist) == [
+        (1, "Bonobo", "Kerala", "0:00", 0),
+        (2, "Tycho", "Awake", "4:12", 252),
+        (3, "Four Tet", "Baby", "9:30", 570),
+    ]
+    assert tracklist.parser == "heuristic"
+    assert tracklist.confidence == 1.0
+
+
+def test_h_mm_ss_lines():
+    tracklist = parse_tracklist_heuristic(
+        "0:00:00 Intro\n"
+        "0:58:10 Artist A - Song\n"
+        "1:02:03 Artist B - Other Song\n"
+    )
+    assert track_tuples(tracklist) == [
+        (1, None, "Intro", "0:00:00", 0),
+        (2, "Artist A", "Song", "0:58:10", 3490),
+        (3, "Artist B", "Other Song", "1:02:03", 3723),
+    ]
+    assert tracklist.confidence == 1.0
+
+
+def test_numbered_bracketed_lines():
+    tracklist = parse_tracklist_heuristic(
+        "1. [00:00] Floating Points - Silhouettes\n"
+        "2. [07:45] Caribou - Sun\n"
+        "3. [13:20] Jon Hopkins - Emerald Rush\n"
+    )
+    assert track_tuples(tracklist) == [
+        (1, "Floating Points", "Silhouettes", "00:00", 0),
+        (2, "Caribou", "Sun", "07:45", 465),
+        (3, "Jon Hopkins", "Emerald Rush", "13:20", 800),
+    ]
+    assert tracklist.confidence == 1.0
+
+
+def test_timestamp_at_end_of_line():
+    tracklist = parse_tracklist_heuristic(
+        "Mr. Oizo - Flat Beat 0:00\n"
+        "Daft Punk - Da Funk (3:45)\n"
+        "Justice - Genesis - 8:01\n"
+    )
+    assert track_tuples(tracklist) == [
+        (1, "Mr. Oizo", "Flat Beat", "0:00", 0),
+        (2, "Daft Punk", "Da Funk", "3:45", 225),
+        (3, "Justice", "Genesis", "8:01", 481),
+    ]
+    assert tracklist.confidence == 1.0
+
+
+def test_timestamp_only_lines_take_the_next_line_as_title():
+    tracklist = parse_tracklist_heuristic("0:00\nBonobo - Kerala\n4:12\nTycho - Awake\n9:30\nFour Tet - Baby\n")
+    assert [(track.artist, track.title, track.start_seconds) for track in tracklist.tracks] == [
+        ("Bonobo", "Kerala", 0), ("Tycho", "Awake", 252), ("Four Tet", "Baby", 570),
+    ]
+    assert tracklist.confidence == 1.0
+
+
+def test_header_and_footer_lines_are_ignored():
+    tracklist = parse_tracklist_heuristic(
+        "Tracklist:\n"
+        "0:00 Bonobo - Kerala\n"
+        "4:12 Tycho - Awake\n"
+        "9:30 Four Tet - Baby\n"
+        "\n"
+        "Thanks for uploading!\n"
+    )
+    assert len(tracklist.tracks) == 3
+    assert tracklist.confidence == 1.0
+
+
+def test_noise_between_tracks_lowers_confidence_below_the_threshold():
+    tracklist = parse_tracklist_heuristic(
+        "0:00 Bonobo - Kerala\n"
+        "such a vibe!!\n"
+        "4:12 Tycho - Awake\n"
+        "9:30 Four Tet - Baby\n"
+    )
+    assert len(tracklist.tracks) == 3
+    # The stray line could be a track without a timestamp
+    assert tracklist.confidence == pytest.approx(0.75)
+    assert tracklist.confidence < DEFAULT_MIN_CONFIDENCE
+
+
+def test_out_of_order_timestamps_have_low_confidence():
+    tracklist = parse_tracklist_heuristic("9:30 A - x\n0:00 B - y\n4:12 C - z\n2:00 D - w\n")
+    assert tracklist.confidence < 0.2
+
+
+def test_prose_is_not_a_tracklist():
+    text = "This mix is amazing, the part at 4:12 gave me chills"
+    tracklist = parse_tracklist_heuristic(text)
+    assert tracklist.tracks == []
+    assert tracklist.confidence == 0.0
+    assert not looks_like_tracklist(text)
+
+
+def test_two_tracks_are_less_certain():
+    tracklist = parse_tracklist_heuristic("0:00 Bonobo - Kerala\n4:12 Tycho - Awake\n")
+    assert tracklist.confidence == pytest.approx(0.75)
+
+
+def test_confident_parse_skips_the_llm(fake_completion):
+    tracklist = parse_tracklist("0:00 Bonobo - Kerala\n4:12 Tycho - Awake\n9:30 Four Tet - Baby\n",
+                                completion_fn=fake_completion)
+    assert tracklist.parser == "heuristic"
+    assert fake_completion.calls == []
+
+
+def test_unconfident_parse_falls_back_to_the_llm(fake_completion):
+    tracklist = parse_tracklist("0:00 Bonobo - Kerala\nsuch a vibe!!\n4:12 Tycho - Awake\n9:30 Four Tet - Baby\n",
+                                completion_fn=fake_completion)
+    assert tracklist.parser == "llm"
+    # The local confidence is kept for reporting
+    assert tracklist.confidence == pytest.approx(0.75)
+    assert len(fake_completion.calls) == 1
+    assert [(track.artist, track.title, track.start_seconds) for track in tracklist.tracks] == [
+        ("Bonobo", "Kerala", 0), ("Tycho", "Awake", 252),
+    ]
+
+
+def test_min_confidence_above_one_always_uses_the_llm(fake_completion):
+    tracklist = parse_tracklist("0:00 Bonobo - Kerala\n4:12 Tycho - Awake\n9:30 Four Tet - Baby\n",
+                                min_confidence=1.01, completion_fn=fake_completion)
+    assert tracklist.parser == "llm"
+    assert len(fake_completion.calls) == 1
+
+
+TRACKLIST_COMMENT = "0:00 Bonobo - Kerala\n4:12 Tycho - Awake\n9:30 Four Tet - Baby\n"
+
+
+def fake_comments(monkeypatch, comments, info=None):
+    """Serve comments like yt-dlp's top-sorted listing, recording each fetch ('info' when without comments)."""
+    fetches = []
+
+    def fetch_video_info(url):
+        fetches.append('info')
+        return dict(info or {})
+
+    def fetch_video_comments(url, max_comments, replies=False):
+        fetches.append(max_comments)
+        return dict(info or {}, comments=comments[:max_comments])
+
+    monkeypatch.setattr("src.lib.tracklist_parser.fetch_video_info", fetch_video_info)
+    monkeypatch.setattr("src.lib.tracklist_parser.fetch_video_comments", fetch_video_comments)
+    return fetches
+
+
+def test_tracklist_in_the_first_comments_takes_one_comment_fetch(monkeypatch):
+    comments = [{"id": "c0", "text": "great mix"}, {"id": "c1", "text": TRACKLIST_COMMENT}]
+    fetches = fake_comments(monkeypatch, comments + [{"id": f"x{i}", "text": "wow"} for i in range(1000)])
+    assert fetch_tracklist_source("https://www.youtube.com/watch?v=aaa") == ("comment", TRACKLIST_COMMENT)
+    assert fetches == ['info', FIRST_COMMENT_ROUND]
+
+
+def test_a_miss_fetches_the_rest_in_one_go(monkeypatch):
+    comments = [{"id": f"c{i}", "text": "great mix"} for i in range(1000)]
+    fetches = fake_comments(monkeypatch, comments)
+    assert fetch_tracklist_source("https://www.youtube.com/watch?v=aaa", max_comments=500) == ("comment", "great mix")
+    assert fetches == ['info', FIRST_COMMENT_ROUND, 500]
+
+
+def test_chapters_and_description_need_no_comments(monkeypatch):
+    chapters = [{"title": "Intro", "start_time": 0}]
+    fetches = fake_comments(monkeypatch, [{"id": "c0", "text": TRACKLIST_COMMENT}], info={"chapters": chapters})
+    assert fetch_tracklist_source("https://www.youtube.com/watch?v=aaa") == ("chapters", chapters)
+    assert fetches == ['info']
+
+    fetches = fake_comments(monkeypatch, [{"id": "c0", "text": "great mix"}], info={"description": TRACKLIST_COMMENT})
+    assert fetch_tracklist_source("https://www.youtube.com/watch?v=aaa") == ("description", TRACKLIST_COMMENT)
+    assert fetches == ['info']
+
+
+def test_linked_comment_is_looked_for_in_the_top_comments_only(monkeypatch):
+    comments = [{"id": f"c{i:04d}", "text": "great mix"} for i in range(600)] + [{"id": "linked", "text": TRACKLIST_COMMENT}]
+    fetches = fake_comments(monkeypatch, comments)
+    url = "https://www.youtube.com/watch?v=aaa&lc=c0042"
+    assert fetch_tracklist_source(url, extract_comment_id_from_url(url), max_comments=500) == ("comment", "great mix")
+    assert fetches == [FIRST_COMMENT_ROUND, 500]
+
+    fetches.clear()
+    with pytest.raises(ValueError, match="not found in the top 500 comments"):
+        fetch_tracklist_source("https://www.youtube.com/watch?v=aaa&lc=linked", "linked", max_comments=500)
+    assert fetches == [FIRST_COMMENT_ROUND, 500]
+
+
+def test_missing_linked_comment_is_an_error(monkeypatch):
+    fake_comments(monkeypatch, [{"id": "c0", "text": "great mix"}])
+    with pytest.raises(ValueError):
+        fetch_tracklist_source("https://www.youtube.com/watch?v=aaa", "gone")
@@ -0,0 +1,147 @@
+import time
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.lib import tracklist_stage as stage_module
+from src.lib.tracklist_stage import RateLimit, TokenBucket, TracklistStage, is_rate_limited
+
+
+class StatusError(Exception):
+    def __init__(self, message, **attributes):
+        super().__init__(message)
+        self.__dict__.update(attributes)
+
+
+def rate_limited(retry_after):
+    return StatusError("Rate limit reached", status_code=429, response=SimpleNamespace(headers={'retry-after': str(retry_after)}))
+
+
+@pytest.mark.parametrize("error", [
+    StatusError("Rate limit reached for gpt-5-mini", status_code=429),
+    StatusError("throttled", http_status=429),
+    StatusError("throttled", status=429),
+    Exception("ERROR: [youtube] aaa: HTTP Error 429: Too Many Requests"),
+    Exception("Too many requests, slow down"),
+    Exception("You exceeded your current rate limit"),
+])
+def test_rate_limited(error):
+    assert is_rate_limited(error)
+
+
+@pytest.mark.parametrize("error", [
+    StatusError("Internal server error", status_code=500),
+    Exception("ERROR: [youtube] 4291abc: Video unavailable"),
+    Exception("Comment Ugx429zz not found"),
+    Exception("HTTP Error 4290"),
+    Exception("Failed to fetch comments: HTTP Error 404: Not Found"),
+])
+def test_not_rate_limited(error):
+    assert not is_rate_limited(error)
+
+
+def test_tokens_are_handed_out_at_the_rate():
+    bucket = TokenBucket(per_minute=600)
+
+    async def acquire():
+        start = time.monotonic()
+        times = []
+        for _ in range(3):
+            await bucket.acquire()
+            times.append(time.monotonic() - start)
+        return times
+
+    times = asyncio.run(acquire())
+    # The first token is there at once, then 10 a second
+    assert times[0] < 0.05
+    assert times[2] - times[0] == pytest.approx(0.2, abs=0.05)
+
+
+
+def test_waiters_are_spaced_out_after_a_pause():
+    bucket = TokenBucket(per_minute=600, burst=4)
+
+    async def acquire_after_pause():
+        bucket.pause(0.2)
+        start = time.monotonic()
+        times = []
+        for _ in range(3):
+            await bucket.acquire()
+            times.append(time.monotonic() - start)
+        return times
+
+    times = asyncio.run(acquire_after_pause())
+    # 10 tokens a second, none of them saved up during the pause
+    assert times[0] == pytest.approx(0.3, abs=0.05)
+    assert times[1] - times[0] == pytest.approx(0.1, abs=0.05)
+    assert times[2] - times[1] == pytest.approx(0.1, abs=0.05)
+
+def test_rate_limited_calls_are_retried_after_the_pause():
+    limit = RateLimit('llm', None, 2)
+    attempts = []
+
+    def call():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise rate_limited(0.2)
+        return 'parsed'
+
+    try:
+        assert asyncio.run(limit.call(call)) == 'parsed'
+    finally:
+        limit.close()
+    assert (limit.calls, limit.rate_limited) == (2, 1)
+    assert attempts[1] - attempts[0] == pytest.approx(0.2, abs=0.05)
+
+
+def test_other_errors_are_not_retried():
+    limit = RateLimit('comments', None, 2)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise ValueError("No chapters or comments found")
+
+    try:
+        with pytest.raises(ValueError):
+            asyncio.run(limit.call(call))
+    finally:
+        limit.close()
+    assert (len(attempts), limit.rate_limited) == (1, 0)
+
+
+@pytest.fixture
+def stage(monkeypatch, fake_completion):
+    fetched = []
+
+    def fetch_tracklist_source(url, comment_id, max_comments):
+        fetched.append(url)
+        if url.endswith('noisy'):
+            # Parsed text differs per video, or the tracklist cache would answer the second
+            return 'comment', f"0:00 Bonobo - Kerala\n{url}\n4:12 Tycho - Awake\n9:30 Four Tet - Baby\n"
+        return 'description', "0:00 Bonobo - Kerala\n4:12 Tycho - Awake\n9:30 Four Tet - Baby\n"
+
+    monkeypatch.setattr(stage_module, 'fetch_tracklist_source', fetch_tracklist_source)
+    stage = TracklistStage(completion_fn=fake_completion)
+    stage.fetched = fetched
+    yield stage
+    stage.close()
+
+
+def test_each_url_is_looked_up_once(stage, fake_completion):
+    url = 'https://www.youtube.com/watch?v=aaa'
+    first, second = stage.submit(url), stage.submit(url)
+    assert first is second
+    tracklist = first.result(timeout=10)
+    assert (tracklist.parser, len(tracklist.tracks)) == ('heuristic', 3)
+    assert stage.fetched == [url]
+    assert fake_completion.calls == []
+
+
+def test_unconfident_parses_ask_the_llm_within_its_limits(stage, fake_completion):
+    futures = [stage.submit(f'https://www.youtube.com/watch?v={video}&noisy') for video in ('aaa', 'bbb')]
+    tracklists = [future.result(timeout=10) for future in futures]
+    assert [tracklist.parser for tracklist in tracklists] == ['llm', 'llm']
+    assert stage._llm.calls == len(fake_completion.calls) == 2
+    assert stage._fetch.calls == 2
@@ -0,0 +1,54 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('yt_dlp')
+
+from src.lib.ytdl_inprocess import run_download
+
+
+class AudioFiles(BaseHTTPRequestHandler):
+    """Serves /<name>.mp3 as a direct audio link; anything else is missing."""
+
+    def do_GET(self):
+        if not self.path.endswith('.mp3'):
+            self.send_error(404)
+            return
+        body = b'\xff\xfb' + bytes(4096)
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), AudioFiles)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def download(url, template):
+    return run_download(['--no-playlist', '-o', template, url], lambda *msgs: None, "YTDL")
+
+
+def test_reused_instance_follows_each_call(server, tmp_path):
+    # The thread's instance is reused across calls with a different output template each
+    assert download(f'{server}/first.mp3', str(tmp_path / 'a' / '%(title)s.%(ext)s'))[0] == 0
+    assert (tmp_path / 'a' / 'first.mp3').is_file()
+
+    return_code, _, stderr = download(f'{server}/missing', str(tmp_path / 'b' / '%(title)s.%(ext)s'))
+    assert return_code == 1
+    assert '404' in stderr
+
+    # An earlier failure doesn't fail the next call
+    assert download(f'{server}/second.mp3', str(tmp_path / 'c' / '%(title)s.%(ext)s'))[0] == 0
+    assert (tmp_path / 'c' / 'second.mp3').is_file()
+    assert not (tmp_path / 'a' / 'second.mp3').exists()